@@ -0,0 +1,345 @@
+"""對 main.py 的 /chat 做負載測試：依設定的意圖比例重播真實風格的請求，回報吞吐量與延遲百分位數。
+
+--spawn 會在本機啟動整套環境（不需要連到真正的 vLLM / OpenAI）：
+- 2 個 bench/mock_openai.py 當作 VLLM_BASE_URL / VLLM_BASE_URL_2（可對第一個注入失敗、卡住、垃圾輸出）
+- 1 個 mock 當作 OpenAI fallback（透過 OPENAI_BASE_URL）
+- main.py（uvicorn），搜尋使用暫存的本地知識庫，不連外網
+這樣一次跑完 DualClient failover、意圖分類與四個模組（翻譯、推薦、搜尋、對話）。
+
+預設為 closed-loop（--concurrency 個 worker 連續送出）；指定 --rate 時改為 open-loop
+（Poisson 到達，避免 coordinated omission 讓延遲看起來比實際好）。
+
+用法（在 backend/ 目錄下）：
+    python -m bench.load_test --spawn
+    python -m bench.load_test --spawn --primary-failure-rate 0.2 --primary-garbage-rate 0.05 --concurrency 32
+    python -m bench.load_test --spawn --rate 20 --duration 60 --mix translation=0.5,chat=0.3,search=0.1,recommendation=0.1
+    python -m bench.load_test --target http://127.0.0.1:8000 --duration 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.stats import percentile
+
+# 每種意圖的請求樣本；多輪對話讓歷史壓縮、分類器的上下文也被測到
+SAMPLES: Dict[str, List[List[Dict[str, str]]]] = {
+    "translation": [
+        [{"role": "user", "content": "tjaquvuquvulj"}],
+        [{"role": "user", "content": "ti sun a kemeljang"}],
+        [{"role": "user", "content": "幫我翻譯 ti amentu aicu"}],
+        [{"role": "user", "content": "kikai 是什麼意思"}],
+        [{"role": "user", "content": "masalu"}],
+        [
+            {"role": "user", "content": "你好"},
+            {"role": "assistant", "content": "你好！有什麼可以幫忙的嗎？"},
+            {"role": "user", "content": "nanguaq a qadav"},
+        ],
+    ],
+    "recommendation": [
+        [{"role": "user", "content": "給我一個例句"}],
+        [{"role": "user", "content": "推薦一句排灣語"}],
+        [{"role": "user", "content": "教我一句排灣語"}],
+    ],
+    "search": [
+        [{"role": "user", "content": "介紹一下五年祭"}],
+        [{"role": "user", "content": "排灣族有什麼活動"}],
+        [{"role": "user", "content": "排灣族的琉璃珠有什麼意義"}],
+    ],
+    "chat": [
+        [{"role": "user", "content": "你好"}],
+        [{"role": "user", "content": "你是誰？可以做什麼？"}],
+        [{"role": "user", "content": "我想學排灣語，該從哪裡開始？"}],
+        [
+            {"role": "user", "content": "tjaquvuquvulj"},
+            {"role": "assistant", "content": "百步蛇"},
+            {"role": "user", "content": "謝謝！那排灣族為什麼尊敬牠？"},
+        ],
+    ],
+}
+
+DEFAULT_MIX = "translation=0.4,chat=0.3,recommendation=0.15,search=0.15"
+
+# --spawn 時寫進暫存知識庫的文件（SEARCH_BACKEND=local）
+KB_DOCUMENTS = {
+    "maljeveq.md": "# 五年祭（maljeveq）\n五年祭是排灣族最重要的祭典之一，每五年舉行一次，以刺球儀式迎接祖靈回到部落。",
+    "activities.md": "# 排灣族部落活動\n排灣族的活動包含五年祭、收穫祭（小米收穫祭）、婚禮與部落運動會，多在屏東與台東舉行。",
+    "beads.md": "# 排灣族琉璃珠\n琉璃珠是排灣族重要的傳家寶，不同圖紋代表不同意義，例如太陽的眼淚、孔雀之珠象徵愛情。",
+}
+
+
+def _parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SAMPLES:
+            raise SystemExit(f"unknown intent in --mix: {name}（可用：{', '.join(SAMPLES)}）")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ========= --spawn：啟動 mock backends 與 main.py =========
+class Stack:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="paiwan-load-")
+        self.procs: List[subprocess.Popen] = []
+        self.mock_urls: Dict[str, str] = {}
+        self.target = ""
+
+    def _start(self, name: str, cmd: List[str], env: Optional[Dict[str, str]] = None):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.procs.append(subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env))
+
+    def _start_mock(self, name: str, failure_rate: float = 0.0, hang_rate: float = 0.0, garbage_rate: float = 0.0):
+        a = self.args
+        port = _free_port()
+        cmd = [
+            sys.executable, "-m", "bench.mock_openai", "--port", str(port),
+            "--latency-dist", a.latency_dist, "--jitter", str(a.jitter),
+            "--base-ms", str(a.base_ms), "--decode-ms", str(a.decode_ms),
+            "--failure-rate", str(failure_rate), "--hang-rate", str(hang_rate),
+            "--hang-seconds", str(a.hang_seconds), "--garbage-rate", str(garbage_rate),
+            "--seed", str(a.seed + len(self.procs)), "--prefix-cache",
+        ]
+        self._start(name, cmd)
+        self.mock_urls[name] = f"http://127.0.0.1:{port}"
+
+    async def start(self):
+        a = self.args
+        self._start_mock("vllm_1", a.primary_failure_rate, a.primary_hang_rate, a.primary_garbage_rate)
+        self._start_mock("vllm_2")
+        self._start_mock("openai")
+
+        kb_dir = os.path.join(self.workdir, "kb")
+        os.makedirs(kb_dir)
+        for filename, text in KB_DOCUMENTS.items():
+            with open(os.path.join(kb_dir, filename), "w", encoding="utf-8") as f:
+                f.write(text)
+
+        port = _free_port()
+        env = dict(os.environ)
+        env.update({
+            "VLLM_BASE_URL": self.mock_urls["vllm_1"] + "/v1/",
+            "VLLM_BASE_URL_2": self.mock_urls["vllm_2"] + "/v1/",
+            "OPENAI_API_KEY": "mock-key",
+            "OPENAI_BASE_URL": self.mock_urls["openai"] + "/v1/",
+            "SEARCH_BACKEND": "local",
+            "SEARCH_KB_DIR": kb_dir,
+            "SEARCH_CACHE_PATH": os.path.join(self.workdir, "search_cache.sqlite3"),
+            "NO_PROXY": "127.0.0.1,localhost",
+        })
+        self._start("main", [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env)
+        self.target = f"http://127.0.0.1:{port}"
+
+        urls = [u + "/v1/models" for u in self.mock_urls.values()] + [self.target + "/"]
+        async with httpx.AsyncClient(trust_env=False) as client:
+            for url in urls:
+                for _ in range(300):
+                    try:
+                        if (await client.get(url, timeout=1.0)).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    await asyncio.sleep(0.1)
+                else:
+                    raise RuntimeError(f"{url} 沒有啟動，請查看 {self.workdir} 下的 log")
+        print(f"Spawned mocks {self.mock_urls} and main.py at {self.target}（log：{self.workdir}）")
+
+    def stop(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# ========= 負載產生 =========
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+        self.misrouted: Counter = Counter()
+        self.degraded = 0
+
+    def add(self, expected: str, status: str, elapsed_ms: float, body: Optional[Dict[str, Any]]):
+        self.statuses[status] += 1
+        if status != "200":
+            return
+        self.latencies[expected].append(elapsed_ms)
+        if body.get("intent") != expected:
+            self.misrouted[f"{expected}->{body.get('intent')}"] += 1
+        if re.search(r"時間不足|暫時無法回應|無法取得模型", body.get("reply", "")):
+            self.degraded += 1
+
+
+async def _one(client: httpx.AsyncClient, target: str, expected: str, messages, recorder: Recorder, timeout: float):
+    start = time.perf_counter()
+    try:
+        resp = await client.post(target + "/chat", json={"messages": messages, "model_mode": "default"}, timeout=timeout)
+        status = str(resp.status_code)
+        body = resp.json() if resp.status_code == 200 else None
+    except httpx.HTTPError as e:
+        status, body = type(e).__name__, None
+    recorder.add(expected, status, (time.perf_counter() - start) * 1000, body)
+
+
+async def run_load(args, target: str) -> Tuple[Recorder, float]:
+    rng = random.Random(args.seed)
+    mix = _parse_mix(args.mix)
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+
+    def pick() -> Tuple[str, List[Dict[str, str]]]:
+        intent = rng.choices(names, weights)[0]
+        return intent, rng.choice(SAMPLES[intent])
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(limits=limits, trust_env=False) as client:
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        sent = 0
+
+        def more() -> bool:
+            return time.perf_counter() < stop_at and (not args.requests or sent < args.requests)
+
+        if args.rate:
+            # open-loop：依 Poisson 過程送出，不等前一個請求完成
+            tasks = set()
+            while more():
+                intent, messages = pick()
+                sent += 1
+                task = asyncio.create_task(_one(client, target, intent, messages, recorder, args.timeout))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await asyncio.sleep(rng.expovariate(args.rate))
+            if tasks:
+                await asyncio.gather(*tasks)
+        else:
+            async def worker():
+                nonlocal sent
+                while more():
+                    intent, messages = pick()
+                    sent += 1
+                    await _one(client, target, intent, messages, recorder, args.timeout)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return recorder, elapsed
+
+
+async def _fetch_json(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        async with httpx.AsyncClient(trust_env=False) as client:
+            resp = await client.get(url, timeout=5.0)
+            return resp.json()
+    except Exception:
+        return None
+
+
+def report(recorder: Recorder, elapsed: float):
+    total = sum(recorder.statuses.values())
+    ok = recorder.statuses.get("200", 0)
+    print(f"\nRequests: {total} in {elapsed:.1f}s → {total / elapsed:.1f} req/s（成功 {ok / elapsed:.1f} req/s）")
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(recorder.statuses.items())))
+    print(f"{'intent':<15} {'n':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'mean ms':>9}")
+    everything: List[float] = []
+    for intent, values in sorted(recorder.latencies.items()):
+        everything.extend(values)
+        print(
+            f"{intent:<15} {len(values):>6} {percentile(values, 50):>9.1f} {percentile(values, 90):>9.1f} "
+            f"{percentile(values, 99):>9.1f} {max(values):>9.1f} {statistics.mean(values):>9.1f}"
+        )
+    if everything:
+        print(
+            f"{'all':<15} {len(everything):>6} {percentile(everything, 50):>9.1f} {percentile(everything, 90):>9.1f} "
+            f"{percentile(everything, 99):>9.1f} {max(everything):>9.1f} {statistics.mean(everything):>9.1f}"
+        )
+    if recorder.misrouted:
+        print("Misrouted: " + ", ".join(f"{k}={v}" for k, v in recorder.misrouted.most_common()))
+    if recorder.degraded:
+        print(f"Degraded replies: {recorder.degraded}")
+
+
+async def run(args):
+    stack = Stack(args) if args.spawn else None
+    try:
+        if stack is not None:
+            await stack.start()
+            target = stack.target
+        else:
+            target = args.target.rstrip("/")
+
+        if args.warmup:
+            await run_load(argparse.Namespace(**{**vars(args), "duration": 1e9, "requests": args.warmup, "rate": 0}), target)
+        recorder, elapsed = await run_load(args, target)
+        report(recorder, elapsed)
+
+        try:
+            async with httpx.AsyncClient(trust_env=False) as client:
+                exposition = (await client.get(target + "/metrics", timeout=5.0)).text
+            failovers = [line for line in exposition.splitlines() if line.startswith("paiwan_llm_failover_total{")]
+            if failovers:
+                print("Failovers:\n  " + "\n  ".join(failovers))
+        except httpx.HTTPError:
+            pass
+
+        stats = await _fetch_json(target + "/stats")
+        if stats:
+            print(f"Scheduler: {stats.get('scheduler')}")
+            print(f"Classifier: {stats.get('classifier')}")
+        if stack is not None:
+            for name, url in stack.mock_urls.items():
+                print(f"Mock {name}: {await _fetch_json(url + '/stats')}")
+    finally:
+        if stack is not None:
+            stack.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="已啟動的 main.py（未指定 --spawn 時使用）")
+    parser.add_argument("--spawn", action="store_true", help="在本機啟動 mock backends 與 main.py")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="各意圖的比例")
+    parser.add_argument("--concurrency", type=int, default=16, help="closed-loop 的 worker 數")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop：每秒平均送出幾個請求")
+    parser.add_argument("--duration", type=float, default=20.0, help="秒")
+    parser.add_argument("--requests", type=int, default=0, help="最多送出幾個請求（0 = 只看 --duration）")
+    parser.add_argument("--warmup", type=int, default=8, help="正式計時前先送出的請求數（載入字典、建立連線）")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    # 以下只在 --spawn 時使用
+    parser.add_argument("--latency-dist", choices=("normal", "lognormal", "exponential"), default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--base-ms", type=float, default=40.0)
+    parser.add_argument("--decode-ms", type=float, default=12.0)
+    parser.add_argument("--primary-failure-rate", type=float, default=0.0)
+    parser.add_argument("--primary-hang-rate", type=float, default=0.0)
+    parser.add_argument("--primary-garbage-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
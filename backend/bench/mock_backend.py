@@ -0,0 +1,214 @@
+"""本地 mock LLM backend（in-process），介面與 AsyncOpenAI 相同：
+
+    client.chat.completions.create(...)
+    client.models.list()
+
+依 system prompt 判斷是哪個模組在呼叫，回傳格式正確的假回覆；
+延遲以「固定開銷 + prompt token × prefill 時間 + 輸出 token × decode 時間」模擬。
+prefix_cache=True 時模擬 vLLM automatic prefix caching：以 16 token 為一個 block，
+前綴 block 曾經算過就不再計入 prefill。支援 stream=True（第一個 chunk 在 prefill 完成後送出）。
+jitter_dist 可選 normal / lognormal（長尾）/ exponential（更重的長尾）；garbage_rate 以此機率
+回傳一串驚嘆號，模擬 vLLM 偶爾輸出的垃圾內容。
+用於 bench/ 下的比較腳本，不需要連到真正的 vLLM；bench/mock_openai.py 把它包成 HTTP 服務。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.history import count_tokens
+
+INTENTS = ("translation", "recommendation", "chat", "search")
+
+PREFIX_BLOCK_TOKENS = 16
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]|[A-Za-z0-9']{1,4}|\S")
+
+
+def tokenize(messages: List[Dict[str, str]]) -> List[str]:
+    """粗略模擬 chat template + tokenizer，只用來計算 prefix 是否相同。"""
+    tokens: List[str] = []
+    for msg in messages:
+        tokens.append(f"<|{msg.get('role')}|>")
+        tokens.extend(_TOKEN_RE.findall(str(msg.get("content", ""))))
+        tokens.append("<|end|>")
+    return tokens
+
+
+class MockLLM:
+    def __init__(
+        self,
+        intent_oracle: Optional[Callable[[str], str]] = None,
+        intent_error_rate: float = 0.0,
+        base_ms: float = 40.0,
+        prefill_ms_per_token: float = 0.15,
+        decode_ms_per_token: float = 12.0,
+        jitter: float = 0.1,
+        seed: int = 0,
+        model_id: str = "mock-model",
+        prefix_cache: bool = False,
+        prefix_cache_blocks: int = 4096,
+        jitter_dist: str = "normal",
+        garbage_rate: float = 0.0,
+    ):
+        # intent_oracle：給定最新 user 訊息，回傳「正確」的 intent；
+        # intent_error_rate：以此機率故意回傳錯誤的 intent，模擬模型失誤
+        self.intent_oracle = intent_oracle or (lambda text: "chat")
+        self.intent_error_rate = intent_error_rate
+        self.base_ms = base_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.jitter = jitter
+        self.jitter_dist = jitter_dist
+        self.garbage_rate = garbage_rate
+        self.model_id = model_id
+        self._rng = random.Random(seed)
+        self.prefix_cache = prefix_cache
+        self.prefix_cache_blocks = prefix_cache_blocks
+        self._blocks: "OrderedDict[str, None]" = OrderedDict()
+
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.garbage = 0
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=self._list_models)
+
+    async def _list_models(self, **kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(id=self.model_id)])
+
+    # ---------- 回覆內容 ----------
+    def _pick_intent(self, text: str) -> str:
+        intent = self.intent_oracle(text)
+        if self.intent_error_rate and self._rng.random() < self.intent_error_rate:
+            intent = self._rng.choice([i for i in INTENTS if i != intent])
+        return intent
+
+    def synthesize(self, messages: List[Dict[str, str]]) -> str:
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        latest = ""
+        for msg in reversed(messages):
+            if msg["role"] == "user":
+                latest = str(msg["content"])
+                break
+
+        if "intent classifier" in system:
+            intent = self._pick_intent(latest)
+            if "also answer the user" in system and intent == "chat":
+                return json.dumps(
+                    {"intent": "chat", "reply": f"（模擬回覆）{latest[:30]}", "thinking": "mock fused answer"},
+                    ensure_ascii=False,
+                )
+            return json.dumps({"intent": intent})
+        if "語言辨識專家" in system:
+            runs = re.findall(r"[A-Za-z][A-Za-z'\- ]*", latest)
+            return runs[0].strip() if runs else latest
+        if "濃縮成一段簡短" in system:
+            return "（模擬摘要）使用者與助理討論了排灣語詞彙。"
+        if "single web page" in system:
+            return "- （模擬單頁重點）"
+        if "professional researcher" in system:
+            return "1. （模擬重點一）\n2. （模擬重點二）\n3. （模擬重點三）"
+        return json.dumps({"reply": f"（模擬回覆）{latest[:30]}", "thinking": "mock answer"}, ensure_ascii=False)
+
+    # ---------- prefix cache 模擬 ----------
+    def _prefill(self, messages: List[Dict[str, str]]) -> Tuple[int, int]:
+        """回傳 (prompt token 數, 命中 prefix cache 的 token 數)。"""
+        tokens = tokenize(messages)
+        if not self.prefix_cache:
+            return len(tokens), 0
+
+        cached = 0
+        missed = False
+        h = ""
+        for start in range(0, len(tokens) - PREFIX_BLOCK_TOKENS + 1, PREFIX_BLOCK_TOKENS):
+            block = "\x00".join(tokens[start:start + PREFIX_BLOCK_TOKENS])
+            h = hashlib.sha1(f"{h}\x01{block}".encode("utf-8")).hexdigest()
+            if not missed and h in self._blocks:
+                cached += PREFIX_BLOCK_TOKENS
+                self._blocks.move_to_end(h)
+            else:
+                missed = True
+                self._blocks[h] = None
+        while len(self._blocks) > self.prefix_cache_blocks:
+            self._blocks.popitem(last=False)
+        return len(tokens), cached
+
+    # ---------- 延遲模擬 ----------
+    def _jitter(self, ms: float) -> float:
+        if self.jitter:
+            if self.jitter_dist == "lognormal":
+                # 平均值維持 1.0，sigma = jitter
+                ms *= self._rng.lognormvariate(-self.jitter ** 2 / 2, self.jitter)
+            elif self.jitter_dist == "exponential":
+                ms *= 1.0 + self._rng.expovariate(1.0 / self.jitter)
+            else:
+                ms *= max(0.1, self._rng.gauss(1.0, self.jitter))
+        return ms / 1000.0
+
+    def _prefill_latency(self, uncached_tokens: int) -> float:
+        return self._jitter(self.base_ms + uncached_tokens * self.prefill_ms_per_token)
+
+    def _decode_latency(self, output_tokens: int) -> float:
+        return self._jitter(output_tokens * self.decode_ms_per_token)
+
+    def _usage(self, prompt_tokens: int, cached_tokens: int, output_tokens: int):
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=output_tokens,
+            total_tokens=prompt_tokens + output_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+
+    async def _create(self, model: str = "", messages: Optional[List[Dict[str, str]]] = None, max_tokens: int = 1024, stream: bool = False, **kwargs):
+        messages = messages or []
+        content = self.synthesize(messages)
+        if self.garbage_rate and self._rng.random() < self.garbage_rate:
+            content = "!" * 32
+            self.garbage += 1
+        prompt_tokens, cached_tokens = self._prefill(messages)
+        output_tokens = min(max_tokens, max(1, count_tokens(content)))
+
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += output_tokens
+
+        if stream:
+            return self._stream(model, content, prompt_tokens, cached_tokens, output_tokens, kwargs.get("stream_options"))
+
+        await asyncio.sleep(self._prefill_latency(prompt_tokens - cached_tokens) + self._decode_latency(output_tokens))
+        return SimpleNamespace(
+            id=f"mock-{self.calls}",
+            model=model or self.model_id,
+            created=int(time.time()),
+            choices=[SimpleNamespace(index=0, finish_reason="stop", message=SimpleNamespace(role="assistant", content=content))],
+            usage=self._usage(prompt_tokens, cached_tokens, output_tokens),
+        )
+
+    async def _stream(self, model: str, content: str, prompt_tokens: int, cached_tokens: int, output_tokens: int, stream_options):
+        await asyncio.sleep(self._prefill_latency(prompt_tokens - cached_tokens))
+        pieces = _TOKEN_RE.findall(content) or [content]
+        per_piece = self._decode_latency(output_tokens) / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(per_piece)
+            yield SimpleNamespace(
+                id=f"mock-{self.calls}",
+                model=model or self.model_id,
+                choices=[SimpleNamespace(index=0, finish_reason=None, delta=SimpleNamespace(role="assistant", content=piece))],
+                usage=None,
+            )
+        if stream_options and stream_options.get("include_usage"):
+            yield SimpleNamespace(
+                id=f"mock-{self.calls}",
+                model=model or self.model_id,
+                choices=[],
+                usage=self._usage(prompt_tokens, cached_tokens, output_tokens),
+            )
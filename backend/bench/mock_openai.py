@@ -0,0 +1,158 @@
+"""OpenAI 相容的 mock HTTP 伺服器（/v1/models、/v1/chat/completions），用來在本機壓測 main.py。
+
+回覆內容與延遲模型沿用 bench/mock_backend.py 的 MockLLM（依 system prompt 判斷是哪個模組在呼叫），
+另外可以注入：
+- --failure-rate：回 HTTP 500（openai SDK 預設會重試 2 次，之後 DualClient 才換下一個 backend）
+- --hang-rate / --hang-seconds：先卡住再回覆，觸發呼叫端的 timeout
+- --garbage-rate：回傳一串驚嘆號，觸發 DualClient 的垃圾輸出檢查
+- --latency-dist：normal / lognormal / exponential，搭配 --jitter 調整長尾
+支援 stream=True（SSE，含 stream_options.include_usage）。GET /stats 回傳各種注入的次數。
+
+用法（在 backend/ 目錄下）：
+    python -m bench.mock_openai --port 9001
+    python -m bench.mock_openai --port 9002 --failure-rate 0.1 --garbage-rate 0.05 --latency-dist lognormal --jitter 0.5
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from bench.mock_backend import MockLLM
+
+_PAIWAN_RE = re.compile(r"[A-Za-z][A-Za-z'\-]+(?:\s+[A-Za-z][A-Za-z'\-]+)*")
+_KEYWORDS = (
+    ("translation", ("排灣語怎麼說", "翻成排灣語", "翻譯成排灣語", "用排灣語")),
+    ("recommendation", ("例句", "推薦", "教我", "句子")),
+    ("search", ("介紹", "活動", "天氣", "新聞", "統計", "最近", "祭", "意義")),
+)
+
+
+def default_intent_oracle(text: str) -> str:
+    """依關鍵字粗略決定「正確」的 intent，讓分類器的 LLM 路徑得到合理的答案。"""
+    for intent, words in _KEYWORDS:
+        if any(w in text for w in words):
+            return intent
+    if _PAIWAN_RE.search(text) and not re.search(r"[\u4e00-\u9fff]{6,}", text):
+        return "translation"
+    return "chat"
+
+
+def _to_dict(obj: Any) -> Any:
+    if isinstance(obj, SimpleNamespace):
+        return {k: _to_dict(v) for k, v in vars(obj).items()}
+    if isinstance(obj, list):
+        return [_to_dict(v) for v in obj]
+    return obj
+
+
+def build_app(
+    llm: MockLLM,
+    failure_rate: float = 0.0,
+    hang_rate: float = 0.0,
+    hang_seconds: float = 60.0,
+    seed: int = 0,
+) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI-compatible backend")
+    rng = random.Random(seed)
+    stats = {"requests": 0, "streams": 0, "failures": 0, "hangs": 0}
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {
+            "object": "list",
+            "data": [{"id": llm.model_id, "object": "model", "created": int(time.time()), "owned_by": "mock"}],
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            **stats,
+            "garbage": llm.garbage,
+            "prompt_tokens": llm.prompt_tokens,
+            "cached_tokens": llm.cached_tokens,
+            "completion_tokens": llm.completion_tokens,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body: Dict[str, Any] = await request.json()
+        stats["requests"] += 1
+        if failure_rate and rng.random() < failure_rate:
+            stats["failures"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "mock injected failure", "type": "server_error", "code": None}},
+            )
+        if hang_rate and rng.random() < hang_rate:
+            stats["hangs"] += 1
+            await asyncio.sleep(hang_seconds)
+
+        result = await llm.chat.completions.create(**body)
+        if not body.get("stream"):
+            response = _to_dict(result)
+            response["object"] = "chat.completion"
+            return response
+
+        stats["streams"] += 1
+
+        async def events():
+            async for chunk in result:
+                data = _to_dict(chunk)
+                data["object"] = "chat.completion.chunk"
+                data["created"] = int(time.time())
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--model-id", default="mock-model")
+    parser.add_argument("--base-ms", type=float, default=40.0)
+    parser.add_argument("--prefill-ms", type=float, default=0.15, help="每個 prompt token 的 prefill 時間")
+    parser.add_argument("--decode-ms", type=float, default=12.0, help="每個輸出 token 的 decode 時間")
+    parser.add_argument("--latency-dist", choices=("normal", "lognormal", "exponential"), default="normal")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--prefix-cache", action="store_true")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--garbage-rate", type=float, default=0.0)
+    parser.add_argument("--intent-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm = MockLLM(
+        intent_oracle=default_intent_oracle,
+        intent_error_rate=args.intent_error_rate,
+        base_ms=args.base_ms,
+        prefill_ms_per_token=args.prefill_ms,
+        decode_ms_per_token=args.decode_ms,
+        jitter=args.jitter,
+        seed=args.seed,
+        model_id=args.model_id,
+        prefix_cache=args.prefix_cache,
+        jitter_dist=args.latency_dist,
+        garbage_rate=args.garbage_rate,
+    )
+    app = build_app(llm, args.failure_rate, args.hang_rate, args.hang_seconds, args.seed)
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
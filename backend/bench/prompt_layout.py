@@ -0,0 +1,118 @@
+"""比較翻譯 prompt 的兩種排法對 prefix cache 的影響。
+
+- legacy：詞彙對照插在 system prompt 中間，每次請求的前綴都不同
+- prefix：靜態 system prompt 在前，詞彙對照與原文放在 user 訊息（目前預設）
+
+預設使用 bench/mock_backend.py 的 mock（開啟 prefix cache 模擬、streaming），
+回報平均 prompt token、命中快取的 token、實際 prefill 的 token，以及首字延遲（TTFT）p50 / p95。
+以 --base-url 指向 vLLM（需啟動 --enable-prefix-caching）時，快取 token 數取自
+usage.prompt_tokens_details.cached_tokens（伺服器沒有回報時顯示 0）。
+
+用法（在 backend/ 目錄下）：
+    python -m bench.prompt_layout
+    python -m bench.prompt_layout --repeat 5
+    python -m bench.prompt_layout --base-url http://host:port/v1/ --model <model-id>
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+from bench.stats import percentile
+from modules import translator
+
+# (排灣語原文, [(詞, 中文)])：詞彙對照以 translator.format_mapping_text 的格式產生
+SAMPLE_INPUTS: List[Tuple[str, List[Tuple[str, str]]]] = [
+    ("ti sun a kemeljang", [("ti", "（人名標記）"), ("sun", "你"), ("a", "[虛]"), ("kemeljang", "知道")]),
+    ("tjaquvuquvulj", [("tjaquvuquvulj", "百步蛇")]),
+    ("nanguaq a qadav", [("nanguaq", "好"), ("a", "[虛]"), ("qadav", "太陽；日子")]),
+    ("masalu", [("masalu", "謝謝")]),
+    ("kikai a vavayan", [("kikai", "女孩"), ("a", "[虛]"), ("vavayan", "女性")]),
+    ("ti amen tu aicu", [("ti", "（人名標記）"), ("amen", "我們"), ("tu", "的"), ("aicu", "這個")]),
+    ("uri semainu sun", [("uri", "將要"), ("semainu", "去哪裡"), ("sun", "你")]),
+    ("tima su ngadan", [("tima", "誰"), ("su", "你的"), ("ngadan", "名字")]),
+]
+
+
+def _formatted(mapping: List[Tuple[str, str]]) -> str:
+    return translator.format_mapping_text([{"token": w, "translation": zh} for w, zh in mapping])
+
+
+async def _measure(client: Any, model: str, messages: List[Dict[str, str]]) -> Tuple[float, int, int]:
+    """回傳 (TTFT 秒數, prompt tokens, cached tokens)。"""
+    start = time.perf_counter()
+    ttft = None
+    usage = None
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=256,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    async for chunk in stream:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - start
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+    if ttft is None:
+        ttft = time.perf_counter() - start
+
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return ttft, prompt_tokens, cached_tokens
+
+
+async def run(args):
+    print(f"Translator prompt {translator.TRANSLATOR_PROMPT_VERSION}: {len(SAMPLE_INPUTS)} inputs x {args.repeat} repeats, "
+          f"backend={'mock' if not args.base_url else args.base_url}")
+    print(f"{'layout':<8} {'prompt':>8} {'cached':>8} {'prefill':>8} {'hit %':>7} {'TTFT p50':>9} {'TTFT p95':>9}")
+
+    for layout in ("legacy", "prefix"):
+        # 每種排法各用一個乾淨的後端快取，避免互相影響
+        if args.base_url:
+            from modules import http_pool
+
+            client = http_pool.get_openai_client(args.base_url, args.api_key)
+            model = args.model or (await client.models.list()).data[0].id
+        else:
+            from bench.mock_backend import MockLLM
+
+            client = MockLLM(seed=args.seed, prefix_cache=True)
+            model = "mock-model"
+
+        ttfts: List[float] = []
+        prompt_total = 0
+        cached_total = 0
+        for _ in range(args.repeat):
+            for text, mapping in SAMPLE_INPUTS:
+                messages = translator.build_translation_messages(text, _formatted(mapping), layout=layout)
+                ttft, prompt_tokens, cached_tokens = await _measure(client, model, messages)
+                ttfts.append(ttft * 1000)
+                prompt_total += prompt_tokens
+                cached_total += cached_tokens
+
+        n = len(ttfts)
+        hit = cached_total / prompt_total if prompt_total else 0.0
+        print(
+            f"{layout:<8} {prompt_total / n:>8.1f} {cached_total / n:>8.1f} {(prompt_total - cached_total) / n:>8.1f} "
+            f"{hit:>7.1%} {percentile(ttfts, 50):>9.1f} {percentile(ttfts, 95):>9.1f}"
+        )
+        if args.base_url and not cached_total:
+            print("  (server did not report cached_tokens; check that prefix caching is enabled)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--base-url", default=None, help="OpenAI 相容服務的 base_url；不指定則使用本地 mock")
+    parser.add_argument("--api-key", default="dummy-key")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""比較 two-stage router（分類 → 模組）與 fused router（一次呼叫分類並回答）的延遲與準確度。
+
+預設使用 bench/mock_backend.py 的本地 mock（mock 依標註回傳 intent，可用 --mock-error-rate
+模擬分類錯誤），此時準確度反映的是解析與路由流程；要比較真實模型的分類準確度，
+請以 --base-url 指向 vLLM / OpenAI 相容服務。
+
+用法（在 backend/ 目錄下）：
+    python -m bench.router_compare
+    python -m bench.router_compare --repeat 5 --mock-error-rate 0.05
+    python -m bench.router_compare --base-url http://host:port/v1/ --model <model-id>
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from bench.stats import percentile
+from modules import chat, classifier
+
+# (最新 user 訊息, 正確 intent)
+LABELLED_CASES: List[Tuple[str, str]] = [
+    ("你好", "chat"),
+    ("早安！今天心情不錯", "chat"),
+    ("你是誰？可以做什麼？", "chat"),
+    ("排灣族的名字有什麼特別的規則嗎？", "chat"),
+    ("謝謝用排灣語怎麼說", "translation"),
+    ("我想學排灣語，該從哪裡開始？", "chat"),
+    ("tjaquvuquvulj", "translation"),
+    ("nanguaq", "translation"),
+    ("ti sun a kemeljang", "translation"),
+    ("幫我翻譯 ti amentu aicu", "translation"),
+    ("kikai 是什麼意思", "translation"),
+    ("給我一個例句", "recommendation"),
+    ("推薦一句排灣語", "recommendation"),
+    ("教我一句排灣語", "recommendation"),
+    ("隨機給我一個句子", "recommendation"),
+    ("介紹一下五年祭", "search"),
+    ("排灣族有什麼活動", "search"),
+    ("今天屏東的天氣如何", "search"),
+    ("最近有什麼原住民族的新聞", "search"),
+    ("2024 年原住民族人口統計", "search"),
+]
+
+
+async def _two_stage(client: Any, model: str, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+    calls = 1
+    intent = await classifier._llm_classify(client, model, messages)
+    if intent == "chat":
+        await chat.process(client, model, messages)
+        calls += 1
+    return intent, calls
+
+
+async def _fused(client: Any, model: str, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+    calls = 1
+    result = await classifier.classify_and_answer(client, model, messages)
+    if result["intent"] == "chat" and not result.get("reply"):
+        await chat.process(client, model, messages)
+        calls += 1
+    return result["intent"], calls
+
+
+async def run(args):
+    # 兩種 router 都只比較 LLM 路徑，關掉規則式快速分類
+    classifier.FAST_INTENT_ENABLED = args.with_fast_path
+
+    if args.base_url:
+        from modules import http_pool
+
+        client = http_pool.get_openai_client(args.base_url, args.api_key)
+        model = args.model or (await client.models.list()).data[0].id
+    else:
+        from bench.mock_backend import MockLLM
+
+        labels = dict(LABELLED_CASES)
+        client = MockLLM(
+            intent_oracle=lambda text: labels.get(text, "chat"),
+            intent_error_rate=args.mock_error_rate,
+            seed=args.seed,
+        )
+        model = "mock-model"
+
+    routers = {"two_stage": _two_stage, "fused": _fused}
+    print(f"Router comparison: {len(LABELLED_CASES)} cases x {args.repeat} repeats, backend={'mock' if not args.base_url else args.base_url}")
+    print(f"{'router':<10} {'accuracy':>9} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'calls/req':>10}")
+
+    for name, router in routers.items():
+        latencies: List[float] = []
+        correct = 0
+        total_calls = 0
+        for _ in range(args.repeat):
+            for text, expected in LABELLED_CASES:
+                messages = [{"role": "user", "content": text}]
+                start = time.perf_counter()
+                intent, calls = await router(client, model, messages)
+                latencies.append((time.perf_counter() - start) * 1000)
+                correct += int(intent == expected)
+                total_calls += calls
+        n = len(latencies)
+        print(
+            f"{name:<10} {correct / n:>9.1%} {percentile(latencies, 50):>9.1f} "
+            f"{percentile(latencies, 95):>9.1f} {statistics.mean(latencies):>9.1f} {total_calls / n:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--base-url", default=None, help="OpenAI 相容服務的 base_url；不指定則使用本地 mock")
+    parser.add_argument("--api-key", default="dummy-key")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-fast-path", action="store_true", help="保留規則式快速分類")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""量測匯入 main.py（或其他模組）的時間，並依 `python -X importtime` 列出最花時間的模組。
+
+每次都在新的 Python process 中匯入，避免被已載入的模組影響；重複 --repeat 次取中位數。
+--forbid 列出不應在啟動時載入的重量級套件（預設 pandas、ddgs、bs4、requests），
+若被載入就以非 0 結束，可以放在 CI 中防止之後又被改回 eager import。
+
+用法（在 backend/ 目錄下）：
+    python -m bench.startup_time
+    python -m bench.startup_time --repeat 5 --top 30
+    python -m bench.startup_time --module modules.translator --forbid pandas
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+DEFAULT_FORBID = "pandas,ddgs,bs4,requests"
+# 專案自己的模組，另外列出來方便追蹤
+_OWN_PREFIXES = ("main", "modules", "paiwan_", "translation")
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str, forbid: List[str]) -> Tuple[float, Dict[str, Tuple[int, int, int]], List[str]]:
+    """回傳 (總匯入秒數, {模組: (self µs, cumulative µs, 巢狀深度)}, 被載入的禁止套件)。"""
+    probe = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        f"import {module}\n"
+        "print('@@', time.perf_counter() - t)\n"
+        f"print('@@', ','.join(m for m in {forbid!r} if m in sys.modules))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    timings: Dict[str, Tuple[int, int, int]] = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            timings[m.group(4)] = (int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2)
+    # 被匯入的模組本身也可能 print（例如缺少 API key 的警告），只取帶 @@ 標記的兩行
+    out = [line[3:] for line in proc.stdout.splitlines() if line.startswith("@@ ")]
+    loaded = [m for m in out[1].split(",") if m]
+    return float(out[0]), timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="列出 cumulative 時間最長的幾個頂層套件")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="逗號分隔；啟動時不應載入的套件")
+    args = parser.parse_args()
+    forbid = [m.strip() for m in args.forbid.split(",") if m.strip()]
+
+    totals: List[float] = []
+    cumulative: Dict[str, List[int]] = defaultdict(list)
+    self_time: Dict[str, List[int]] = defaultdict(list)
+    loaded: List[str] = []
+    for _ in range(args.repeat):
+        total, timings, loaded = measure(args.module, forbid)
+        totals.append(total)
+        for name, (own, cum, depth) in timings.items():
+            # 頂層套件（名稱不含 "."，第一次被匯入處）看 cumulative；專案模組看自身時間
+            if "." not in name and name != args.module and depth > 0:
+                cumulative[name].append(cum)
+            if name.startswith(_OWN_PREFIXES):
+                self_time[name].append(own)
+
+    print(f"import {args.module}: median {statistics.median(totals) * 1000:.0f} ms over {args.repeat} runs "
+          f"(min {min(totals) * 1000:.0f} ms)")
+
+    print(f"\nTop {args.top} top-level imports by cumulative time:")
+    print(f"{'module':<45} {'ms':>8}")
+    ranked = sorted(cumulative.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+    for name, values in ranked[:args.top]:
+        print(f"{name:<45} {statistics.median(values) / 1000:>8.1f}")
+
+    print("\nProject modules (self time):")
+    for name, values in sorted(self_time.items(), key=lambda kv: statistics.median(kv[1]), reverse=True):
+        print(f"{name:<45} {statistics.median(values) / 1000:>8.1f}")
+
+    if loaded:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        sys.exit(1)
+    print(f"\nOK: none of {', '.join(forbid)} imported at startup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""bench/ 下各比較腳本共用的統計小工具。"""
+from typing import List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩（nearest-rank）百分位數；values 為空時回傳 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
@@ -1,7 +1,10 @@
+import asyncio
 import json
-from typing import Optional, List
-from fastapi import FastAPI
+from typing import Optional, List, Dict, Any
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from openai import AsyncOpenAI
 import os
@@ -14,12 +17,33 @@ load_dotenv()
 from modules import classifier, chat, translator, recommender
 from modules import search_test
 from modules.dual_client import DualClient
+from modules import http_pool
+from modules import scheduler
+from modules.scheduler import AdmissionRejected
+from modules import singleflight
+from modules import structured
+from modules import search_cache
+from modules import deadline
+from modules import metrics
+from modules import jobs
+from modules import sessions
 
 # ========= vLLM 設定 =========
 VLLM_BASE_URL = os.getenv("VLLM_BASE_URL", "http://210.61.209.139:45014/v1/")
 VLLM_BASE_URL_2 = os.getenv("VLLM_BASE_URL_2", "http://210.61.209.139:45005/v1/")
 VLLM_API_KEY = os.getenv("VLLM_API_KEY", "dummy-key")
 
+# 規則式分類無法判斷、需要 LLM 分類時，先在背景做各模組的本地前置工作（查字典、挑例句）
+SPECULATIVE_PREWORK = os.getenv("SPECULATIVE_PREWORK", "1").lower() in ("1", "true", "yes")
+
+# Router 模式："two_stage"（先分類、再交給模組，預設）
+#             "fused"（一次呼叫同時分類並回答 chat，需要工具的意圖仍交給模組）
+ROUTER_MODE = os.getenv("ROUTER_MODE", "two_stage").lower()
+
+# 批次翻譯：單次最多幾段文字、同時最多幾個 LLM 請求
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
 # Initialize DualClient instead of standard AsyncOpenAI
 # 預設：同時啟用 vLLM + OpenAI（必要時自動切換）
 client_default = DualClient(
@@ -31,8 +55,8 @@ client_default = DualClient(
 client_vllm_only = DualClient(
     vllm_base_urls=[VLLM_BASE_URL, VLLM_BASE_URL_2],
     vllm_api_key=VLLM_API_KEY,
+    use_openai=False,
 )
-client_vllm_only.openai_client = None
 
 # 僅使用自己的 OpenAI API，不呼叫 vLLM
 client_openai_only = DualClient(
@@ -54,7 +78,12 @@ class Message(BaseModel):
     content: str
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    # 無狀態模式：每次送出完整歷史
+    # session 模式：只送 message（+ 上一輪回傳的 session_id），歷史留在伺服器；
+    #   第一輪不帶 session_id，可以用 messages 帶入既有歷史（例如 session 過期後重建）
+    messages: List[Message] = []
+    message: Optional[str] = None
+    session_id: Optional[str] = None
     # model_mode: "default"（預設：先 vLLM、失敗再 OpenAI）
     #             "vllm_only"（只用主辦 vLLM）
     #             "openai_only"（只用自己的 OPENAI_API_KEY）
@@ -65,11 +94,12 @@ class ChatResponse(BaseModel):
     model: str
     thinking: Optional[str] = None
     intent: Optional[str] = None # Added intent to response for debugging/UI
+    session_id: Optional[str] = None
 
 
 class SimpleTranslateRequest(BaseModel):
     text: str
-    # 目前僅實作排灣語 -> 中文，如需雙向可再擴充
+    # "paiwan2zh"（排灣語 -> 中文）| "zh2paiwan"（中文 -> 排灣語）
     direction: Optional[str] = "paiwan2zh"
     # 與 ChatRequest 相同："default" | "vllm_only" | "openai_only"
     model_mode: Optional[str] = "default"
@@ -79,39 +109,149 @@ class SimpleTranslateResponse(BaseModel):
     translation: str
     thinking: Optional[str] = None
 
+
+class BatchTranslateRequest(BaseModel):
+    texts: List[str]
+    direction: Optional[str] = "paiwan2zh"
+    model_mode: Optional[str] = "default"
+
+
+class BatchTranslateItem(BaseModel):
+    text: str
+    translation: str
+    thinking: Optional[str] = None
+
+
+class BatchTranslateResponse(BaseModel):
+    # 與 texts 一一對應、順序相同
+    results: List[BatchTranslateItem]
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """LLM backend 佇列已滿或等待逾時：快速回 429/503，並附上 Retry-After。"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"LLM backend busy ({exc.reason})，請稍後再試。"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(sessions.SessionNotFound)
+async def session_not_found_handler(request: Request, exc: sessions.SessionNotFound):
+    """session 不存在或已過期：回 410，用戶端改以 messages 帶入完整歷史重新建立。"""
+    return JSONResponse(status_code=410, content={"detail": "對話 session 已過期，請重新送出完整歷史。", "session_id": exc.session_id})
+
+@app.exception_handler(deadline.DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: deadline.DeadlineExceeded):
+    """請求的時間預算用完（各模組已無法降級處理）：回 504。"""
+    return JSONResponse(status_code=504, content={"detail": f"請求逾時（{exc}），請稍後再試。"})
+
+
+# 套用請求時間預算的路徑；批次翻譯本來就是長時間工作，不套用
+DEADLINE_PATHS = ("/chat", "/api/translate_simple")
+
+
+def _status_outcome(status_code: int) -> str:
+    if status_code < 400:
+        return "ok"
+    if status_code in (429, 503):
+        return "rejected"
+    if status_code == 504:
+        return "deadline"
+    return "error" if status_code >= 500 else "client_error"
+
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """每個請求一個截止時間（X-Request-Timeout header 或 REQUEST_DEADLINE_SECONDS），
+    之後的分類、LLM 呼叫、爬取都只會拿到剩餘的時間；同時記錄各階段耗時（/metrics）。"""
+    if request.url.path not in DEADLINE_PATHS:
+        return await call_next(request)
+    with metrics.request_trace(request.url.path) as trace, deadline.scope(deadline.from_headers(request.headers)):
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            metrics.finish_request(trace, metrics.outcome_of(e))
+            raise
+        metrics.finish_request(trace, _status_outcome(response.status_code))
+        return response
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_pool.aclose()
+
 @app.get("/")
 def root():
     return {"status": "ok", "msg": "PaiwanTalk AI Router Running"}
 
+@app.get("/stats")
+async def get_stats():
+    """回傳執行期統計（連線池、排程佇列、重複請求合併、意圖分類路徑、結構化輸出、搜尋快取、非同步工作、session）。
+
+    jobs / sessions 的狀態只在 event loop 上修改，所以這裡用 async def 讀取，不進 threadpool；
+    搜尋快取要查 SQLite，另外丟到 thread。
+    """
+    search_cache_stats = await asyncio.to_thread(search_cache.search_cache_stats)
+    return {
+        "http_pool": http_pool.pool_stats(),
+        "scheduler": scheduler.scheduler_stats(),
+        "singleflight": singleflight.singleflight_stats(),
+        "classifier": classifier.classifier_stats(),
+        "speculation": dict(_speculation_stats),
+        "structured_output": structured.structured_stats(),
+        "search_cache": search_cache_stats,
+        "jobs": jobs.jobs_stats(),
+        "sessions": sessions.sessions_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus 格式的延遲分布與計數（各階段耗時、LLM failover）。"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/models")
 async def get_models():
+    # 完整列表每次都重新查詢（同時更新 default_id 的快取）
     models = await client_default.models.list()
     return models
 
 async def get_default_model_name(active_client: DualClient) -> str:
-    models = await active_client.models.list()
-    if not getattr(models, "data", None):
-        raise RuntimeError("No models available from vLLM server.")
-    return models.data[0].id
+    """目前使用的模型名稱；DualClient 會快取 MODEL_CACHE_TTL 秒，不必每個請求都查 models.list()。"""
+    with metrics.span("model_discovery"):
+        return await active_client.models.default_id()
 
 
 @app.post("/api/translate_simple", response_model=SimpleTranslateResponse)
 async def translate_simple(req: SimpleTranslateRequest):
     """簡易翻譯 API，給瀏覽器擴充程式或其他客戶端使用。
 
-    目前只支援排灣語 -> 中文方向（paiwan2zh）。
+    direction：paiwan2zh（排灣語 -> 中文，預設）或 zh2paiwan（中文 -> 排灣語，以字典反向索引查詞後組句）。
     """
 
     direction = (req.direction or "paiwan2zh").lower()
-    if direction != "paiwan2zh":
+    if direction not in ("paiwan2zh", "zh2paiwan"):
         return SimpleTranslateResponse(
-            translation="目前僅支援排灣語翻譯成中文 (paiwan2zh)。",
+            translation="目前僅支援排灣語翻譯成中文 (paiwan2zh) 與中文翻譯成排灣語 (zh2paiwan)。",
             thinking="Unsupported direction",
         )
 
     # 根據 model_mode 選擇實際要用的 client / 模型
     mode = (req.model_mode or "default").lower()
 
+    # 同一段文字 + 模式 + 方向的同時請求只算一次，其餘共用結果
+    key = singleflight.translate_key(req.text, mode, direction)
+    return await singleflight.translate_flight.do(key, lambda: _translate_simple_once(req.text, mode, direction))
+
+
+async def _translate_simple_once(text: str, mode: str, direction: str = "paiwan2zh") -> SimpleTranslateResponse:
+    prework = None
+    if direction == "zh2paiwan":
+        # 單詞直接查反向索引就有答案，不必查模型也不必呼叫 LLM
+        prework = await asyncio.to_thread(translator.prepare_reverse, text)
+        local = translator.reverse_reply(prework)
+        if local:
+            metrics.set_intent("translation")
+            return SimpleTranslateResponse(translation=local["reply"], thinking=local["thinking"])
+
     if mode == "openai_only":
         active_client = client_openai_only
         model_name = "gpt-4o-mini"
@@ -126,15 +266,155 @@ async def translate_simple(req: SimpleTranslateRequest):
                 thinking=str(e),
             )
 
-    messages_list = [{"role": "user", "content": req.text}]
+    messages_list = [{"role": "user", "content": text}]
+    metrics.set_intent("translation")
 
-    result = await translator.process(active_client, model_name, messages_list)
+    # 互動式翻譯使用最高優先權
+    with scheduler.priority("translate"):
+        if direction == "zh2paiwan":
+            result = await translator.process_reverse(active_client, model_name, text, prework=prework)
+        else:
+            result = await translator.process(active_client, model_name, messages_list)
 
     return SimpleTranslateResponse(
         translation=result.get("reply", ""),
         thinking=result.get("thinking", ""),
     )
 
+@app.post("/api/translate_batch", response_model=BatchTranslateResponse)
+async def translate_batch(req: BatchTranslateRequest):
+    """批次翻譯 API：一次送多段文字（例如整頁翻譯），依原順序回傳各自的結果。
+
+    1. 以正規化後的文字去除重複。
+    2. 在同一個執行緒工作中一次完成擷取、Excel 精確查詢與切詞查字典
+       （zh2paiwan 則是查反向索引）。
+    3. 只有未命中 Excel / 字典詞條的段落才呼叫 LLM，並限制同時請求數。
+    """
+    direction = (req.direction or "paiwan2zh").lower()
+    if direction not in ("paiwan2zh", "zh2paiwan"):
+        return BatchTranslateResponse(results=[
+            BatchTranslateItem(
+                text=t,
+                translation="目前僅支援排灣語翻譯成中文 (paiwan2zh) 與中文翻譯成排灣語 (zh2paiwan)。",
+                thinking="Unsupported direction",
+            )
+            for t in req.texts
+        ])
+    if len(req.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一次最多翻譯 {BATCH_MAX_ITEMS} 段文字。")
+
+    mode = (req.model_mode or "default").lower()
+
+    # 1. 去重（保留第一次出現的原文）
+    unique: Dict[str, str] = {}
+    for text in req.texts:
+        key = singleflight.normalize_text(text)
+        if key and key not in unique:
+            unique[key] = text
+
+    # 2. 本地前置工作一次做完
+    keys = list(unique.keys())
+    if direction == "zh2paiwan":
+        preworks = await asyncio.to_thread(lambda: [translator.prepare_reverse(unique[k]) for k in keys])
+        local_reply = translator.reverse_reply
+    else:
+        preworks = await asyncio.to_thread(
+            lambda: [translator.prepare([{"role": "user", "content": unique[k]}]) for k in keys]
+        )
+        local_reply = translator.exact_reply
+
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for key, work in zip(keys, preworks):
+        exact = local_reply(work)
+        if exact:
+            # Excel 命中 / 整段就是字典詞條：不需要模型
+            results[key] = exact
+        else:
+            pending.append((key, work))
+
+    # 3. 剩下的才查模型、呼叫 LLM（限制併發）
+    if pending:
+        if mode == "openai_only":
+            active_client = client_openai_only
+            model_name = "gpt-4o-mini"
+        else:
+            active_client = client_default if mode == "default" else client_vllm_only
+            try:
+                model_name = await get_default_model_name(active_client)
+            except Exception as e:
+                active_client = None
+                for key, _work in pending:
+                    results[key] = {"reply": "無法取得模型列表，請稍後再試。", "thinking": str(e)}
+
+        if active_client is not None:
+            semaphore = asyncio.Semaphore(max(1, BATCH_LLM_CONCURRENCY))
+
+            async def run_one(key: str, work: Dict[str, Any]):
+                # 單一段落失敗（例如被 scheduler 拒絕）只影響該段落，其餘結果照常回傳
+                try:
+                    async with semaphore:
+                        with scheduler.priority("translate"):
+                            results[key] = await translator.process(
+                                active_client, model_name, [{"role": "user", "content": unique[key]}], prework=work
+                            )
+                except AdmissionRejected as e:
+                    results[key] = {"reply": f"LLM backend busy ({e.reason})，請稍後再試。", "thinking": str(e)}
+                except Exception as e:
+                    print(f"WARNING: Batch item failed: {e!r}")
+                    results[key] = {"reply": "抱歉，翻譯系統暫時無法回應。", "thinking": str(e) or type(e).__name__}
+
+            await asyncio.gather(*(run_one(key, work) for key, work in pending))
+
+    items = []
+    for text in req.texts:
+        result = results.get(singleflight.normalize_text(text))
+        if result is None:
+            items.append(BatchTranslateItem(text=text, translation="", thinking="Empty input"))
+        else:
+            items.append(BatchTranslateItem(
+                text=text,
+                translation=result.get("reply", ""),
+                thinking=result.get("thinking", ""),
+            ))
+    return BatchTranslateResponse(results=items)
+
+
+_speculation_stats: Dict[str, int] = {"started": 0, "used": 0, "discarded": 0, "failed": 0}
+
+
+def _start_prework(messages_list: List[Dict[str, str]], fast_intent: Optional[str]) -> Dict[str, "asyncio.Task"]:
+    """啟動可能用得到的模組前置工作（皆為無副作用的本地運算，在執行緒中執行）。
+
+    只在規則式分類無法判斷（fast_intent 為 None、接下來要等 LLM 分類）時才啟動，
+    讓前置工作與 LLM 分類重疊；規則式分類有結果時分類幾乎不花時間，沒有必要猜。
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+    if fast_intent is None:
+        # 擷取、Excel 精確查詢與切詞查字典（或中文 -> 排灣語的反向查詢），以及挑例句
+        tasks["translation"] = asyncio.create_task(asyncio.to_thread(translator.prepare, messages_list, True))
+        tasks["recommendation"] = asyncio.create_task(asyncio.to_thread(recommender.prepare, messages_list))
+    _speculation_stats["started"] += len(tasks)
+    return tasks
+
+
+async def _take_prework(tasks: Dict[str, "asyncio.Task"], intent: Optional[str]) -> Optional[Dict[str, Any]]:
+    """取出 intent 對應的前置工作結果，其餘取消／丟棄。"""
+    result = None
+    for name, task in tasks.items():
+        if name != intent:
+            task.cancel()
+            _speculation_stats["discarded"] += 1
+            continue
+        try:
+            result = await task
+            _speculation_stats["used"] += 1
+        except Exception as e:
+            print(f"WARNING: Speculative prework for {name} failed: {e}")
+            _speculation_stats["failed"] += 1
+    return result
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(req: ChatRequest):
     """
@@ -142,9 +422,48 @@ async def chat_endpoint(req: ChatRequest):
     1. Identifies intent.
     2. Routes to specific module.
     """
+    _check_session_request(req)
+    if req.message is None:
+        # Convert Pydantic models to dicts for modules
+        messages_list = [{"role": m.role, "content": m.content} for m in req.messages]
+        return await _chat_turn(req, messages_list)
+
+    # session 模式：歷史存在伺服器，只加上這一輪的訊息
+    if req.session_id:
+        session = sessions.get(req.session_id)
+    else:
+        session = sessions.create([{"role": m.role, "content": m.content} for m in req.messages])
+    async with session.lock:
+        session.append("user", req.message)
+        try:
+            with sessions.use(session):
+                # 複製 list（只複製參照），背景工作（例如分類抽查）不會看到之後才加入的回覆
+                response = await _chat_turn(req, session.messages[:])
+        except BaseException:
+            session.pop()
+            raise
+        # 存完整的一輪（reply + thinking），與模型實際輸出的格式相同
+        session.append("assistant", chat.assistant_turn(response.reply, response.thinking))
+    response.session_id = session.id
+    return response
+
+
+def _check_session_request(req: ChatRequest):
+    """帶了 session_id 卻沒有 message 時回 400，不要默默改成無狀態模式、忽略 session。"""
+    if req.session_id and req.message is None:
+        raise HTTPException(status_code=400, detail="帶 session_id 時，這一輪的訊息請放在 message。")
+
+
+async def _chat_turn(req: ChatRequest, messages_list: List[Dict[str, str]]) -> ChatResponse:
     # 根據前端傳入的 model_mode 選擇實際要用的 client / 模型
     mode = (req.model_mode or "default").lower()
 
+    # 規則式分類只算一次，結果同時給 speculative 前置工作與 router 使用
+    fast = classifier.fast_classify(messages_list) if classifier.FAST_INTENT_ENABLED else (None, "disabled")
+
+    # 0. Speculative：模型查詢與 LLM 意圖分類進行時，先在背景做各模組的本地前置工作
+    prework_tasks = _start_prework(messages_list, fast[0]) if SPECULATIVE_PREWORK else {}
+
     if mode == "openai_only":
         active_client = client_openai_only
         # 僅用自己的 OpenAI：模型名稱固定為 gpt-4o-mini
@@ -155,25 +474,46 @@ async def chat_endpoint(req: ChatRequest):
         try:
             model_name = await get_default_model_name(active_client)
         except Exception as e:
+            await _take_prework(prework_tasks, None)
             return ChatResponse(reply="無法取得模型列表", model="unknown", thinking=str(e))
 
-    # Convert Pydantic models to dicts for modules
-    messages_list = [{"role": m.role, "content": m.content} for m in req.messages]
-
     # 1. Classify Intent (using full history)
-    intent = await classifier.classify_intent(active_client, model_name, messages_list)
+    fused_answer = None
+    try:
+        with metrics.span("classification"):
+            if ROUTER_MODE == "fused":
+                fused_answer = await classifier.classify_and_answer(active_client, model_name, messages_list, fast)
+                intent = fused_answer["intent"]
+            else:
+                intent = await classifier.classify_intent(active_client, model_name, messages_list, fast)
+            metrics.set_intent(intent)
+    except BaseException:
+        await _take_prework(prework_tasks, None)
+        raise
     print(f"DEBUG: Detected Intent: {intent}")
+    jobs.report("classified", intent)
+
+    # 分類結果用不到的前置工作直接丟棄
+    prework = await _take_prework(prework_tasks, intent)
 
     # 2. Route to Module
     response_data = {}
     
-    if intent == "translation":
-        response_data = await translator.process(active_client, model_name, messages_list)
+    if fused_answer is not None and fused_answer.get("reply"):
+        # 合併模式已在分類的同一次呼叫中產生回答
+        response_data = fused_answer
+    elif intent == "translation":
+        with scheduler.priority("translate"):
+            response_data = await translator.process(
+                active_client, model_name, messages_list, prework=prework, detect_direction=True
+            )
     elif intent == "recommendation":
-        response_data = await recommender.process(active_client, model_name, messages_list)
+        response_data = await recommender.process(active_client, model_name, messages_list, prework=prework)
     elif intent == "search":
         # 新增：若判定為需要網路搜尋的問題，交給 search_test 模組處理
-        response_data = await search_test.process(active_client, model_name, messages_list)
+        # 搜尋摘要屬於長任務，排在翻譯與對話之後
+        with scheduler.priority("search"):
+            response_data = await search_test.process(active_client, model_name, messages_list)
     else:
         # Default to chat
         response_data = await chat.process(active_client, model_name, messages_list)
@@ -184,3 +524,61 @@ async def chat_endpoint(req: ChatRequest):
         thinking=response_data.get("thinking", ""),
         intent=intent
     )
+
+
+# ========= 非同步工作模式 =========
+# 搜尋類的請求可能超過 10 秒：前端先拿到 job id，再輪詢或以 SSE 訂閱進度（searched → fetched 2/3 → summarizing）與結果
+async def _run_chat_job(req: ChatRequest, seconds: float) -> Dict[str, Any]:
+    with metrics.request_trace("/chat/jobs") as trace, deadline.scope(seconds):
+        try:
+            response = await chat_endpoint(req)
+        except BaseException as e:
+            metrics.finish_request(trace, metrics.outcome_of(e))
+            raise
+        metrics.finish_request(trace, "ok")
+    return jsonable_encoder(response)
+
+
+@app.post("/chat/jobs", status_code=202)
+async def submit_chat_job(req: ChatRequest, request: Request):
+    """與 /chat 相同的輸入，立刻回傳 job id；工作在有併發上限的背景執行器中執行。"""
+    _check_session_request(req)
+    if req.message is not None and req.session_id and not sessions.exists(req.session_id):
+        raise sessions.SessionNotFound(req.session_id)
+    seconds = deadline.from_headers(request.headers)
+    job = jobs.submit("chat", lambda: _run_chat_job(req, seconds))
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/chat/jobs/{job.id}",
+        "events_url": f"/chat/jobs/{job.id}/events",
+    }
+
+
+def _get_job(job_id: str) -> jobs.Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="找不到這個工作（可能已過期）。")
+    return job
+
+
+@app.get("/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str):
+    """輪詢：回傳狀態（queued / running / done / failed）、目前進度與結果（result 與 /chat 的回應相同）。"""
+    return _get_job(job_id).snapshot()
+
+
+@app.get("/chat/jobs/{job_id}/events")
+async def chat_job_events(job_id: str):
+    """SSE：event: progress 為各階段進度，最後送出 event: result 或 event: error 後關閉。"""
+    job = _get_job(job_id)
+
+    async def stream():
+        async for event, data in job.events(heartbeat=jobs.JOB_SSE_HEARTBEAT):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
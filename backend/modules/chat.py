@@ -1,39 +1,76 @@
 import json
 from openai import AsyncOpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from .utils import extract_structured
+from . import structured
+from .scheduler import AdmissionRejected
+from . import history
+from . import sessions
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Always respond with strict JSON "
+    "using keys `reply` (final answer shown to the user) and "
+    "`thinking` (brief reasoning). Do not include other text."
+)
+
+
+def assistant_turn(reply: str, thinking: Optional[str] = None) -> str:
+    """assistant 一輪的完整內容（與 system prompt 要求的 JSON 格式相同）。"""
+    return json.dumps({
+        "reply": reply,
+        "thinking": thinking or "Context from previous conversation"
+    }, ensure_ascii=False)
+
+
+def wrap_message(msg: Dict[str, str]) -> Dict[str, str]:
+    """把 assistant 的純文字回覆包成與 system prompt 一致的 JSON 格式。"""
+    if msg["role"] != "assistant":
+        return msg
+    try:
+        # Try to parse if it's already JSON string
+        json.loads(msg["content"])
+        return msg
+    except json.JSONDecodeError:
+        # Wrap plain text in JSON structure
+        return {"role": "assistant", "content": assistant_turn(msg["content"])}
+
+
+def wrap_history(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [wrap_message(msg) for msg in messages]
+
+
+def _session_history(messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Optional[List[str]]]:
+    """回傳 (包好的歷史, 前綴雜湊)；session 模式下兩者都逐輪延伸、只處理新訊息。"""
+    session = sessions.current(messages)
+    if session is None:
+        return wrap_history(messages), None
+    wrapped = session.derived.setdefault("chat_wrapped", [])
+    wrapped.extend(wrap_message(msg) for msg in messages[len(wrapped):])
+    hashes = history._prefix_hashes(wrapped, session.derived.setdefault("chat_prefix_hashes", []))
+    return wrapped, hashes
+
+
+async def build_messages(client: AsyncOpenAI, model_name: str, system_prompt: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """組出送給 LLM 的完整訊息：system prompt +（滾動摘要）+ budget 內的最新歷史。"""
+    # 長對話只保留 token budget 內的最新訊息，較舊的部分折成滾動摘要
+    wrapped, hashes = _session_history(messages)
+    kept_history, summary = await history.compact_history(client, model_name, wrapped, prefix_hashes=hashes)
+
+    # Ensure system prompt is at the beginning
+    full_messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        full_messages.append({"role": "system", "content": f"先前對話摘要：{summary}"})
+    full_messages.extend(kept_history)
+    return full_messages
+
 
 async def process(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
     """
     Handle normal conversation.
     """
-    system_prompt = (
-        "You are a helpful assistant. Always respond with strict JSON "
-        "using keys `reply` (final answer shown to the user) and "
-        "`thinking` (brief reasoning). Do not include other text."
-    )
-    
-    # Ensure system prompt is at the beginning
-    full_messages = [{"role": "system", "content": system_prompt}]
-    
-    # Add history, ensuring format is correct
-    for msg in messages:
-        if msg["role"] == "assistant":
-            try:
-                # Try to parse if it's already JSON string
-                json.loads(msg["content"])
-                full_messages.append(msg)
-            except json.JSONDecodeError:
-                # Wrap plain text in JSON structure
-                simulated_json = json.dumps({
-                    "reply": msg["content"],
-                    "thinking": "Context from previous conversation"
-                }, ensure_ascii=False)
-                full_messages.append({"role": "assistant", "content": simulated_json})
-        else:
-            full_messages.append(msg)
-
     try:
+        full_messages = await build_messages(client, model_name, SYSTEM_PROMPT, messages)
+
         completion = await client.chat.completions.create(
             model=model_name,
             messages=full_messages,
@@ -41,16 +78,19 @@ async def process(client: AsyncOpenAI, model_name: str, messages: List[Dict[str,
             timeout=20.0,
             max_tokens=1024,
             presence_penalty=0.6,
+            **structured.request_kwargs(client, structured.REPLY_SCHEMA),
         )
         
         raw_content = completion.choices[0].message.content
         
-        reply, thinking = extract_structured(raw_content)
+        reply, thinking = extract_structured(raw_content, structured.is_structured(completion))
         return {
             "reply": reply,
             "thinking": thinking
         }
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {
             "reply": "抱歉，對話系統暫時無法回應。",
@@ -1,8 +1,142 @@
+import asyncio
 import json
+import os
+import random
+import re
+from collections import Counter, deque
 from openai import AsyncOpenAI
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
+from . import chat
+from .utils import parse_json_object, strip_code_fence
+from . import lexicon
+from . import scheduler
+from . import deadline
+from .scheduler import AdmissionRejected
 
-async def classify_intent(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]]) -> str:
+# ========= 規則式快速分類設定 =========
+FAST_INTENT_ENABLED = os.getenv("FAST_INTENT_ENABLED", "1").lower() in ("1", "true", "yes")
+# 快速分類命中時，抽樣比例在背景再跑一次 LLM 分類，用來統計兩者不一致的比例
+FAST_INTENT_AUDIT_RATE = float(os.getenv("FAST_INTENT_AUDIT_RATE", "0.05"))
+
+# 與 system prompt 共用的關鍵字清單
+RECOMMENDATION_KEYWORDS = ["例句", "推薦", "句子", "教我一句", "隨機"]
+GREETING_KEYWORDS = ["你好", "早安", "午安", "晚安", "您好", "哈囉", "嗨"]
+TRANSLATE_HINTS = ["翻譯", "意思", "翻成", "什麼意思", "是什麼"]
+SEARCH_KEYWORDS = ["天氣", "新聞", "最新", "近期", "排名", "今天", "今年"]
+CULTURE_KEYWORDS = ["五年祭", "祭典", "祭儀", "豐年祭", "收穫祭", "排灣族", "部落", "原住民"]
+CULTURE_QUESTION_HINTS = ["介紹", "活動", "是什麼", "有什麼", "由來", "歷史"]
+
+_stats: Dict[str, Any] = {
+    "fast": Counter(),
+    "llm": 0,
+    "audited": 0,
+    "disagreements": 0,
+}
+_recent_disagreements: deque = deque(maxlen=20)
+_audit_tasks: set = set()
+
+
+def _latest_user_text(messages: List[Dict[str, str]]) -> str:
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            return str(msg.get("content", "")).strip()
+    return ""
+
+
+def fast_classify(messages: List[Dict[str, str]]) -> Tuple[Optional[str], str]:
+    """規則式預分類：只在有把握時回傳 intent，否則回傳 None 交給 LLM。
+
+    依據：字典詞條命中比例、排灣語拼寫特徵（tj/lj/dj/dr）與 system prompt 中的關鍵字。
+    回傳 (intent 或 None, 判斷理由)。
+    """
+    text = _latest_user_text(messages)
+    if not text:
+        return None, "empty"
+
+    tokens = lexicon.latin_tokens(text)
+    cjk = lexicon.has_cjk(text)
+
+    # 1. 打招呼（整句就是招呼語）
+    bare = re.sub(r"[\s!！~～。\.,，?？]+", "", text)
+    if bare and any(bare == g or (bare.startswith(g) and len(bare) <= len(g) + 2) for g in GREETING_KEYWORDS):
+        return "chat", "greeting"
+
+    if cjk:
+        # 2. 中文 -> 排灣語：翻譯模組以字典反向索引處理
+        if lexicon.is_zh2paiwan_request(text):
+            return "translation", "zh2paiwan request"
+
+        # 3. 例句推薦關鍵字（排除「幫我翻譯這個句子」這類翻譯請求）
+        if any(k in text for k in RECOMMENDATION_KEYWORDS) and not any(h in text for h in TRANSLATE_HINTS):
+            return "recommendation", "recommendation keyword"
+
+        # 4. 中文指令 + 排灣語片段，例如「幫我翻譯 ti amentu aicu」
+        if tokens and any(h in text for h in TRANSLATE_HINTS):
+            if lexicon.lexicon_coverage(tokens) >= 0.5 or lexicon.digraph_ratio(tokens) >= 0.5:
+                return "translation", "translate hint + paiwan span"
+
+        # 5. 純中文的時事 / 文化查詢
+        if not tokens:
+            if any(k in text for k in SEARCH_KEYWORDS):
+                return "search", "search keyword"
+            if any(k in text for k in CULTURE_KEYWORDS) and any(h in text for h in CULTURE_QUESTION_HINTS):
+                return "search", "culture question"
+        return None, "ambiguous (cjk)"
+
+    if not tokens:
+        return None, "no letters"
+
+    # 6. 純拉丁字母：用字典命中率與拼寫特徵判斷是否為排灣語
+    coverage = lexicon.lexicon_coverage(tokens)
+    digraphs = lexicon.digraph_ratio(tokens)
+    english = lexicon.english_ratio(tokens)
+
+    if english >= 0.5 and coverage < 0.3:
+        return "chat", "english text"
+    if english == 0 and (coverage >= 0.6 or (coverage >= 0.3 and digraphs > 0) or digraphs >= 0.5):
+        return "translation", f"paiwan text (coverage={coverage:.2f}, digraphs={digraphs:.2f})"
+    return None, f"ambiguous (coverage={coverage:.2f}, english={english:.2f})"
+
+
+def classifier_stats() -> Dict[str, Any]:
+    fast_total = sum(_stats["fast"].values())
+    return {
+        "fast_path": dict(_stats["fast"]),
+        "fast_path_total": fast_total,
+        "llm_path_total": _stats["llm"],
+        "audited": _stats["audited"],
+        "disagreements": _stats["disagreements"],
+        "disagreement_rate": round(_stats["disagreements"] / _stats["audited"], 4) if _stats["audited"] else 0.0,
+        "recent_disagreements": list(_recent_disagreements),
+    }
+
+
+async def _audit(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]], fast_intent: str, reason: str):
+    """背景比對：快速分類結果 vs. LLM 分類結果。"""
+    try:
+        # 稽核不影響使用者，排在最低優先權，也不受原請求的時間預算限制
+        with scheduler.priority("search"), deadline.scope(None):
+            llm_intent = await _llm_classify(client, model_name, messages)
+    except Exception as e:
+        print(f"Classifier audit failed: {e}")
+        return
+    _stats["audited"] += 1
+    if llm_intent != fast_intent:
+        _stats["disagreements"] += 1
+        _recent_disagreements.append({
+            "text": _latest_user_text(messages)[:200],
+            "fast": fast_intent,
+            "llm": llm_intent,
+            "reason": reason,
+        })
+
+
+async def classify_intent(
+    client: AsyncOpenAI,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    fast: Optional[Tuple[Optional[str], str]] = None,
+) -> str:
     """
     Classify the user's intent based on the full conversation history.
     Categories:
@@ -11,28 +145,55 @@ async def classify_intent(client: AsyncOpenAI, model_name: str, messages: List[D
     - 'chat': Normal conversation or unclear intent.
     - 'search': User asks for up-to-date factual information that likely requires web search
                 (e.g. current events, today's weather, latest statistics, rankings, etc.).
+
+    明顯的情況先由 fast_classify 直接判斷，只有模糊的輸入才呼叫 LLM。
+    fast：呼叫端已經算好的 fast_classify 結果（避免同一個請求算兩次）。
     """
-    
-    system_prompt = (
+    if FAST_INTENT_ENABLED:
+        intent, reason = fast if fast is not None else fast_classify(messages)
+        if intent is not None:
+            _stats["fast"][intent] += 1
+            print(f"DEBUG: Fast-path intent: {intent} ({reason})")
+            if FAST_INTENT_AUDIT_RATE > 0 and random.random() < FAST_INTENT_AUDIT_RATE:
+                task = asyncio.create_task(_audit(client, model_name, messages, intent, reason))
+                _audit_tasks.add(task)
+                task.add_done_callback(_audit_tasks.discard)
+            return intent
+
+    _stats["llm"] += 1
+    return await _llm_classify(client, model_name, messages)
+
+
+def _categories_prompt() -> str:
+    recommendation_keywords = ", ".join(f"'{k}'" for k in RECOMMENDATION_KEYWORDS)
+    return (
         "You are an intelligent intent classifier for a Paiwan language learning assistant. "
         "Analyze the conversation history, especially the latest user message, to determine the user's current intent.\n\n"
         "Categories:\n"
         "1. 'translation': \n"
         "   - The user inputs text that looks like Paiwan language (Latin alphabet, often containing 'j', 'q', 'v', 'z', 'ng', 'tj', 'dj', 'lj').\n"
         "   - The user explicitly asks to translate Paiwan text to Chinese.\n"
-        "   - Example: 'tjaquvuquvulj', 'nanguaq', 'ti sun a kemeljang'.\n"
+        "   - The user asks how to say a Chinese word or sentence in Paiwan (Chinese -> Paiwan).\n"
+        "   - Example: 'tjaquvuquvulj', 'nanguaq', 'ti sun a kemeljang', '謝謝用排灣語怎麼說'.\n"
         "2. 'recommendation': \n"
         "   - The user asks for example sentences, learning materials, or random sentences.\n"
-        "   - Keywords: '例句', '推薦', '句子', '教我一句', '隨機'.\n"
+        f"   - Keywords: {recommendation_keywords}.\n"
         "3. 'chat': \n"
         "   - General conversation in Chinese or English.\n"
         "   - Greetings like '你好', '早安'.\n"
         "   - Questions about the bot.\n"
-        "   - If the user inputs Chinese text (even if they ask to translate it to Paiwan, we classify as chat because we only support Paiwan->Chinese translation).\n\n"
+        "   - Chinese text that is not asking for a translation into Paiwan.\n\n"
         "4. 'search': \n"
         "   - The user asks about current news, today's weather, recent statistics, rankings, prices, or any information that clearly depends on up-to-date web data.\n"
         "   - Example:  '排灣族有什麼活動','介紹一下五年祭'.\n\n"
-        "Return a JSON object with a single key 'intent'. Value must be one of: 'translation', 'recommendation', 'chat', 'search'.\n"
+    )
+
+
+async def _llm_classify(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]]) -> str:
+    """原本的 LLM 分類器。"""
+    system_prompt = (
+        _categories_prompt()
+        + "Return a JSON object with a single key 'intent'. Value must be one of: 'translation', 'recommendation', 'chat', 'search'.\n"
         "Example: {\"intent\": \"translation\"}"
     )
 
@@ -55,6 +216,7 @@ async def classify_intent(client: AsyncOpenAI, model_name: str, messages: List[D
             messages=classifier_messages,
             temperature=0.1,
             max_tokens=50,
+            timeout=10.0,
             # response_format={"type": "json_object"} # Removing this to avoid potential 400 errors
         )
         
@@ -74,6 +236,87 @@ async def classify_intent(client: AsyncOpenAI, model_name: str, messages: List[D
                 return "recommendation"
             return "chat"
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
         print(f"Classifier Error: {e}")
         return "chat"
+
+
+
+# ========= 合併模式：一次呼叫同時分類並回答 =========
+# 需要工具的意圖（翻譯查字典、網路搜尋、句庫推薦）仍交給對應模組；
+# 只有 chat 這種不需要工具的意圖會直接使用同一次呼叫產生的 reply / thinking。
+# 例句推薦不需要合併：recommender 直接從句庫挑句子組成回覆，分類之後不再呼叫 LLM
+# （只有句庫檔案不存在時才退回 LLM 產生例句）。
+FUSED_ANSWER_INTENTS = ("chat",)
+
+
+def _parse_fused(content: str) -> Dict[str, Optional[str]]:
+    text = strip_code_fence(content)
+    parsed = parse_json_object(text)
+
+    if parsed is None:
+        # 與 two-stage 相同的關鍵字後備判斷；無法取得 reply
+        for name in ("search", "translation", "recommendation"):
+            if name in text:
+                return {"intent": name, "reply": None, "thinking": None}
+        return {"intent": "chat", "reply": None, "thinking": None}
+
+    intent = str(parsed.get("intent") or "chat").strip()
+    if intent not in ("translation", "recommendation", "chat", "search"):
+        intent = "chat"
+    reply = str(parsed.get("reply") or "").strip() or None
+    thinking = str(parsed.get("thinking") or "").strip() or None
+    return {"intent": intent, "reply": reply, "thinking": thinking}
+
+
+async def classify_and_answer(
+    client: AsyncOpenAI,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    fast: Optional[Tuple[Optional[str], str]] = None,
+) -> Dict[str, Optional[str]]:
+    """合併模式 router：一個 prompt 同時回傳 intent，以及（chat 意圖時的）reply / thinking。
+
+    回傳 {"intent": str, "reply": str | None, "thinking": str | None}；
+    reply 為 None 代表仍需交給對應模組處理。fast 同 classify_intent。
+    """
+    if FAST_INTENT_ENABLED:
+        intent, reason = fast if fast is not None else fast_classify(messages)
+        if intent is not None:
+            _stats["fast"][intent] += 1
+            print(f"DEBUG: Fast-path intent: {intent} ({reason})")
+            return {"intent": intent, "reply": None, "thinking": None}
+
+    system_prompt = (
+        _categories_prompt()
+        + "Return a JSON object with key 'intent'. Value must be one of: 'translation', 'recommendation', 'chat', 'search'.\n"
+        "If and only if the intent is 'chat', also answer the user as a helpful assistant in the same JSON object, "
+        "using keys `reply` (final answer shown to the user) and `thinking` (brief reasoning).\n"
+        "For the other intents, return only the 'intent' key. Do not include other text.\n"
+        "Example: {\"intent\": \"translation\"}\n"
+        "Example: {\"intent\": \"chat\", \"reply\": \"你好！有什麼可以幫你的嗎？\", \"thinking\": \"使用者打招呼\"}"
+    )
+
+    _stats["llm"] += 1
+    try:
+        full_messages = await chat.build_messages(client, model_name, system_prompt, messages)
+        completion = await client.chat.completions.create(
+            model=model_name,
+            messages=full_messages,
+            temperature=0.4,
+            timeout=20.0,
+            max_tokens=1024,
+        )
+        result = _parse_fused(completion.choices[0].message.content)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"Fused Classifier Error: {e}")
+        return {"intent": "chat", "reply": None, "thinking": None}
+
+    if result["intent"] not in FUSED_ANSWER_INTENTS:
+        result["reply"] = None
+        result["thinking"] = None
+    return result
@@ -0,0 +1,83 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Mapping, Optional
+
+# ========= 請求層級的時間預算 =========
+# /chat、/api/translate_simple 每個請求的總時間上限（秒）；用戶端可用 X-Request-Timeout header 調短
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# header 最多可以要求的秒數
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "120"))
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# 剩餘時間少於這個值就不再發出新的 LLM 請求
+MIN_STAGE_SECONDS = 0.5
+
+# 絕對時間（time.monotonic()），None 代表沒有期限
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """請求的時間預算用完；main.py 轉成 504。"""
+
+    def __init__(self, stage: str = ""):
+        super().__init__(f"request deadline exceeded{f' before {stage}' if stage else ''}")
+        self.stage = stage
+
+
+def from_headers(headers: Mapping[str, str]) -> float:
+    """依 X-Request-Timeout header 決定這個請求的秒數，沒有或格式錯誤時使用預設值。"""
+    raw = headers.get(DEADLINE_HEADER) or headers.get(DEADLINE_HEADER.lower())
+    if raw:
+        try:
+            value = float(raw)
+            if value > 0:
+                return min(value, REQUEST_DEADLINE_MAX)
+        except ValueError:
+            pass
+    return REQUEST_DEADLINE_SECONDS
+
+
+@contextmanager
+def scope(seconds: Optional[float]):
+    """在這個 context 內的所有階段共用一個截止時間；巢狀使用時取較早的那個。
+
+    seconds=None 代表解除期限（例如回應送出後才跑的背景工作）。
+    """
+    if seconds is None:
+        new = None
+    else:
+        new = time.monotonic() + seconds
+        current = _deadline.get()
+        if current is not None:
+            new = min(new, current)
+    token = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """剩餘秒數（可能為負）；沒有期限時回傳 None。"""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+def expired(margin: float = 0.0) -> bool:
+    r = remaining()
+    return r is not None and r <= margin
+
+
+def timeout(default: Optional[float], stage: str = "") -> Optional[float]:
+    """某個階段可以用的 timeout：原本的設定與剩餘預算取較小者。
+
+    剩餘時間不足 MIN_STAGE_SECONDS 時直接拋出 DeadlineExceeded，不要再發出注定逾時的請求。
+    """
+    r = remaining()
+    if r is None:
+        return default
+    if r < MIN_STAGE_SECONDS:
+        raise DeadlineExceeded(stage)
+    return r if default is None else min(default, r)
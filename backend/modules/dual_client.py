@@ -1,52 +1,120 @@
 import os
 import json
+import time
 from openai import AsyncOpenAI
-from typing import Any, List, Optional
+from typing import Any, AsyncIterator, List, Optional
+
+from . import http_pool
+from . import scheduler
+from . import structured
+from . import deadline
+from . import metrics
+from .scheduler import AdmissionRejected
+
+# models.default_id() 的快取秒數；backend 換模型時最多這麼久後才會發現
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", "300"))
+# 串流時先累積這麼多字再送出第一段，確認不是垃圾輸出（之後失敗就不能再換 backend）
+STREAM_PEEK_CHARS = 32
+GARBAGE_MARKER = "!!!!!!!!!!"
+_UNSET = object()
 
 class DualClient:
-    def __init__(self, vllm_base_urls: List[str], vllm_api_key: str):
+    # 認得 structured_schema 參數（見 modules/structured.py）
+    supports_structured = True
+
+    def __init__(self, vllm_base_urls: List[str], vllm_api_key: str, use_openai: bool = True):
         # Primary Clients (vLLM List)
-        self.vllm_clients = []
-        for url in vllm_base_urls:
-            if url:
-                self.vllm_clients.append(AsyncOpenAI(
-                    base_url=url,
-                    api_key=vllm_api_key,
-                ))
-        
+        # 所有 DualClient 共用 http_pool 裡同一組 AsyncOpenAI / 連線池，
+        # 同一個 host 不會因為 model_mode 不同而各開一份連線。
+        # 每次使用時才向 http_pool 取 client：shutdown 關掉連線池後再啟動（例如測試中重複啟動 app）
+        # 會拿到新的 client，而不是綁在已關閉連線上的舊 client。
+        self.vllm_base_urls = [url for url in vllm_base_urls if url]
+        self.vllm_api_key = vllm_api_key
+        self._vllm_override: Optional[List[Any]] = None
+
         # Secondary Client (Official OpenAI)
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.openai_client = None
-        if self.openai_api_key:
-            self.openai_client = AsyncOpenAI(
-                api_key=self.openai_api_key
-            )
+        self.use_openai = use_openai and bool(self.openai_api_key)
+        self._openai_override: Any = _UNSET
+        if use_openai and self.openai_api_key:
             print("DEBUG: OpenAI Fallback Client Initialized.")
-        else:
+        elif use_openai:
             print("WARNING: OPENAI_API_KEY not found. Fallback will not work.")
 
+        # (模型名稱, 取得時間)，見 Models.default_id()
+        self._model_cache: Optional[tuple] = None
+
         # Mocking the structure to match AsyncOpenAI: client.chat.completions.create
         self.chat = self.Chat(self)
         self.models = self.Models(self)
 
+    # 可以直接指定（測試 / bench 以 mock 取代），否則依設定向 http_pool 取共用的 client
+    @property
+    def vllm_clients(self) -> List[Any]:
+        if self._vllm_override is not None:
+            return self._vllm_override
+        return [http_pool.get_openai_client(url, self.vllm_api_key) for url in self.vllm_base_urls]
+
+    @vllm_clients.setter
+    def vllm_clients(self, clients: List[Any]):
+        self._vllm_override = list(clients)
+        # 換了 backend，之前快取的模型名稱不一定存在
+        self._model_cache = None
+
+    @property
+    def openai_client(self) -> Optional[Any]:
+        if self._openai_override is not _UNSET:
+            return self._openai_override
+        if not self.use_openai:
+            return None
+        return http_pool.get_openai_client(None, self.openai_api_key)
+
+    @openai_client.setter
+    def openai_client(self, client: Optional[Any]):
+        self._openai_override = client
+
     class Models:
         def __init__(self, parent):
             self.parent = parent
 
         async def list(self):
+            models, from_vllm = await self._list_with_source()
+            if from_vllm and getattr(models, "data", None):
+                # 順便更新 default_id 的快取
+                self.parent._model_cache = (models.data[0].id, time.monotonic())
+            return models
+
+        async def _list_with_source(self):
+            """回傳 (models, 是否來自 vLLM)。"""
             # Try vLLM clients in order
             for i, client in enumerate(self.parent.vllm_clients):
                 try:
-                    return await client.models.list()
+                    return await client.models.list(timeout=deadline.timeout(10.0, "model discovery")), True
+                except deadline.DeadlineExceeded:
+                    raise
                 except Exception as e:
                     print(f"WARNING: vLLM client {i+1} models.list failed: {e}")
             
             # If all vLLM failed, try OpenAI
             if self.parent.openai_client:
                 # Return OpenAI models or a dummy list to keep code running
-                return await self.parent.openai_client.models.list()
+                return await self.parent.openai_client.models.list(timeout=deadline.timeout(10.0, "model discovery")), False
             raise RuntimeError("All vLLM clients and OpenAI fallback failed.")
 
+        async def default_id(self) -> str:
+            """第一個可用 backend 的模型名稱，快取 MODEL_CACHE_TTL 秒，不必每個請求都先查一次 models.list()。
+
+            只快取 vLLM 回報的名稱：vLLM 全掛時拿到的是 OpenAI 的模型名稱，
+            若也快取，vLLM 恢復後會因為模型名稱不存在而一直 failover 到 OpenAI。
+            """
+            cached = self.parent._model_cache
+            if cached and time.monotonic() - cached[1] < MODEL_CACHE_TTL:
+                return cached[0]
+            models = await self.list()
+            if not getattr(models, "data", None):
+                raise RuntimeError("No models available from vLLM server.")
+            return models.data[0].id
+
     class Chat:
         def __init__(self, parent):
             self.parent = parent
@@ -57,28 +125,32 @@ class DualClient:
                 self.parent = parent
 
             async def create(self, *args, **kwargs):
+                # 每個 backend 都先經過 scheduler 的併發上限 / 優先權佇列；
+                # 某個 backend 佇列已滿時直接換下一個，全部都滿才回 429/503
+                last_rejection: Optional[AdmissionRejected] = None
+                # 不是 OpenAI 的參數，由這裡依各 backend 的能力轉成 response_format / guided_json
+                schema = kwargs.pop("structured_schema", None)
+
                 # 1. Try vLLM clients in order
                 for i, client in enumerate(self.parent.vllm_clients):
+                    backend = str(client.base_url)
+                    limiter = scheduler.get_limiter(backend)
                     try:
-                        print(f"DEBUG: Attempting vLLM client {i+1}...")
-                        # Ensure we use the model name provided, or fallback logic might need to change it
-                        # Note: Different vLLM servers might have different model names. 
-                        # Ideally we should query the model list for each client, but for now we assume the model name passed is valid or ignored by the server if it only hosts one.
-                        
-                        # If switching between vLLM servers, we might need to re-fetch the model name if they differ.
-                        # But usually in this hackathon context, we just want to hit the endpoint.
-                        
-                        response = await client.chat.completions.create(*args, **kwargs)
-                        
-                        # Check for garbage output
-                        content = response.choices[0].message.content
-                        if "!!!!!!!!!!" in content:
-                            raise ValueError("Detected garbage output (exclamation marks).")
-                        
-                        return response
-                    
+                        # 每次嘗試（含排隊時間）各記一個 span，失敗換下一個時另外計數
+                        with metrics.span("llm_attempt", backend=backend):
+                            async with limiter.slot():
+                                return await self._attempt_vllm(i, client, schema, *args, **kwargs)
+                    except AdmissionRejected as e:
+                        print(f"WARNING: vLLM client {i+1} rejected by scheduler: {e.reason}")
+                        metrics.LLM_FAILOVER_TOTAL.inc(from_backend=backend, reason="rejected")
+                        last_rejection = e
+                        continue
+                    except deadline.DeadlineExceeded:
+                        # 時間預算用完，不再嘗試其他 backend
+                        raise
                     except Exception as e:
                         print(f"ERROR: vLLM client {i+1} failed or returned garbage: {e}")
+                        metrics.LLM_FAILOVER_TOTAL.inc(from_backend=backend, reason=metrics.outcome_of(e))
                         continue # Try next vLLM client
 
                 # 2. Try OpenAI if available
@@ -95,7 +167,132 @@ class DualClient:
                     # Remove params that might not be supported or needed
                     # e.g. if vLLM uses specific extra_body params
                     
-                    return await self.parent.openai_client.chat.completions.create(*args, **kwargs)
+                    with metrics.span("llm_attempt", backend="openai"):
+                        async with scheduler.get_limiter("openai").slot():
+                            return await self._request("openai", self.parent.openai_client, schema, True, *args, **kwargs)
+
+                if last_rejection is not None:
+                    raise last_rejection
                 
                 # If no fallback, re-raise
                 raise RuntimeError("All vLLM clients and OpenAI fallback failed.")
+
+            async def stream(self, *args, **kwargs) -> AsyncIterator[str]:
+                """串流版的 create()：依相同的 failover 順序，逐段產生回覆文字。
+
+                只有在送出第一段文字之前（連線失敗、被 scheduler 拒絕、開頭就是垃圾輸出）才會換下一個
+                backend；已經送出內容後才失敗就直接拋出，不會把兩個 backend 的輸出接在一起。
+                """
+                kwargs["stream"] = True
+                last_rejection: Optional[AdmissionRejected] = None
+                attempts = [(str(c.base_url), c, False) for c in self.parent.vllm_clients]
+                if self.parent.openai_client:
+                    attempts.append(("openai", self.parent.openai_client, True))
+
+                for i, (backend, client, is_openai) in enumerate(attempts):
+                    if is_openai:
+                        print("DEBUG: Switching to OpenAI Fallback (stream)...")
+                        kwargs["model"] = "gpt-4o-mini"
+                    else:
+                        print(f"DEBUG: Attempting vLLM client {i+1} (stream)...")
+                    started = False
+                    try:
+                        with metrics.span("llm_attempt", backend=backend):
+                            async with scheduler.get_limiter(backend).slot():
+                                response = await self._request(backend, client, None, is_openai, *args, **kwargs)
+                                pieces = self._checked_text(response)
+                                try:
+                                    async for text in pieces:
+                                        started = True
+                                        yield text
+                                finally:
+                                    # 呼叫端提早關閉時，一路關到底層的連線
+                                    await pieces.aclose()
+                        return
+                    except AdmissionRejected as e:
+                        print(f"WARNING: {backend} rejected by scheduler: {e.reason}")
+                        metrics.LLM_FAILOVER_TOTAL.inc(from_backend=backend, reason="rejected")
+                        last_rejection = e
+                        continue
+                    except deadline.DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        if started or is_openai:
+                            raise
+                        print(f"ERROR: vLLM client {i+1} stream failed or returned garbage: {e}")
+                        metrics.LLM_FAILOVER_TOTAL.inc(from_backend=backend, reason=metrics.outcome_of(e))
+                        continue
+
+                if last_rejection is not None:
+                    raise last_rejection
+                raise RuntimeError("All vLLM clients and OpenAI fallback failed.")
+
+            @staticmethod
+            async def _checked_text(response) -> AsyncIterator[str]:
+                """取出串流中的文字片段；開頭先累積 STREAM_PEEK_CHARS 個字，並持續檢查垃圾輸出。"""
+                buffered = ""
+                tail = ""
+                try:
+                    async for chunk in response:
+                        if not chunk.choices:
+                            continue
+                        text = chunk.choices[0].delta.content
+                        if not text:
+                            continue
+                        # 標記可能被切在兩個 chunk 之間，所以連同上一段的結尾一起檢查
+                        if GARBAGE_MARKER in tail + text:
+                            raise ValueError("Detected garbage output (exclamation marks).")
+                        tail = (tail + text)[-len(GARBAGE_MARKER):]
+                        if buffered is not None:
+                            buffered += text
+                            if len(buffered) < STREAM_PEEK_CHARS:
+                                continue
+                            text, buffered = buffered, None
+                        yield text
+                    if buffered:
+                        yield buffered
+                finally:
+                    # 中途放棄（垃圾輸出、用戶端斷線）時釋放連線
+                    await response.close()
+
+            async def _request(self, backend, client, schema, is_openai, *args, **kwargs):
+                """送出請求；有 schema 時加上結構化輸出參數，backend 回 400/422 就記下不支援並降級重試。"""
+                # 每次嘗試都以「剩餘的請求預算」為上限（排隊等待也會用掉預算）
+                budget = deadline.timeout(kwargs.get("timeout"), f"{backend} request")
+                if budget is not None:
+                    kwargs["timeout"] = budget
+                if schema:
+                    for mode in structured.candidate_modes(backend, is_openai):
+                        try:
+                            response = await client.chat.completions.create(*args, **structured.apply(kwargs, mode, schema))
+                        except Exception as e:
+                            if structured.is_unsupported_error(e):
+                                structured.mark_unsupported(backend, mode, e)
+                                continue
+                            raise
+                        structured.mark_structured(response, backend, mode)
+                        return response
+
+                response = await client.chat.completions.create(*args, **kwargs)
+                if schema:
+                    structured.mark_structured(response, backend, None)
+                return response
+
+            async def _attempt_vllm(self, i, client, schema, *args, **kwargs):
+                """對單一 vLLM backend 發出請求並檢查垃圾輸出（失敗時拋出例外）。"""
+                print(f"DEBUG: Attempting vLLM client {i+1}...")
+                # Ensure we use the model name provided, or fallback logic might need to change it
+                # Note: Different vLLM servers might have different model names. 
+                # Ideally we should query the model list for each client, but for now we assume the model name passed is valid or ignored by the server if it only hosts one.
+                
+                # If switching between vLLM servers, we might need to re-fetch the model name if they differ.
+                # But usually in this hackathon context, we just want to hit the endpoint.
+                
+                response = await self._request(str(client.base_url), client, schema, False, *args, **kwargs)
+                
+                # Check for garbage output
+                content = response.choices[0].message.content
+                if GARBAGE_MARKER in content:
+                    raise ValueError("Detected garbage output (exclamation marks).")
+                
+                return response
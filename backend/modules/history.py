@@ -0,0 +1,181 @@
+import hashlib
+import math
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .scheduler import AdmissionRejected
+from . import deadline
+
+# ========= 對話歷史壓縮設定 =========
+# 送進 LLM 的歷史訊息 token 上限（不含 system prompt）
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2048"))
+# 滾動摘要的最大長度
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "256"))
+# 摘要快取筆數（LRU）
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "512"))
+
+# 請求剩餘時間少於此秒數時不做摘要（摘要之後還要等真正的回答）
+SUMMARY_MIN_BUDGET = 10.0
+
+# 每則訊息的格式開銷（role、分隔符號等），以 OpenAI chat 格式的經驗值估計
+_PER_MESSAGE_OVERHEAD = 4
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿＀-￯]")
+_WORD_RE = re.compile(r"[A-Za-z0-9']+")
+
+
+def count_tokens(text: str) -> int:
+    """本地估算 token 數，不需要載入 tokenizer。
+
+    - 中日文字元：每字約 1 token
+    - 拉丁字母 / 數字組成的詞：約每 4 個字元 1 token
+    - 其他標點符號：每個 1 token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    words = _WORD_RE.findall(text)
+    word_tokens = sum(math.ceil(len(w) / 4) for w in words)
+    rest = _CJK_RE.sub("", text)
+    rest = _WORD_RE.sub("", rest)
+    punct = len(re.sub(r"\s+", "", rest))
+    return cjk + word_tokens + punct
+
+
+def message_tokens(msg: Dict[str, str]) -> int:
+    return _PER_MESSAGE_OVERHEAD + count_tokens(str(msg.get("content", "")))
+
+
+# key：已被摺疊的前 N 則訊息的鏈式雜湊 → 這些訊息的摘要
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _prefix_hashes(messages: List[Dict[str, str]], hashes: Optional[List[str]] = None) -> List[str]:
+    """回傳每個前綴的鏈式雜湊，hashes[i] 代表 messages[:i+1]。
+
+    傳入先前算好的 hashes 時只補上新增的訊息（原地延伸），供 session 逐輪重用。
+    """
+    hashes = [] if hashes is None else hashes
+    h = hashes[-1] if hashes else ""
+    for msg in messages[len(hashes):]:
+        h = hashlib.sha1(f"{h}\x00{msg.get('role')}\x00{msg.get('content')}".encode("utf-8")).hexdigest()
+        hashes.append(h)
+    return hashes
+
+
+def _cache_get(key: str) -> Optional[str]:
+    value = _summary_cache.get(key)
+    if value is not None:
+        _summary_cache.move_to_end(key)
+    return value
+
+
+def _cache_put(key: str, value: str):
+    _summary_cache[key] = value
+    _summary_cache.move_to_end(key)
+    while len(_summary_cache) > HISTORY_SUMMARY_CACHE_SIZE:
+        _summary_cache.popitem(last=False)
+
+
+def split_by_budget(messages: List[Dict[str, str]], budget: int) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """由新到舊保留訊息，直到超過 budget。回傳 (aged_out, kept)。
+
+    最新一則訊息一定保留；保留區段盡量從 user 訊息開始。
+    """
+    if not messages:
+        return [], []
+
+    used = 0
+    cut = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        cost = message_tokens(messages[i])
+        if cut < len(messages) and used + cost > budget:
+            break
+        used += cost
+        cut = i
+
+    # 不要讓保留區段以 assistant 開頭（少了對應的 user 問句）
+    while cut < len(messages) - 1 and messages[cut].get("role") == "assistant":
+        cut += 1
+
+    return messages[:cut], messages[cut:]
+
+
+async def _summarize(client: Any, model_name: str, previous: Optional[str], new_turns: List[Dict[str, str]]) -> str:
+    lines = []
+    if previous:
+        lines.append(f"先前摘要：{previous}")
+    for msg in new_turns:
+        role = "使用者" if msg.get("role") == "user" else "助理"
+        lines.append(f"{role}：{msg.get('content', '')}")
+
+    completion = await client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "請將以下對話濃縮成一段簡短的繁體中文摘要，保留使用者的需求、提到的排灣語詞彙與重要結論。"
+                    "只輸出摘要本身，不要加其他文字。"
+                ),
+            },
+            {"role": "user", "content": "\n".join(lines)},
+        ],
+        temperature=0.2,
+        timeout=15.0,
+        max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+    )
+    return (completion.choices[0].message.content or "").strip()
+
+
+async def compact_history(
+    client: Any,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    budget: Optional[int] = None,
+    prefix_hashes: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """把對話歷史壓到 token budget 內。
+
+    回傳 (保留的最新訊息, 較舊訊息的滾動摘要或 None)。
+    摘要以「已摺疊的訊息前綴」為 key 快取，只有當新的訊息被擠出 budget 時才重新計算，
+    而且只會把新擠出的部分與上一版摘要合併。
+    prefix_hashes：session 模式下已算好的整段 messages 前綴雜湊，不必每輪從頭計算。
+    """
+    budget = CHAT_HISTORY_TOKEN_BUDGET if budget is None else budget
+    aged, kept = split_by_budget(messages, budget)
+    if not aged:
+        return kept, None
+
+    hashes = prefix_hashes[:len(aged)] if prefix_hashes is not None else _prefix_hashes(aged)
+    cached = _cache_get(hashes[-1])
+    if cached is not None:
+        return kept, cached
+
+    # 找出已有摘要的最長前綴，只摘要之後新擠出的訊息
+    previous: Optional[str] = None
+    start = 0
+    for i in range(len(hashes) - 2, -1, -1):
+        prev = _cache_get(hashes[i])
+        if prev is not None:
+            previous, start = prev, i + 1
+            break
+
+    if deadline.expired(SUMMARY_MIN_BUDGET):
+        print("[History] Low time budget, dropping old turns without summarizing.")
+        return kept, previous
+
+    try:
+        summary = await _summarize(client, model_name, previous, aged[start:])
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        print(f"[History] Summarization failed, dropping old turns: {e}")
+        return kept, previous
+
+    if not summary:
+        return kept, previous
+    _cache_put(hashes[-1], summary)
+    return kept, summary
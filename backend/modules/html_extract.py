@@ -0,0 +1,122 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+import httpx
+
+# 不含正文的標籤，裡面的文字全部略過
+SKIP_TAGS = {"script", "style", "nav", "footer", "iframe", "noscript", "svg", "template", "head"}
+# 區塊層級標籤，結束時視為斷句
+_BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "title"}
+
+# Content-Type 沒有 charset 時，在開頭這麼多位元組內找 <meta charset>
+_SNIFF_BYTES = 2048
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+# 網頁常見的宣告名稱 → 實際應使用的 codec（與瀏覽器相同，gb2312 頁面其實多半是 GBK）
+_CHARSET_ALIASES = {"gb2312": "gbk", "x-gbk": "gbk", "x-big5": "big5"}
+
+
+class TextExtractor(HTMLParser):
+    """邊讀邊解析的 HTML → 純文字轉換器（標準函式庫 HTMLParser，可以分段 feed）。
+
+    收集到 max_chars 個字元後 done 會變成 True，呼叫端可以停止下載。
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self._skip_depth = 0
+        self._in_title = False
+
+    @property
+    def done(self) -> bool:
+        return self.length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            # <title> 在 <head> 裡，但是通常是很有用的摘要，保留下來
+            self._in_title = True
+        elif tag in SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in SKIP_TAGS and self._skip_depth > 0:
+            self._skip_depth -= 1
+        elif tag in _BLOCK_TAGS and self.parts and not self.parts[-1].endswith("\n"):
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if (self._skip_depth and not self._in_title) or self.done:
+            return
+        text = " ".join(data.split())
+        if not text:
+            return
+        self.parts.append(text)
+        self.length += len(text) + 1
+
+    def text(self) -> str:
+        lines = " ".join(self.parts).split("\n")
+        return "\n".join(line.strip() for line in lines if line.strip())[: self.max_chars]
+
+
+def is_text_response(response: httpx.Response) -> bool:
+    content_type = response.headers.get("Content-Type", "").lower()
+    return not content_type or "html" in content_type or content_type.startswith("text/")
+
+
+def sniff_encoding(head: bytes) -> Optional[str]:
+    """從網頁開頭的 BOM 或 <meta charset> 判斷編碼；找不到或不認得時回傳 None。"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    match = _META_CHARSET_RE.search(head[:_SNIFF_BYTES])
+    if not match:
+        return None
+    name = match.group(1).decode("ascii", "ignore").lower()
+    name = _CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+async def stream_text(response: httpx.Response, max_bytes: int, max_chars: int) -> str:
+    """從 streaming response 讀取 HTML 並擷取文字。
+
+    讀到 max_bytes 或已收集 max_chars 個字元就停止，不下載剩下的內容。
+    編碼依序採用 Content-Type 的 charset、開頭的 BOM / <meta charset>，最後才是 UTF-8，
+    所以只在 <meta> 宣告 Big5、GBK 的網頁也不會變成亂碼。
+    """
+    extractor = TextExtractor(max_chars)
+    decoder = None
+    head = b""
+    async for chunk in response.aiter_bytes():
+        if decoder is None:
+            # 先累積到足以找到 <meta charset> 的長度再決定編碼
+            head += chunk
+            if len(head) < _SNIFF_BYTES and response.num_bytes_downloaded < max_bytes:
+                continue
+            chunk, head = head, b""
+            decoder = _decoder(response, chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or response.num_bytes_downloaded >= max_bytes:
+            break
+    if decoder is None:
+        # 整個網頁比 _SNIFF_BYTES 還短
+        decoder = _decoder(response, head)
+        extractor.feed(decoder.decode(head))
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.text()
+
+
+def _decoder(response: httpx.Response, head: bytes) -> codecs.IncrementalDecoder:
+    encoding = response.charset_encoding or sniff_encoding(head) or "utf-8"
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
@@ -0,0 +1,194 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+# ========= 連線池設定 =========
+# 所有 DualClient（default / vllm_only / openai_only）與 translation.py 共用同一組連線池，
+# 避免對同一個 vLLM host 各自開連線、各自做 TLS handshake。
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP_POOL_CONNECT_TIMEOUT = float(os.getenv("HTTP_POOL_CONNECT_TIMEOUT", "5"))
+# HTTP/2 需要額外安裝 h2 套件 (pip install "httpx[http2]")，預設關閉
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0").lower() in ("1", "true", "yes")
+# 搜尋模組抓網頁用的連線池（與 LLM 分開，避免外部網站拖慢 LLM 請求）
+WEB_POOL_MAX_CONNECTIONS = int(os.getenv("WEB_POOL_MAX_CONNECTIONS", "20"))
+WEB_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _PoolStats:
+    """簡單的連線池使用量統計（in-flight / 峰值 / 總數 / 錯誤）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests_total += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+
+    def exit(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors_total += 1
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """在 httpx 預設 transport 外包一層計數，用來觀察連線池的使用狀況。
+
+    in-flight 的計算是「送出 request 到收到 response header」為止。
+    """
+
+    def __init__(self, stats: _PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.enter()
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self._stats.exit(failed)
+
+
+_stats = _PoolStats()
+_http_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[_CountingTransport] = None
+_openai_clients: Dict[Tuple[Optional[str], str], AsyncOpenAI] = {}
+_http2_active = False
+_web_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """取得全域共用的 httpx.AsyncClient（第一次呼叫時建立）。"""
+    global _http_client, _transport, _http2_active
+    if _http_client is None:
+        use_http2 = HTTP2_ENABLED
+        if use_http2 and not _http2_available():
+            print("WARNING: HTTP2_ENABLED=1 but 'h2' is not installed. Falling back to HTTP/1.1.")
+            use_http2 = False
+
+        limits = httpx.Limits(
+            max_connections=HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY,
+        )
+        _transport = _CountingTransport(_stats, limits=limits, http2=use_http2)
+        _http_client = httpx.AsyncClient(
+            transport=_transport,
+            # 與 openai SDK 的預設相同；實際每次呼叫會帶自己的 timeout
+            timeout=httpx.Timeout(600.0, connect=HTTP_POOL_CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+        _http2_active = use_http2
+        print(
+            f"DEBUG: Shared HTTP pool initialized (max_connections={HTTP_POOL_MAX_CONNECTIONS}, "
+            f"keepalive={HTTP_POOL_MAX_KEEPALIVE}, http2={use_http2})."
+        )
+    return _http_client
+
+
+def get_web_client() -> httpx.AsyncClient:
+    """取得抓取外部網頁用的共用 httpx.AsyncClient（第一次呼叫時建立）。"""
+    global _web_client
+    if _web_client is None:
+        _web_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=WEB_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=WEB_POOL_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(10.0, connect=HTTP_POOL_CONNECT_TIMEOUT),
+            headers={"User-Agent": WEB_USER_AGENT},
+            follow_redirects=True,
+        )
+    return _web_client
+
+
+def get_openai_client(base_url: Optional[str], api_key: str) -> AsyncOpenAI:
+    """依 (base_url, api_key) 取得共用的 AsyncOpenAI，底層都走同一個連線池。
+
+    base_url 為 None 代表官方 OpenAI API。
+    """
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is None:
+        kwargs: Dict[str, Any] = {"api_key": api_key, "http_client": get_http_client()}
+        if base_url:
+            kwargs["base_url"] = base_url
+        client = AsyncOpenAI(**kwargs)
+        _openai_clients[key] = client
+    return client
+
+
+def pool_stats() -> Dict[str, Any]:
+    """回傳連線池使用量（給 /stats 使用）。"""
+    connections_total = 0
+    connections_idle = 0
+    pool = getattr(_transport, "_pool", None) if _transport is not None else None
+    for conn in list(getattr(pool, "connections", []) or []):
+        connections_total += 1
+        try:
+            if conn.is_idle():
+                connections_idle += 1
+        except Exception:
+            pass
+
+    return {
+        "initialized": _http_client is not None,
+        "http2": _http2_active,
+        "max_connections": HTTP_POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_POOL_MAX_KEEPALIVE,
+        "keepalive_expiry": HTTP_POOL_KEEPALIVE_EXPIRY,
+        "connections_open": connections_total,
+        "connections_idle": connections_idle,
+        "connections_active": connections_total - connections_idle,
+        "in_flight": _stats.in_flight,
+        "peak_in_flight": _stats.peak_in_flight,
+        "requests_total": _stats.requests_total,
+        "errors_total": _stats.errors_total,
+        "utilization": round(_stats.in_flight / HTTP_POOL_MAX_CONNECTIONS, 4) if HTTP_POOL_MAX_CONNECTIONS else 0.0,
+        "openai_clients": len(_openai_clients),
+        "web_client_initialized": _web_client is not None,
+    }
+
+
+async def aclose():
+    """關閉共用連線池（FastAPI shutdown 時呼叫）。
+
+    之後再呼叫 get_http_client() / get_openai_client() 會重新建立；DualClient 每次使用時才取 client，
+    所以同一個 process 內重新啟動 app 不會用到已關閉的連線。
+    """
+    global _http_client, _transport, _web_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    if _web_client is not None:
+        await _web_client.aclose()
+    _http_client = None
+    _web_client = None
+    _transport = None
+    _openai_clients.clear()
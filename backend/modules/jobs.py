@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .scheduler import AdmissionRejected
+
+# ========= 非同步工作（/chat/jobs）設定 =========
+# 搜尋類的請求常常超過 10 秒：改成送出後立刻拿到 job id，再輪詢或以 SSE 訂閱進度與結果
+# 同時執行的工作數；其餘排隊等待
+JOB_MAX_CONCURRENCY = int(os.getenv("JOB_MAX_CONCURRENCY", "4"))
+# 排隊 + 執行中的工作上限，超過回 429
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+# 完成的工作保留幾秒（供輪詢取回結果）
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+# 最多保留幾個已完成的工作，超過時先淘汰最舊的
+JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "500"))
+# SSE 連線閒置多久送一次 ping
+JOB_SSE_HEARTBEAT = 15.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": list(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+    def _publish(self, event: str, data: Dict[str, Any]):
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    def report(self, stage: str, detail: str = ""):
+        entry = {"stage": stage, "detail": detail, "elapsed": round(time.time() - self.created, 3)}
+        self.progress.append(entry)
+        self._publish("progress", entry)
+
+    async def events(self, heartbeat: Optional[float] = None) -> AsyncIterator[tuple]:
+        """依序產生 (event, data)：先重播已有的進度，之後即時推送，最後是 result 或 error。
+
+        heartbeat：超過這麼多秒沒有新事件時產生 ("ping", {})，避免 proxy 切斷閒置的 SSE 連線。
+        """
+        # 訂閱與取快照在同一個同步步驟完成，之後的進度只會出現在 queue 裡，不會重複或遺漏
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        replay = list(self.progress)
+        finished = self.done
+        try:
+            for entry in replay:
+                yield "progress", entry
+            if finished:
+                yield self._final_event()
+                return
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield "ping", {}
+                    continue
+                yield event, data
+                if event != "progress":
+                    return
+        finally:
+            self._subscribers.remove(queue)
+
+    def _final_event(self) -> tuple:
+        if self.status == DONE:
+            return "result", self.result or {}
+        return "error", {"detail": self.error or "job failed"}
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_semaphore: Optional[asyncio.Semaphore] = None
+_current: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar("current_job", default=None)
+_stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, JOB_MAX_CONCURRENCY))
+    return _semaphore
+
+
+def _prune():
+    """淘汰超過保留時間、或超出保留數量的已完成工作。"""
+    now = time.time()
+    finished = [job for job in _jobs.values() if job.done]
+    expired = [job for job in finished if now - (job.finished or now) > JOB_RESULT_TTL]
+    overflow = len(finished) - len(expired) - JOB_MAX_RETAINED
+    if overflow > 0:
+        remaining = [job for job in finished if job not in expired]
+        expired.extend(sorted(remaining, key=lambda j: j.finished or 0)[:overflow])
+    for job in expired:
+        _jobs.pop(job.id, None)
+        _stats["expired"] += 1
+
+
+def pending_count() -> int:
+    return sum(1 for job in _jobs.values() if not job.done)
+
+
+def submit(kind: str, work: Callable[[], Awaitable[Dict[str, Any]]]) -> Job:
+    """建立工作並在背景執行 work()；排隊 + 執行中的工作已達上限時拋出 AdmissionRejected (429)。"""
+    _prune()
+    if pending_count() >= JOB_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise AdmissionRejected("jobs", 429, 5, "job queue full")
+
+    job = Job(kind)
+    _jobs[job.id] = job
+    _stats["submitted"] += 1
+    job.task = asyncio.create_task(_run(job, work))
+    return job
+
+
+async def _run(job: Job, work: Callable[[], Awaitable[Dict[str, Any]]]):
+    token = _current.set(job)
+    try:
+        async with _get_semaphore():
+            job.status = RUNNING
+            job.report("started")
+            job.result = await work()
+            job.status = DONE
+            _stats["completed"] += 1
+    except asyncio.CancelledError:
+        job.status = FAILED
+        job.error = "cancelled"
+        raise
+    except Exception as e:
+        job.status = FAILED
+        job.error = str(e) or type(e).__name__
+        _stats["failed"] += 1
+        print(f"WARNING: Job {job.id} failed: {e!r}")
+    finally:
+        job.finished = time.time()
+        _current.reset(token)
+        job._publish(*job._final_event())
+
+
+def get(job_id: str) -> Optional[Job]:
+    _prune()
+    return _jobs.get(job_id)
+
+
+def report(stage: str, detail: str = ""):
+    """在工作內回報進度（例如 "searched"、"fetched 2/3"、"summarizing"）；不在工作內時不做任何事。"""
+    job = _current.get()
+    if job is not None:
+        job.report(stage, detail)
+
+
+def jobs_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "pending": pending_count(),
+        "retained": len(_jobs),
+        "max_concurrency": JOB_MAX_CONCURRENCY,
+        "max_pending": JOB_MAX_PENDING,
+    }
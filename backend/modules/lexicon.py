@@ -0,0 +1,174 @@
+import re
+from typing import List, Optional, Set, Tuple
+
+# ========= 排灣語拼寫特徵 =========
+# 排灣語書寫系統常見的雙字母（tj / lj / dj / dr）
+PAIWAN_DIGRAPHS = ("tj", "lj", "dj", "dr")
+# 排灣語較常見、英文較少見的字母
+PAIWAN_MARKED_LETTERS = set("qvz")
+# 排灣語書寫系統幾乎不使用的字母（字典中出現次數極少）
+NON_PAIWAN_LETTERS = set("fhox")
+
+# 常見英文功能詞，用來避免把英文句子誤判成排灣語
+ENGLISH_STOPWORDS = {
+    "the", "is", "are", "am", "was", "be", "a", "an", "of", "to", "in", "on", "for", "and", "or",
+    "what", "how", "why", "who", "where", "when", "you", "me", "my", "your", "it", "this", "that",
+    "hello", "hi", "hey", "thanks", "thank", "please", "can", "could", "do", "does", "translate",
+    "good", "morning", "night", "yes", "no", "with", "about", "tell",
+}
+
+_LATIN_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z'’\-]*")
+_CJK_RE = re.compile(r"[一-鿿]")
+_SPLIT_RE = re.compile(r"[\s,，、\.\?？!！/()（）~“”\"]+")
+
+_headwords: Optional[Set[str]] = None
+
+
+def get_headwords() -> Set[str]:
+    """所有字典來源的排灣語詞條（小寫、拆成單詞），第一次呼叫時建立。"""
+    global _headwords
+    if _headwords is None:
+        # 延遲 import，避免與 translator 互相 import
+        from .translator import get_translator
+
+        words: Set[str] = set()
+        try:
+            translator = get_translator()
+            for mapping in translator.dicts.values():
+                for key in mapping.keys():
+                    for tok in _SPLIT_RE.split(key.lower()):
+                        if tok and _LATIN_TOKEN_RE.fullmatch(tok):
+                            words.add(tok.replace("’", "'"))
+        except Exception as e:
+            print(f"[Lexicon] Failed to build headword set: {e}")
+        _headwords = words
+        print(f"[Lexicon] Loaded {len(words)} Paiwan headwords.")
+    return _headwords
+
+
+def has_cjk(text: str) -> bool:
+    return bool(_CJK_RE.search(text or ""))
+
+
+def latin_tokens(text: str) -> List[str]:
+    return [t.lower().replace("’", "'") for t in _LATIN_TOKEN_RE.findall(text or "")]
+
+
+def is_headword(token: str) -> bool:
+    return token.lower() in get_headwords()
+
+
+def orthography_score(token: str) -> float:
+    """只看拼寫判斷一個拉丁字母詞「像不像排灣語」，回傳 0~1。"""
+    t = token.lower()
+    if not t:
+        return 0.0
+    if t in ENGLISH_STOPWORDS:
+        return 0.0
+    score = 0.5
+    if any(d in t for d in PAIWAN_DIGRAPHS):
+        score += 0.3
+    if PAIWAN_MARKED_LETTERS & set(t):
+        score += 0.1
+    if NON_PAIWAN_LETTERS & set(t):
+        score -= 0.4
+    return max(0.0, min(1.0, score))
+
+
+def token_score(token: str) -> float:
+    """綜合字典與拼寫特徵：字典詞條得 1.0，否則以拼寫分數打折。"""
+    t = token.lower()
+    if t in ENGLISH_STOPWORDS and len(t) <= 2:
+        # 'a'、'i' 同時是排灣語與英文，單獨出現時不當作證據
+        return 0.3
+    if len(t) > 1 and is_headword(t):
+        return 1.0
+    return orthography_score(t) * 0.8
+
+
+def lexicon_coverage(tokens: List[str]) -> float:
+    """拉丁字母詞中可在字典找到的比例。"""
+    if not tokens:
+        return 0.0
+    hits = sum(1 for t in tokens if len(t) > 1 and is_headword(t))
+    return hits / len(tokens)
+
+
+def digraph_ratio(tokens: List[str]) -> float:
+    if not tokens:
+        return 0.0
+    return sum(1 for t in tokens if any(d in t for d in PAIWAN_DIGRAPHS)) / len(tokens)
+
+
+def english_ratio(tokens: List[str]) -> float:
+    # 單字母詞（a、i）在排灣語也很常見，不列入計算
+    words = [t for t in tokens if len(t) > 1]
+    if not words:
+        return 0.0
+    return sum(1 for t in words if t in ENGLISH_STOPWORDS) / len(words)
+
+
+# 連續的拉丁字母詞（中間只隔空白、逗號或連字號）視為一段候選排灣語
+_LATIN_RUN_RE = re.compile(r"[A-Za-z][A-Za-z'’\-]*(?:[\s,]+[A-Za-z][A-Za-z'’\-]*)*")
+
+
+def extract_paiwan_span(text: str) -> Tuple[str, float]:
+    """從中英混合輸入中擷取排灣語片段，例如「幫我翻譯 ti amentu aicu」→「ti amentu aicu」。
+
+    對每段連續的拉丁字母詞計算字典 / 拼寫分數，取總分最高的一段。
+    回傳 (片段, 信心值 0~1)；找不到時回傳 ("", 0.0)。
+    """
+    runs = [m.group(0).strip(" ,") for m in _LATIN_RUN_RE.finditer(text or "")]
+    scored = []
+    for run in runs:
+        tokens = latin_tokens(run)
+        if not tokens:
+            continue
+        scores = [token_score(t) for t in tokens]
+        scored.append((sum(scores), sum(scores) / len(scores), run, tokens))
+
+    if not scored:
+        return "", 0.0
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    best_sum, best_mean, best_run, best_tokens = scored[0]
+
+    if english_ratio(best_tokens) >= 0.5:
+        # 看起來是英文，交給 LLM 判斷
+        return best_run, round(best_mean * 0.5, 3)
+
+    if len(scored) == 1:
+        # 只有一段拉丁字母，其餘都是中文指令：擷取位置沒有歧義
+        confidence = 0.7 + 0.3 * best_mean
+    else:
+        second_sum = scored[1][0]
+        margin = (best_sum - second_sum) / best_sum if best_sum > 0 else 0.0
+        confidence = best_mean * (0.5 + 0.5 * margin)
+
+    return best_run, round(min(1.0, confidence), 3)
+
+
+# ========= 中文 -> 排灣語的請求 =========
+ZH2PAIWAN_HINTS = ["排灣語怎麼說", "排灣語要怎麼說", "翻成排灣語", "翻譯成排灣語", "用排灣語"]
+_QUOTED_RE = re.compile(r"[「『“\"']([^」』”\"']+)[」』”\"']")
+# 去掉請求中的指令部分，只留下要翻的中文
+_ZH2PAIWAN_FRAME_RE = re.compile(
+    r"^(請問|請|幫我|可以|麻煩)?(幫我)?(把|將)?|"
+    r"(的)?排灣語(要)?(怎麼|如何)(說|講|寫)|"
+    r"(翻|翻譯)(成|為)排灣語|"
+    r"用排灣語(要)?(怎麼|如何)?(說|講|寫)?|"
+    r"[嗎呢]?[？?。!！]*$"
+)
+
+
+def is_zh2paiwan_request(text: str) -> bool:
+    return has_cjk(text) and any(h in (text or "") for h in ZH2PAIWAN_HINTS)
+
+
+def zh2paiwan_source(text: str) -> str:
+    """從「謝謝用排灣語怎麼說」這類請求中取出要翻譯的中文；有引號時取引號內的文字。"""
+    m = _QUOTED_RE.search(text or "")
+    if m:
+        return m.group(1).strip()
+    source = _ZH2PAIWAN_FRAME_RE.sub("", text or "")
+    return source.strip(" ：:，,的")
@@ -0,0 +1,202 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .deadline import DeadlineExceeded
+from .scheduler import AdmissionRejected
+
+# ========= 延遲追蹤 / Prometheus 指標 =========
+# 每個請求結束時印出各階段耗時（除錯用）
+TRACE_LOG = os.getenv("TRACE_LOG", "0").lower() in ("1", "true", "yes")
+
+# 秒；涵蓋本地查字典（毫秒級）到搜尋摘要（數十秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key → [各 bucket 計數..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = row
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, row):
+                    le = _label_str(self.labelnames, key, 'le="%g"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {count:g}")
+                le = _label_str(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {row[-1]:g}")
+                lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {row[-2]:.6f}")
+                lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {row[-1]:g}")
+        return lines
+
+
+_registry: List[Any] = []
+
+REQUEST_DURATION = Histogram(
+    "paiwan_request_duration_seconds", "End-to-end HTTP request latency.", ("endpoint", "intent", "outcome")
+)
+REQUESTS_TOTAL = Counter("paiwan_requests_total", "HTTP requests handled.", ("endpoint", "intent", "outcome"))
+STAGE_DURATION = Histogram(
+    "paiwan_stage_duration_seconds", "Latency of each pipeline stage.", ("stage", "intent", "backend", "outcome")
+)
+LLM_FAILOVER_TOTAL = Counter(
+    "paiwan_llm_failover_total", "LLM requests that moved on to the next backend.", ("from_backend", "reason")
+)
+
+
+def render() -> str:
+    """Prometheus text exposition format（/metrics）。"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ========= 請求層級的 trace =========
+class Trace:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.intent = ""
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, str, float, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, backend: str, elapsed: float, outcome: str):
+        with self._lock:
+            self.spans.append((stage, backend, elapsed, outcome))
+
+    def summary(self) -> str:
+        total = (time.perf_counter() - self.start) * 1000
+        parts = []
+        for stage, backend, elapsed, outcome in self.spans:
+            name = f"{stage}@{backend}" if backend else stage
+            status = "" if outcome == "ok" else f"({outcome})"
+            parts.append(f"{name}={elapsed * 1000:.0f}ms{status}")
+        return f"TRACE {self.endpoint} intent={self.intent or '-'} total={total:.0f}ms " + " ".join(parts)
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def outcome_of(exc: Optional[BaseException]) -> str:
+    if exc is None:
+        return "ok"
+    if isinstance(exc, AdmissionRejected):
+        return "rejected"
+    if isinstance(exc, DeadlineExceeded):
+        return "deadline"
+    if isinstance(exc, ValueError) and "garbage" in str(exc).lower():
+        return "garbage"
+    if isinstance(exc, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(exc, asyncio.TimeoutError) or "timeout" in type(exc).__name__.lower():
+        return "timeout"
+    return "error"
+
+
+@contextmanager
+def request_trace(endpoint: str) -> Iterator[Trace]:
+    trace = Trace(endpoint)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def finish_request(trace: Trace, outcome: str):
+    elapsed = time.perf_counter() - trace.start
+    REQUEST_DURATION.observe(elapsed, endpoint=trace.endpoint, intent=trace.intent, outcome=outcome)
+    REQUESTS_TOTAL.inc(endpoint=trace.endpoint, intent=trace.intent, outcome=outcome)
+    if TRACE_LOG:
+        print(trace.summary() + f" outcome={outcome}")
+
+
+def set_intent(intent: str):
+    trace = _trace.get()
+    if trace is not None:
+        trace.intent = intent
+
+
+@contextmanager
+def span(stage: str, backend: str = "") -> Iterator[Dict[str, str]]:
+    """記錄一個階段的耗時。yield 的 dict 可以在階段內改寫 outcome / backend，例如：
+
+        with metrics.span("llm_attempt", backend=url) as s:
+            ...
+            s["outcome"] = "garbage"
+    """
+    info = {"backend": backend, "outcome": ""}
+    start = time.perf_counter()
+    exc: Optional[BaseException] = None
+    try:
+        yield info
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        outcome = info["outcome"] or outcome_of(exc)
+        trace = _trace.get()
+        intent = trace.intent if trace is not None else ""
+        STAGE_DURATION.observe(elapsed, stage=stage, intent=intent, backend=info["backend"], outcome=outcome)
+        if trace is not None:
+            trace.add(stage, info["backend"], elapsed, outcome)
@@ -0,0 +1,139 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .history import count_tokens
+
+# ========= 段落切分 / BM25 =========
+PASSAGE_MAX_CHARS = 400
+PASSAGE_MIN_CHARS = 40
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?；;])|(?<=\.)\s+")
+_CJK_RUN_RE = re.compile(r"[一-鿿㐀-䶿]+")
+_WORD_RE = re.compile(r"[A-Za-z0-9']+")
+
+
+def terms(text: str) -> List[str]:
+    """BM25 用的詞：中文取相鄰兩字（bigram，單字則取單字），拉丁字母取小寫單詞。"""
+    out: List[str] = []
+    for run in _CJK_RUN_RE.findall(text or ""):
+        if len(run) == 1:
+            out.append(run)
+        else:
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+    out.extend(w.lower() for w in _WORD_RE.findall(text or "") if len(w) > 1)
+    return out
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_MAX_CHARS) -> List[str]:
+    """依換行與句號把網頁文字切成約 max_chars 字的段落；太短的行（選單、按鈕）併入相鄰段落。"""
+    passages: List[str] = []
+    current = ""
+    for line in (text or "").split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        pieces = [line] if len(line) <= max_chars else [p for p in _SENTENCE_END_RE.split(line) if p and p.strip()]
+        for piece in pieces:
+            piece = piece.strip()
+            while len(piece) > max_chars:
+                # 沒有句號的超長段落直接硬切
+                passages.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            if current and len(current) + len(piece) + 1 > max_chars:
+                passages.append(current)
+                current = ""
+            current = f"{current} {piece}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+def bm25_idf(n_docs: int, doc_freq: int) -> float:
+    return math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def bm25_scores(docs: Sequence[List[str]], query_terms: List[str]) -> List[float]:
+    """對每個已切好詞的段落計算 BM25 分數。"""
+    if not docs or not query_terms:
+        return [0.0] * len(docs)
+    n = len(docs)
+    avg_len = sum(len(d) for d in docs) / n or 1.0
+    df: Counter = Counter()
+    for d in docs:
+        df.update(set(d))
+
+    query = Counter(query_terms)
+    scores = []
+    for d in docs:
+        tf = Counter(d)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(d) / avg_len)
+        score = 0.0
+        for term, qtf in query.items():
+            f = tf.get(term)
+            if not f:
+                continue
+            idf = bm25_idf(n, df[term])
+            score += qtf * idf * f * (BM25_K1 + 1) / (f + norm)
+        scores.append(score)
+    return scores
+
+
+def select_passages(
+    pages: List[str],
+    query: str,
+    keywords: Optional[List[str]] = None,
+    token_budget: int = 1500,
+) -> Dict[int, List[str]]:
+    """從多個網頁挑出與 query 最相關的段落，總長度不超過 token_budget。
+
+    pages 為各網頁的文字；回傳 {頁面 index: [段落…]}，段落維持在原網頁中的順序。
+    所有頁面一起計算 IDF，所以多個網站都有的導覽列、版權聲明分數會很低。
+    """
+    candidates: List[Tuple[int, int, str]] = []
+    seen = set()
+    for page_idx, text in enumerate(pages):
+        for pos, passage in enumerate(split_passages(text)):
+            key = " ".join(passage.split()).lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            candidates.append((page_idx, pos, passage))
+    if not candidates:
+        return {}
+
+    query_terms = terms(query)
+    for kw in keywords or []:
+        # 使用者問題中的族群 / 祭典關鍵字加重
+        query_terms.extend(terms(kw) * 2)
+
+    docs = [terms(p) for _, _, p in candidates]
+    scores = bm25_scores(docs, query_terms)
+
+    if any(scores):
+        # 只送出有命中 query 的段落；太短的段落多半是選單或按鈕文字，稍微降權
+        ranked = sorted(
+            (i for i in range(len(candidates)) if scores[i] > 0),
+            key=lambda i: (scores[i] * (1.0 if len(candidates[i][2]) >= PASSAGE_MIN_CHARS else 0.5), -candidates[i][1]),
+            reverse=True,
+        )
+    else:
+        # 沒有任何段落命中 query：退回各網頁的開頭段落，輪流挑選
+        ranked = sorted(range(len(candidates)), key=lambda i: (candidates[i][1], candidates[i][0]))
+
+    chosen: List[int] = []
+    used = 0
+    for i in ranked:
+        cost = count_tokens(candidates[i][2])
+        if used + cost > token_budget:
+            continue
+        chosen.append(i)
+        used += cost
+
+    selected: Dict[int, List[str]] = {}
+    for i in sorted(chosen, key=lambda i: (candidates[i][0], candidates[i][1])):
+        selected.setdefault(candidates[i][0], []).append(candidates[i][2])
+    return selected
@@ -1,20 +1,31 @@
 import json
 import os
 import random
-import pandas as pd
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 from .utils import extract_structured
+from . import structured
+from .scheduler import AdmissionRejected
 
 # Global cache for the dataframe
 _SENTENCE_DF = None
+_LOAD_LOCK = threading.Lock()
 
 def load_sentences():
     global _SENTENCE_DF
-    if _SENTENCE_DF is None:
+    if _SENTENCE_DF is not None:
+        return
+    # prepare() 可能在背景執行緒中第一次呼叫，避免重複讀 Excel
+    with _LOAD_LOCK:
+        if _SENTENCE_DF is not None:
+            return
         try:
             # Assuming running from backend/
             file_path = os.path.join("data", "formosan_pairs_paiwan.xlsx")
             if os.path.exists(file_path):
+                # pandas 很重，只在第一次需要例句時才載入
+                import pandas as pd
+
                 _SENTENCE_DF = pd.read_excel(file_path)
                 print(f"[Recommender] Loaded {_SENTENCE_DF.shape[0]} sentences.")
             else:
@@ -29,12 +40,23 @@ def get_random_sentence():
         return row['Ab'], row['Ch']
     return None, None
 
-async def process(client: Any, model_name: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+def prepare(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """推薦流程中不需要 LLM 的前置工作（從句庫挑一句），可在分類完成前先執行。"""
+    paiwan_sent, chinese_sent = get_random_sentence()
+    return {"paiwan": paiwan_sent, "chinese": chinese_sent}
+
+async def process(
+    client: Any,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    prework: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
     Handle recommendation of example sentences.
     """
     # 1. Try to get a random sentence from the database
-    paiwan_sent, chinese_sent = get_random_sentence()
+    work = prework if prework is not None else prepare(messages)
+    paiwan_sent, chinese_sent = work.get("paiwan"), work.get("chinese")
     
     if paiwan_sent and chinese_sent:
         reply_text = (
@@ -70,14 +92,17 @@ async def process(client: Any, model_name: str, messages: List[Dict[str, str]])
                 temperature=0.7,
                 timeout=20.0,
                 max_tokens=1024,
+                **structured.request_kwargs(client, structured.REPLY_SCHEMA),
             )
             
             raw_content = completion.choices[0].message.content
-            reply, thinking = extract_structured(raw_content)
+            reply, thinking = extract_structured(raw_content, structured.is_structured(completion))
             return {
                 "reply": reply,
                 "thinking": thinking
             }
+        except AdmissionRejected:
+            raise
         except Exception as e:
             return {
                 "reply": "抱歉，推薦系統暫時無法回應。",
@@ -0,0 +1,197 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from . import deadline
+
+# ========= 準入控制設定 =========
+# 每個 LLM backend（vLLM host / OpenAI）各自的同時請求上限與等待佇列長度
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+# 在佇列裡最多等多久（秒），超過就回 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+# 個別 backend 覆寫上限，例如 {"http://host:45014/v1/": 4, "openai": 16}
+_BACKEND_CONCURRENCY: Dict[str, int] = json.loads(os.getenv("LLM_BACKEND_CONCURRENCY", "{}") or "{}")
+
+# 優先權：數字愈小愈優先
+PRIORITY_TRANSLATE = 0   # 擴充功能 / 互動式翻譯
+PRIORITY_CHAT = 1        # 一般對話、分類
+PRIORITY_SEARCH = 2      # 搜尋摘要等長任務
+
+PRIORITIES = {
+    "translate": PRIORITY_TRANSLATE,
+    "chat": PRIORITY_CHAT,
+    "search": PRIORITY_SEARCH,
+}
+
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_CHAT)
+
+
+class AdmissionRejected(Exception):
+    """佇列已滿 (429) 或等待逾時 (503) 時拋出，由 main.py 轉成 HTTP 回應。"""
+
+    def __init__(self, backend: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"{backend}: {reason}")
+        self.backend = backend
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority(level: Union[str, int]):
+    """在這個 context 內發出的 LLM 請求都使用指定的優先權。
+
+    用法：
+        with scheduler.priority("translate"):
+            await translator.process(...)
+    """
+    value = PRIORITIES.get(level, PRIORITY_CHAT) if isinstance(level, str) else int(level)
+    token = _current_priority.set(value)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class BackendLimiter:
+    """單一 backend 的併發上限 + 有界優先權佇列。"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # 平均服務時間（秒），用來估算 Retry-After
+        self._ewma_service = 2.0
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.shed = 0
+
+    def retry_after(self) -> int:
+        waiting = len(self._waiters) + 1
+        return max(1, math.ceil(self._ewma_service * waiting / self.max_concurrency))
+
+    def _remove(self, entry: Tuple[int, int, asyncio.Future]):
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+
+    async def acquire(self, prio: int):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            # 佇列滿：若新請求比佇列裡最不重要的那筆更優先，就把那筆踢掉
+            worst = max(self._waiters) if self._waiters else None
+            if worst is not None and worst[0] > prio:
+                self._remove(worst)
+                self.shed += 1
+                worst[2].set_exception(
+                    AdmissionRejected(self.name, 429, self.retry_after(), "shed by higher-priority request")
+                )
+            else:
+                self.rejected_full += 1
+                raise AdmissionRejected(self.name, 429, self.retry_after(), "queue full")
+
+        # 請求本身的時間預算比佇列等待上限更短時，以預算為準
+        wait = self.queue_timeout
+        budget = deadline.remaining()
+        limited_by_deadline = budget is not None and budget < wait
+        if limited_by_deadline:
+            wait = max(0.0, budget)
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (prio, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(fut, timeout=wait)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            if limited_by_deadline:
+                raise deadline.DeadlineExceeded(f"{self.name} queue")
+            self.rejected_timeout += 1
+            raise AdmissionRejected(self.name, 503, self.retry_after(), "queue wait timeout")
+        except asyncio.CancelledError:
+            # 呼叫端取消；若 slot 已經交給我們，要還回去
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.release(None)
+            else:
+                self._remove(entry)
+            raise
+        # fut 的結果為 True 代表 release() 已把 slot 直接轉交給我們（_active 不變）
+        self.admitted += 1
+
+    def release(self, elapsed: Optional[float]):
+        if elapsed is not None:
+            self._ewma_service = 0.8 * self._ewma_service + 0.2 * elapsed
+        while self._waiters:
+            _prio, _seq, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, prio: Optional[int] = None):
+        await self.acquire(current_priority() if prio is None else prio)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "shed": self.shed,
+            "avg_service_seconds": round(self._ewma_service, 3),
+        }
+
+
+_limiters: Dict[str, BackendLimiter] = {}
+
+
+def get_limiter(backend: str) -> BackendLimiter:
+    """依 backend 名稱（vLLM base_url 或 'openai'）取得共用的 limiter。"""
+    limiter = _limiters.get(backend)
+    if limiter is None:
+        limiter = BackendLimiter(
+            backend,
+            max_concurrency=int(_BACKEND_CONCURRENCY.get(backend, LLM_MAX_CONCURRENCY)),
+            max_queue=LLM_MAX_QUEUE,
+            queue_timeout=LLM_QUEUE_TIMEOUT,
+        )
+        _limiters[backend] = limiter
+    return limiter
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
@@ -0,0 +1,223 @@
+import abc
+import asyncio
+import json
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from . import passages
+from . import search_cache
+
+# ========= 搜尋後端設定 =========
+# hybrid：先查本地知識庫，命中不足才用 DuckDuckGo 補；local：只查本地；ddgs：只查 DuckDuckGo
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "hybrid").lower()
+# 本地知識庫目錄（.md / .txt，或 [{"title", "text", "url"}] 格式的 .json）；
+# 知識庫需自行建立，目錄不存在時 hybrid 直接使用 DuckDuckGo
+SEARCH_KB_DIR = os.getenv("SEARCH_KB_DIR", "data/kb")
+# 文件涵蓋 query 詞的比例達到此值才算「命中」
+SEARCH_LOCAL_MIN_COVERAGE = float(os.getenv("SEARCH_LOCAL_MIN_COVERAGE", "0.5"))
+# 本地命中篇數少於此值時，hybrid 模式改用 DuckDuckGo 補足
+SEARCH_LOCAL_MIN_HITS = int(os.getenv("SEARCH_LOCAL_MIN_HITS", "1"))
+
+# 搜尋結果格式：{"title", "href", "body", "source"}，本地文件另外帶 "content"（不需要再爬取）
+
+
+class SearchBackend(abc.ABC):
+    """搜尋後端介面。"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        ...
+
+
+class DDGSBackend(SearchBackend):
+    """DuckDuckGo 網路搜尋（結果經過 search_cache 快取）。"""
+
+    name = "ddgs"
+
+    def __init__(self, region: str = "tw-tzh"):
+        # region 設為台灣繁體，讓結果更偏向在地與華文內容
+        self.region = region
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        # 強制加上 "台灣" 關鍵字以確保結果相關性
+        if "台灣" not in query and "Taiwan" not in query:
+            query += " 台灣"
+        print(f"🔍 [搜尋] 正在 DuckDuckGo 查詢: {query} ...")
+        # ddgs.text 是同步的，在背景執行避免卡住
+        results = await asyncio.to_thread(self._run, query, max_results)
+        return [{**r, "source": self.name} for r in results]
+
+    def _run(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        cache_key = search_cache.query_key(query, max_results, self.region)
+        cached = search_cache.get_query(cache_key)
+        if cached is not None:
+            print("🔍 [搜尋] 使用快取的搜尋結果")
+            return cached
+
+        from ddgs import DDGS
+
+        results = []
+        with DDGS() as ddgs:
+            search_gen = ddgs.text(query, max_results=max_results, region=self.region)
+            if search_gen:
+                for r in search_gen:
+                    results.append(r)
+        search_cache.put_query(cache_key, results)
+        return results
+
+
+class LocalKBBackend(SearchBackend):
+    """本地知識庫：以倒排索引 + BM25 查詢整理好的文件，不需要網路。
+
+    可以傳入 directory（讀取 .md / .txt / .json），或直接傳入 documents（測試時使用）。
+    """
+
+    name = "local"
+
+    def __init__(self, directory: Optional[str] = None, documents: Optional[List[Dict[str, str]]] = None):
+        self.directory = directory
+        self._documents = documents
+        self._lock = threading.Lock()
+        self._docs: Optional[List[Dict[str, str]]] = None
+        self._index: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+
+    def _load_documents(self) -> List[Dict[str, str]]:
+        if self._documents is not None:
+            return list(self._documents)
+        docs: List[Dict[str, str]] = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return docs
+        for root, _, files in os.walk(self.directory):
+            for fname in sorted(files):
+                path = os.path.join(root, fname)
+                rel = os.path.relpath(path, self.directory)
+                try:
+                    if fname.endswith(".json"):
+                        with open(path, "r", encoding="utf-8") as f:
+                            for i, item in enumerate(json.load(f)):
+                                docs.append({
+                                    "title": item.get("title") or f"{rel}#{i}",
+                                    "text": item.get("text", ""),
+                                    "url": item.get("url") or f"kb:{rel}#{i}",
+                                })
+                    elif fname.endswith((".md", ".txt")):
+                        with open(path, "r", encoding="utf-8") as f:
+                            text = f.read()
+                        first = text.strip().split("\n", 1)[0]
+                        title = first.lstrip("# ").strip() if first.startswith("#") else os.path.splitext(fname)[0]
+                        docs.append({"title": title, "text": text, "url": f"kb:{rel}"})
+                except Exception as e:
+                    print(f"WARNING: [SearchKB] Failed to load {path}: {e}")
+        return docs
+
+    def _ensure_index(self):
+        if self._docs is not None:
+            return
+        with self._lock:
+            if self._docs is not None:
+                return
+            docs = self._load_documents()
+            index: Dict[str, Dict[int, int]] = {}
+            lengths = []
+            for doc_id, doc in enumerate(docs):
+                doc_terms = passages.terms(f"{doc['title']}\n{doc['text']}")
+                lengths.append(len(doc_terms))
+                for term, tf in Counter(doc_terms).items():
+                    index.setdefault(term, {})[doc_id] = tf
+            self._index, self._lengths = index, lengths
+            self._docs = docs
+            if docs:
+                print(f"[SearchKB] Indexed {len(docs)} documents, {len(index)} terms.")
+
+    def query(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """同步查詢，回傳依 BM25 分數排序的結果（含 coverage：文件涵蓋 query 詞的比例）。"""
+        self._ensure_index()
+        query_terms = set(passages.terms(query))
+        if not self._docs or not query_terms:
+            return []
+
+        n = len(self._docs)
+        avg_len = sum(self._lengths) / n or 1.0
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for term in query_terms:
+            postings = self._index.get(term)
+            if not postings:
+                continue
+            idf = passages.bm25_idf(n, len(postings))
+            for doc_id, tf in postings.items():
+                norm = passages.BM25_K1 * (1 - passages.BM25_B + passages.BM25_B * self._lengths[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (passages.BM25_K1 + 1) / (tf + norm)
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+
+        results = []
+        for doc_id in sorted(scores, key=scores.get, reverse=True)[:max_results]:
+            doc = self._docs[doc_id]
+            results.append({
+                "title": doc["title"],
+                "href": doc["url"],
+                "body": doc["text"][:200],
+                "content": doc["text"],
+                "source": self.name,
+                "score": round(scores[doc_id], 4),
+                "coverage": round(matched[doc_id] / len(query_terms), 4),
+            })
+        return results
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.query, query, max_results)
+
+
+class HybridBackend(SearchBackend):
+    """先查本地知識庫；涵蓋率足夠的文件不到 min_hits 篇時，再用網路搜尋補足。"""
+
+    name = "hybrid"
+
+    def __init__(self, local: SearchBackend, web: SearchBackend, min_coverage: float = SEARCH_LOCAL_MIN_COVERAGE, min_hits: int = SEARCH_LOCAL_MIN_HITS):
+        self.local = local
+        self.web = web
+        self.min_coverage = min_coverage
+        self.min_hits = min_hits
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        hits = [r for r in await self.local.search(query, max_results) if r.get("coverage", 1.0) >= self.min_coverage]
+        if len(hits) >= self.min_hits:
+            print(f"🔍 [搜尋] 本地知識庫命中 {len(hits)} 篇，不使用網路搜尋")
+            return hits
+        try:
+            web_results = await self.web.search(query, max(1, max_results - len(hits)))
+        except Exception as e:
+            # 離線或被限流時，至少回傳本地結果
+            print(f"⚠️ 網路搜尋失敗，只使用本地知識庫：{e}")
+            web_results = []
+        return hits + web_results
+
+
+_backend: Optional[SearchBackend] = None
+
+
+def get_search_backend() -> SearchBackend:
+    """依 SEARCH_BACKEND 建立（並快取）搜尋後端。"""
+    global _backend
+    if _backend is None:
+        if SEARCH_BACKEND == "local":
+            _backend = LocalKBBackend(SEARCH_KB_DIR)
+        elif SEARCH_BACKEND == "ddgs":
+            _backend = DDGSBackend()
+        else:
+            if not os.path.isdir(SEARCH_KB_DIR):
+                # 仍包在 HybridBackend 裡：網路搜尋失敗時回傳空結果，而不是丟出例外
+                print(f"[SearchKB] {SEARCH_KB_DIR} not found, local knowledge base disabled.")
+            _backend = HybridBackend(LocalKBBackend(SEARCH_KB_DIR), DDGSBackend())
+    return _backend
+
+
+def set_search_backend(backend: Optional[SearchBackend]):
+    """替換搜尋後端（例如測試時改用固定文件的 LocalKBBackend）；傳入 None 則恢復依設定建立。"""
+    global _backend
+    _backend = backend
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .singleflight import normalize_text
+
+# ========= 搜尋快取設定 =========
+# 兩層快取（另外附帶單頁摘要），存在 SQLite，重啟後保留、多個 worker 共用：
+#   queries：正規化後的搜尋字串 → 搜尋結果（標題 / 網址）
+#   pages：網址 → 清理後的網頁文字（附 ETag / Last-Modified，過期後以條件式請求重新驗證）
+#   summaries：網址 + 內容雜湊 → 單頁摘要（map-reduce 摘要模式使用）
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "data/search_cache.sqlite3")
+SEARCH_CACHE_QUERY_TTL = float(os.getenv("SEARCH_CACHE_QUERY_TTL", str(24 * 3600)))
+SEARCH_CACHE_PAGE_TTL = float(os.getenv("SEARCH_CACHE_PAGE_TTL", str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX_QUERIES = int(os.getenv("SEARCH_CACHE_MAX_QUERIES", "2000"))
+SEARCH_CACHE_MAX_PAGES = int(os.getenv("SEARCH_CACHE_MAX_PAGES", "5000"))
+
+# 每寫入幾筆才檢查一次容量，避免每次都跑 COUNT(*)
+_EVICT_EVERY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queries_accessed ON queries(accessed);
+CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries(accessed);
+CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages(accessed);
+"""
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+_writes = 0
+_stats = {"query_hits": 0, "query_misses": 0, "page_hits": 0, "page_stale": 0, "page_misses": 0, "revalidated": 0, "summary_hits": 0, "summary_misses": 0}
+
+
+def _get_conn() -> Optional[sqlite3.Connection]:
+    global _conn, SEARCH_CACHE_ENABLED
+    if _conn is None and SEARCH_CACHE_ENABLED:
+        try:
+            directory = os.path.dirname(SEARCH_CACHE_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(SEARCH_CACHE_PATH, timeout=5.0, check_same_thread=False)
+            # WAL 讓多個 worker 可以同時讀、一個寫
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            _conn = conn
+            print(f"[SearchCache] Using {SEARCH_CACHE_PATH}")
+        except Exception as e:
+            print(f"WARNING: Search cache disabled, cannot open {SEARCH_CACHE_PATH}: {e}")
+            SEARCH_CACHE_ENABLED = False
+    return _conn
+
+
+def query_key(query: str, max_results: int, region: str) -> str:
+    return f"{region}\x00{max_results}\x00{normalize_text(query)}"
+
+
+def get_query(key: str) -> Optional[List[Dict[str, Any]]]:
+    """回傳未過期的搜尋結果，沒有則回傳 None。"""
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return None
+        now = time.time()
+        row = conn.execute("SELECT results, created FROM queries WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > SEARCH_CACHE_QUERY_TTL:
+            _stats["query_misses"] += 1
+            return None
+        conn.execute("UPDATE queries SET accessed = ? WHERE key = ?", (now, key))
+        conn.commit()
+        _stats["query_hits"] += 1
+    return json.loads(row[0])
+
+
+def put_query(key: str, results: List[Dict[str, Any]]):
+    if not results:
+        return
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO queries (key, results, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(results, ensure_ascii=False), now, now),
+        )
+        conn.commit()
+        _maybe_evict(conn)
+
+
+def get_page(url: str) -> Optional[Dict[str, Any]]:
+    """回傳 {"text", "etag", "last_modified", "fresh"}；沒有快取則回傳 None。
+
+    過期的項目仍會回傳（fresh=False），讓呼叫端用 ETag / Last-Modified 重新驗證。
+    """
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return None
+        now = time.time()
+        row = conn.execute(
+            "SELECT text, etag, last_modified, fetched FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            _stats["page_misses"] += 1
+            return None
+        fresh = now - row[3] <= SEARCH_CACHE_PAGE_TTL
+        _stats["page_hits" if fresh else "page_stale"] += 1
+        conn.execute("UPDATE pages SET accessed = ? WHERE url = ?", (now, url))
+        conn.commit()
+    return {"text": row[0], "etag": row[1], "last_modified": row[2], "fresh": fresh}
+
+
+def put_page(url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+    if not text:
+        return
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO pages (url, text, etag, last_modified, fetched, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (url, text, etag, last_modified, now, now),
+        )
+        conn.commit()
+        _maybe_evict(conn)
+
+
+def touch_page(url: str):
+    """伺服器回 304 Not Modified：沿用快取內容，重新計算 TTL。"""
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return
+        now = time.time()
+        conn.execute("UPDATE pages SET fetched = ?, accessed = ? WHERE url = ?", (now, now, url))
+        conn.commit()
+        _stats["revalidated"] += 1
+
+
+def summary_key(url: str, content: str) -> str:
+    return f"{url}\x00{hashlib.sha1(content.encode('utf-8')).hexdigest()}"
+
+
+def get_summary(key: str) -> Optional[str]:
+    """單頁摘要；內容雜湊相同就表示摘要仍然有效，TTL 與網頁相同。"""
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return None
+        now = time.time()
+        row = conn.execute("SELECT summary, created FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > SEARCH_CACHE_PAGE_TTL:
+            _stats["summary_misses"] += 1
+            return None
+        conn.execute("UPDATE summaries SET accessed = ? WHERE key = ?", (now, key))
+        conn.commit()
+        _stats["summary_hits"] += 1
+    return row[0]
+
+
+def put_summary(key: str, summary: str):
+    if not summary:
+        return
+    with _lock:
+        conn = _get_conn()
+        if conn is None:
+            return
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries (key, summary, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, summary, now, now),
+        )
+        conn.commit()
+        _maybe_evict(conn)
+
+
+def _maybe_evict(conn: sqlite3.Connection):
+    """依最後存取時間淘汰超出容量的項目（呼叫時需持有 _lock）。"""
+    global _writes
+    _writes += 1
+    if _writes % _EVICT_EVERY:
+        return
+    conn.execute("DELETE FROM queries WHERE created < ?", (time.time() - SEARCH_CACHE_QUERY_TTL,))
+    tables = (
+        ("queries", "key", SEARCH_CACHE_MAX_QUERIES),
+        ("pages", "url", SEARCH_CACHE_MAX_PAGES),
+        ("summaries", "key", SEARCH_CACHE_MAX_PAGES),
+    )
+    for table, key, limit in tables:
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if count > limit:
+            conn.execute(
+                f"DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} ORDER BY accessed ASC LIMIT ?)",
+                (count - limit,),
+            )
+    conn.commit()
+
+
+def search_cache_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"enabled": SEARCH_CACHE_ENABLED, "path": SEARCH_CACHE_PATH, **_stats}
+    with _lock:
+        conn = _get_conn()
+        if conn is not None:
+            stats["queries"] = conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+            stats["pages"] = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            stats["summaries"] = conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+    return stats
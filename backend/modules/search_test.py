@@ -1,16 +1,75 @@
 import os
 import re
 import asyncio
-import requests
-from bs4 import BeautifulSoup
-from ddgs import DDGS
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
 from openai import AsyncOpenAI
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .utils import extract_structured
-
-
-# 設定爬取內容長度限制 (避免超過 Context Window)
-MAX_CHARS_PER_PAGE = 3000
+from . import http_pool
+from . import search_cache
+from . import html_extract
+from . import passages
+from . import search_backends
+from .scheduler import AdmissionRejected
+from . import deadline
+from . import metrics
+from . import jobs
+
+
+# 每個網頁最多擷取的字數；實際送進 LLM 的內容由 passages.select_passages 依 token budget 挑選
+MAX_CHARS_PER_PAGE = int(os.getenv("SEARCH_MAX_CHARS_PER_PAGE", "12000"))
+# 摘要 prompt 中網頁內容的 token 上限
+SEARCH_CONTEXT_TOKEN_BUDGET = int(os.getenv("SEARCH_CONTEXT_TOKEN_BUDGET", "1500"))
+# 整個爬取階段的時間上限（秒），時間到就用已經抓到的頁面繼續摘要
+SEARCH_FETCH_DEADLINE = float(os.getenv("SEARCH_FETCH_DEADLINE", "6"))
+# 單一頁面的 timeout（秒）
+SEARCH_FETCH_TIMEOUT = float(os.getenv("SEARCH_FETCH_TIMEOUT", "5"))
+# 每個網頁最多下載的位元組數；正文通常在前面，收集到 MAX_CHARS_PER_PAGE 字就會提早停止
+SEARCH_MAX_PAGE_BYTES = int(os.getenv("SEARCH_MAX_PAGE_BYTES", str(512 * 1024)))
+# 同一個網站同時最多幾個請求
+SEARCH_PER_HOST_LIMIT = int(os.getenv("SEARCH_PER_HOST_LIMIT", "2"))
+# single：所有網頁段落放進一個摘要 prompt；map_reduce：每頁先各自摘要（可快取），再合併
+SEARCH_SUMMARY_MODE = os.getenv("SEARCH_SUMMARY_MODE", "single").lower()
+# map_reduce 模式下每頁送進摘要的 token 上限
+SEARCH_MAP_TOKEN_BUDGET = int(os.getenv("SEARCH_MAP_TOKEN_BUDGET", "600"))
+
+# 修改重點：Prompt 改為英文，並強制要求輸出繁體中文
+SUMMARY_SYSTEM_PROMPT = (
+    "You are a professional researcher. "
+    "Read the provided raw web data and extract the 3-5 most relevant key points "
+    "based on the user's question. Ignore ads and irrelevant noise. "
+    "IMPORTANT: You must output the final summary in Traditional Chinese (繁體中文)."
+)
+
+# 單頁摘要不放使用者問題，讓同一段內容的摘要可以跨問題重用
+PAGE_SUMMARY_PROMPT = (
+    "Summarize this single web page excerpt into at most 3 short factual bullet points. "
+    "Keep names, dates, places and Indigenous (especially Paiwan) terms. Ignore ads and navigation text. "
+    "Output in Traditional Chinese (繁體中文)."
+)
+
+# 有請求時間預算時，爬取最多只用掉剩餘時間的這個比例，其餘留給摘要
+SEARCH_FETCH_BUDGET_SHARE = 0.5
+
+# asyncio.Semaphore 綁定建立時的 event loop，所以每個 loop 各自一組（loop 結束後自動釋放）
+_host_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def _fetch_deadline() -> float:
+    budget = deadline.remaining()
+    if budget is None:
+        return SEARCH_FETCH_DEADLINE
+    return max(0.0, min(SEARCH_FETCH_DEADLINE, budget * SEARCH_FETCH_BUDGET_SHARE))
+
+
+def _degraded_summary(material: str, reason: Exception) -> str:
+    """時間預算不足、無法呼叫 LLM 摘要時，直接節錄找到的內容。"""
+    print(f"⚠️ [濃縮] 略過摘要：{reason}")
+    return "（時間不足，未能完成摘要，以下為搜尋到的內容節錄）\n" + material.strip()[:600]
 
 
 def _simplify_query(raw: str, fallback: str) -> str:
@@ -45,6 +104,101 @@ def _simplify_query(raw: str, fallback: str) -> str:
 
     return " ".join(filtered)
 
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc.lower()
+    loop = asyncio.get_running_loop()
+    per_loop = _host_semaphores.get(loop)
+    if per_loop is None:
+        per_loop = _host_semaphores[loop] = {}
+    sem = per_loop.get(host)
+    if sem is None:
+        sem = per_loop[host] = asyncio.Semaphore(SEARCH_PER_HOST_LIMIT)
+    return sem
+
+
+async def fetch_page(url: str, http_client: Optional[httpx.AsyncClient] = None) -> str:
+    """抓取單一網頁並轉成純文字；失敗時回傳空字串。
+
+    先查 search_cache：未過期直接使用；過期但有 ETag / Last-Modified 時送條件式請求，
+    伺服器回 304 就沿用快取內容。
+    """
+    http_client = http_client or http_pool.get_web_client()
+    cached = await asyncio.to_thread(search_cache.get_page, url)
+    if cached and cached["fresh"]:
+        return cached["text"]
+
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        async with _host_semaphore(url):
+            async with http_client.stream("GET", url, headers=headers, timeout=SEARCH_FETCH_TIMEOUT) as resp:
+                if resp.status_code == 304 and cached:
+                    await asyncio.to_thread(search_cache.touch_page, url)
+                    return cached["text"]
+                resp.raise_for_status()
+                if not html_extract.is_text_response(resp):
+                    print(f"⚠️ 略過非 HTML 內容 {url}: {resp.headers.get('Content-Type')}")
+                    return ""
+                # 邊下載邊解析，拿到足夠文字或達到位元組上限就關閉連線
+                text = await html_extract.stream_text(resp, SEARCH_MAX_PAGE_BYTES, MAX_CHARS_PER_PAGE)
+        await asyncio.to_thread(
+            search_cache.put_page, url, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        )
+        return text
+    except Exception as e:
+        print(f"⚠️ 無法讀取 {url}: {e}")
+        # 重新抓取失敗時，過期的快取內容仍比沒有好
+        return cached["text"] if cached else ""
+
+
+async def fetch_pages(
+    urls: List[str],
+    time_limit: Optional[float] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
+) -> List[str]:
+    """同時抓取多個網頁，回傳與 urls 同順序的內容。
+
+    超過 time_limit（秒，預設為 SEARCH_FETCH_DEADLINE 與請求剩餘預算的較小者）還沒完成的頁面
+    會被取消並以空字串表示。
+    """
+    if not urls:
+        return []
+    limit = _fetch_deadline() if time_limit is None else time_limit
+    start = time.perf_counter()
+    if limit <= 0:
+        print("⚠️ [爬取] 請求時間預算已用完，略過爬取。")
+        return [""] * len(urls)
+
+    with metrics.span("search_fetch") as s:
+        tasks = [asyncio.create_task(fetch_page(url, http_client)) for url in urls]
+        completed = 0
+
+        def _on_fetched(task: asyncio.Task):
+            # 非同步工作模式下回報「fetched 2/3」之類的進度
+            nonlocal completed
+            if not task.cancelled():
+                completed += 1
+                jobs.report("fetched", f"{completed}/{len(urls)}")
+
+        for task in tasks:
+            task.add_done_callback(_on_fetched)
+        done, pending = await asyncio.wait(tasks, timeout=limit)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            print(f"⚠️ [爬取] {len(pending)} 個頁面超過 {limit:.1f}s 未完成，略過。")
+            s["outcome"] = "partial"
+
+    contents = [task.result() if task in done else "" for task in tasks]
+    print(f"📄 [爬取] {sum(1 for c in contents if c)}/{len(urls)} 個頁面，耗時 {time.perf_counter() - start:.2f}s")
+    return contents
+
 # =========================================
 
 async def get_llm_decision_and_query(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]]):
@@ -134,64 +288,50 @@ async def extract_search_query(client: AsyncOpenAI, model_name: str, question: s
         print(f"⚠️ extract_search_query 失敗，改用原始問題：{e}")
         return question
 
-async def get_web_summary(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]], query: str, max_results: int = 3) -> Dict[str, Any]:
+async def get_web_summary(
+    client: AsyncOpenAI,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    query: str,
+    max_results: int = 3,
+    keywords: Optional[List[str]] = None,
+) -> Dict[str, Any]:
     """整合函式：執行 搜尋 -> 爬取 -> 濃縮 的完整流程。
 
     回傳：{"summary": str, "sources": List[{"title": str, "url": str}]}
     """
-    # 強制加上 "台灣" 關鍵字以確保結果相關性
-    if "台灣" not in query and "Taiwan" not in query:
-        query += " 台灣"
-
-    print(f"🔍 [搜尋] 正在 DuckDuckGo 查詢: {query} ...")
-    
-    # --- 1. 執行搜尋 (使用 to_thread 避免卡住) ---
-    def run_search():
-        results = []
-        with DDGS() as ddgs:
-            # 這裡的 ddgs.text 是同步的，所以包在函式裡跑
-            # region 設為台灣繁體，讓結果更偏向在地與華文內容
-            search_gen = ddgs.text(query, max_results=max_results, region="tw-tzh")
-            if search_gen:
-                for r in search_gen:
-                    results.append(r)
-        return results
-
-    # 在背景執行搜尋
-    search_results = await asyncio.to_thread(run_search)
+    # --- 1. 執行搜尋（本地知識庫 / DuckDuckGo，見 search_backends） ---
+    backend = search_backends.get_search_backend()
+    with metrics.span("search_query", backend=backend.name):
+        search_results = await backend.search(query, max_results)
+    jobs.report("searched", f"{len(search_results)} 筆結果（{backend.name}）")
 
     if not search_results:
         return {"summary": "搜尋無結果。", "sources": []}
 
-    # --- 2. 執行爬取 (依序爬取前 N 筆) ---
+    if SEARCH_SUMMARY_MODE == "map_reduce":
+        return await _map_reduce_summary(client, model_name, query, search_results, keywords)
+
+    # --- 2. 執行爬取 (同時爬取前 N 筆，整體有時間上限；本地文件已有內容，不需要爬取) ---
     aggregated_content = ""
     used_sources: List[Dict[str, str]] = []
-    
+
+    to_fetch = [res['href'] for res in search_results if not res.get("content")]
+    if to_fetch:
+        print(f"📄 [爬取] 同時讀取 {len(to_fetch)} 筆結果...")
+    fetched = iter(await fetch_pages(to_fetch))
+    contents = [res.get("content") or next(fetched) for res in search_results]
+
+    # 把網頁切成段落，以 BM25 對 query 與關鍵字排序，只保留 token budget 內最相關的段落
+    selected = passages.select_passages(contents, query, keywords, SEARCH_CONTEXT_TOKEN_BUDGET)
     for idx, res in enumerate(search_results):
+        if idx not in selected:
+            continue
         url = res['href']
         title = res['title']
-        print(f"📄 [爬取] 正在讀取第 {idx+1} 筆: {title}")
-
-        # 定義單一爬取動作 (同步程式碼)
-        def fetch_one():
-            try:
-                headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
-                resp = requests.get(url, headers=headers, timeout=5)
-                resp.raise_for_status()
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                for tag in soup(["script", "style", "nav", "footer", "iframe"]):
-                    tag.extract()
-                return soup.get_text(separator=' ', strip=True)[:MAX_CHARS_PER_PAGE]
-            except Exception as e:
-                print(f"⚠️ 無法讀取 {url}: {e}")
-                return ""
-
-        # 在背景執行爬取
-        content = await asyncio.to_thread(fetch_one)
-        
-        if content:
-            aggregated_content += f"\n=== 來源 {idx+1}: {title} ({url}) ===\n{content}\n"
-            used_sources.append({"title": title, "url": url})
+        body = "\n".join(selected[idx])
+        aggregated_content += f"\n=== 來源 {idx+1}: {title} ({url}) ===\n{body}\n"
+        used_sources.append({"title": title, "url": url, "source": res.get("source", "ddgs")})
 
     if not aggregated_content:
         print("⚠️ 無法從任何搜尋結果中提取有效文字。")
@@ -199,14 +339,9 @@ async def get_web_summary(client: AsyncOpenAI, model_name: str, messages: List[D
 
     # --- 3. 執行濃縮 (LLM) ---
     print("🧠 [濃縮] 正在整理資訊...")
+    jobs.report("summarizing")
     
-    # 修改重點：Prompt 改為英文，並強制要求輸出繁體中文
-    system_prompt = (
-        "You are a professional researcher. "
-        "Read the provided raw web data and extract the 3-5 most relevant key points "
-        "based on the user's question. Ignore ads and irrelevant noise. "
-        "IMPORTANT: You must output the final summary in Traditional Chinese (繁體中文)."
-    )
+    system_prompt = SUMMARY_SYSTEM_PROMPT
 
     user_prompt = f"""
     User Question: {query}
@@ -217,14 +352,18 @@ async def get_web_summary(client: AsyncOpenAI, model_name: str, messages: List[D
 
     # 使用 await 非同步呼叫 OpenAI
     # 設定 timeout=15.0 秒，若 vLLM 卡住則會拋出錯誤，讓 DualClient 捕獲並切換到下一個 client
-    response = await client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        timeout=10.0
-    )
+    try:
+        with metrics.span("summarization"):
+            response = await client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                timeout=10.0
+            )
+    except deadline.DeadlineExceeded as e:
+        return {"summary": _degraded_summary(aggregated_content, e), "sources": used_sources}
 
     raw_content = response.choices[0].message.content
     # 嘗試使用 extract_structured 清理可能被包裝的 JSON 或雜訊
@@ -233,6 +372,91 @@ async def get_web_summary(client: AsyncOpenAI, model_name: str, messages: List[D
     return {"summary": cleaned_reply, "sources": used_sources}
 
 
+async def _summarize_page(client: AsyncOpenAI, model_name: str, url: str, excerpt: str) -> str:
+    """單頁摘要（map）；以網址 + 內容雜湊快取。"""
+    key = search_cache.summary_key(url, excerpt)
+    cached = await asyncio.to_thread(search_cache.get_summary, key)
+    if cached:
+        return cached
+
+    with metrics.span("page_summarization"):
+        response = await client.chat.completions.create(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": PAGE_SUMMARY_PROMPT},
+                {"role": "user", "content": excerpt},
+            ],
+            temperature=0.2,
+            max_tokens=200,
+            timeout=8.0,
+        )
+    summary = (response.choices[0].message.content or "").strip()
+    await asyncio.to_thread(search_cache.put_summary, key, summary)
+    return summary
+
+
+async def _map_reduce_summary(
+    client: AsyncOpenAI,
+    model_name: str,
+    query: str,
+    search_results: List[Dict[str, Any]],
+    keywords: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """每個網頁抓到就立刻各自摘要（map，同時進行），最後用一個短 prompt 合併（reduce）。
+
+    單頁失敗或逾時只會少一個來源，不會拖垮整個摘要。
+    """
+
+    async def fetch_and_map(res: Dict[str, Any]) -> str:
+        content = res.get("content")
+        if not content:
+            with metrics.span("search_fetch"):
+                content = await asyncio.wait_for(fetch_page(res['href']), _fetch_deadline())
+        jobs.report("fetched", res['title'])
+        selected = passages.select_passages([content], query, keywords, SEARCH_MAP_TOKEN_BUDGET).get(0)
+        if not selected:
+            return ""
+        summary = await _summarize_page(client, model_name, res['href'], "\n".join(selected))
+        jobs.report("page_summarized", res['title'])
+        return summary
+
+    print(f"🧠 [濃縮] map-reduce：同時處理 {len(search_results)} 筆結果...")
+    outcomes = await asyncio.gather(*(fetch_and_map(res) for res in search_results), return_exceptions=True)
+
+    page_summaries = []
+    used_sources: List[Dict[str, str]] = []
+    for idx, (res, outcome) in enumerate(zip(search_results, outcomes)):
+        if isinstance(outcome, AdmissionRejected):
+            raise outcome
+        if isinstance(outcome, BaseException):
+            print(f"⚠️ 單頁摘要失敗 {res['href']}: {outcome!r}")
+            continue
+        if not outcome:
+            continue
+        page_summaries.append(f"=== 來源 {idx+1}: {res['title']} ===\n{outcome}")
+        used_sources.append({"title": res['title'], "url": res['href'], "source": res.get("source", "ddgs")})
+
+    if not page_summaries:
+        print("⚠️ 無法從任何搜尋結果中提取有效文字。")
+        return {"summary": "無法從搜尋結果中提取有效文字。", "sources": []}
+
+    jobs.report("summarizing", f"合併 {len(page_summaries)} 份單頁摘要")
+    try:
+        with metrics.span("summarization"):
+            response = await client.chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"User Question: {query}\n\n--- Page Summaries ---\n" + "\n\n".join(page_summaries)},
+                ],
+                timeout=10.0,
+            )
+    except deadline.DeadlineExceeded as e:
+        return {"summary": _degraded_summary("\n\n".join(page_summaries), e), "sources": used_sources}
+    cleaned_reply, _ = extract_structured(response.choices[0].message.content)
+    return {"summary": cleaned_reply, "sources": used_sources}
+
+
 async def process(client: AsyncOpenAI, model_name: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
     """整合入口：用於主系統 router 的搜尋模組。
 
@@ -280,13 +504,20 @@ async def process(client: AsyncOpenAI, model_name: str, messages: List[Dict[str,
         base_query = " ".join(matched_keywords)
 
     # 3. 呼叫 web 搜尋與摘要（不再額外附加長串關鍵字）
-    web_result = await get_web_summary(client, model_name, messages, base_query)
+    web_result = await get_web_summary(client, model_name, messages, base_query, keywords=matched_keywords)
     summary = web_result.get("summary", "")
     sources = web_result.get("sources", [])
 
     # 4. 依照現有 UI 格式回傳，並把實際使用到的來源網站列在 thinking 裡
+    used = {src.get("source") for src in sources}
+    if used == {"local"}:
+        via = "本地知識庫"
+    elif "local" in used:
+        via = "本地知識庫與 DuckDuckGo 網路搜尋"
+    else:
+        via = " DuckDuckGo 進行網路搜尋"
     thinking_lines = [
-        f"已針對「{user_question}」透過 DuckDuckGo 進行網路搜尋並整理重點。"
+        f"已針對「{user_question}」透過{via}並整理重點。"
         + ("（已針對原住民族／排灣族相關主題加強關鍵字。)" if is_indigenous_question else ""),
     ]
 
@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# ========= 伺服器端對話 session =========
+# 用戶端只送 session_id + 新訊息，完整歷史留在伺服器；每輪的請求大小與解析成本固定
+# 同時保留的 session 數，超過時淘汰最久沒用的（LRU）
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+# 閒置多久（秒）就過期
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# 每個 session 最多保留幾則訊息，超過時丟掉最舊的（更早的內容本來就會被折成滾動摘要）
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+
+
+class SessionNotFound(Exception):
+    """session 不存在或已過期；main.py 轉成 410，用戶端改送完整歷史重建。"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"session {session_id} not found or expired")
+        self.session_id = session_id
+
+
+class Session:
+    def __init__(self, session_id: Optional[str] = None, messages: Optional[List[Dict[str, str]]] = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.messages: List[Dict[str, str]] = []
+        # 由 messages 衍生、可以逐輪延伸的快取（例如 chat 模組包好 JSON 的歷史、前綴雜湊），
+        # 每個值都是與 messages 一一對應的 list；訊息被移除時同步刪掉對應的項目，不必重算。
+        # 前綴雜湊是從整段對話的開頭鏈下來的，丟掉開頭後剩下的雜湊不變，滾動摘要快取仍然命中
+        self.derived: Dict[str, List[Any]] = {}
+        # 同一個 session 的請求依序處理，避免兩輪交錯寫入歷史
+        self.lock = asyncio.Lock()
+        self.created = time.time()
+        self.last_used = self.created
+        for msg in messages or []:
+            self.append(msg["role"], msg["content"])
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        overflow = len(self.messages) - SESSION_MAX_MESSAGES
+        if overflow > 0:
+            del self.messages[:overflow]
+            for values in self.derived.values():
+                del values[:overflow]
+
+    def pop(self):
+        """移除最後一則訊息（該輪處理失敗時，把剛加入的 user 訊息撤回）。"""
+        if self.messages:
+            self.messages.pop()
+            for values in self.derived.values():
+                del values[len(self.messages):]
+
+
+_sessions: "OrderedDict[str, Session]" = OrderedDict()
+_current: contextvars.ContextVar[Optional[Session]] = contextvars.ContextVar("current_session", default=None)
+_stats = {"created": 0, "expired": 0, "evicted": 0, "not_found": 0}
+
+
+def _prune():
+    now = time.time()
+    # OrderedDict 依最後使用時間排序，最舊的在前面
+    while _sessions:
+        oldest = next(iter(_sessions.values()))
+        if now - oldest.last_used <= SESSION_IDLE_TTL:
+            break
+        _sessions.popitem(last=False)
+        _stats["expired"] += 1
+
+
+def get(session_id: str) -> Session:
+    _prune()
+    session = _sessions.get(session_id)
+    if session is None:
+        _stats["not_found"] += 1
+        raise SessionNotFound(session_id)
+    session.last_used = time.time()
+    _sessions.move_to_end(session_id)
+    return session
+
+
+def create(messages: Optional[List[Dict[str, str]]] = None) -> Session:
+    """建立新的 session；messages 可用來以用戶端保留的歷史重建。"""
+    _prune()
+    session = Session(messages=messages)
+    _sessions[session.id] = session
+    _stats["created"] += 1
+    while len(_sessions) > SESSION_MAX_SESSIONS:
+        _sessions.popitem(last=False)
+        _stats["evicted"] += 1
+    return session
+
+
+def exists(session_id: str) -> bool:
+    _prune()
+    return session_id in _sessions
+
+
+@contextmanager
+def use(session: Session):
+    """讓這個 context 內的模組可以取用 session 的衍生快取（見 current()）。"""
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
+
+
+def current(messages: Optional[List[Dict[str, str]]] = None) -> Optional[Session]:
+    """目前請求的 session；給了 messages 時，只有在它就是這個 session 的歷史時才回傳。"""
+    session = _current.get()
+    if session is None or messages is None:
+        return session
+    if len(messages) == len(session.messages) and (not messages or messages[-1] is session.messages[-1]):
+        return session
+    return None
+
+
+def sessions_stats() -> Dict[str, Any]:
+    _prune()
+    return {
+        **_stats,
+        "active": len(_sessions),
+        "max_sessions": SESSION_MAX_SESSIONS,
+        "idle_ttl": SESSION_IDLE_TTL,
+    }
@@ -0,0 +1,64 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """合併重複請求用的 key 正規化：去頭尾空白、合併空白、轉小寫。"""
+    return re.sub(r"\s+", " ", (text or "").strip()).lower()
+
+
+class SingleFlight:
+    """同一個 key 同時只跑一次計算，其餘呼叫等待並共用結果。
+
+    用於瀏覽器擴充功能多人同時選取同一段排灣語時，避免重複查詞與重複呼叫 LLM。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.folded = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.folded += 1
+
+        # shield：某個呼叫端斷線（被取消）時，不影響其他正在等待同一結果的呼叫
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "folded": self.folded,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+        }
+
+
+# /api/translate_simple 使用的共用實例
+translate_flight = SingleFlight("translate_simple")
+
+
+def translate_key(text: str, mode: str, direction: str) -> Tuple[str, str, str]:
+    return (normalize_text(text), mode, direction)
+
+
+def singleflight_stats() -> Dict[str, Any]:
+    return {translate_flight.name: translate_flight.stats()}
@@ -0,0 +1,120 @@
+import os
+from typing import Any, Dict, List, Optional
+
+# ========= 結構化輸出（guided decoding）設定 =========
+# off：維持原本的「prompt 要求 JSON + extract_structured 容錯解析」
+# auto：依 backend 自動偵測，先試 response_format（json_schema），不支援再試 vLLM 的 guided_json
+# response_format / guided_json：只使用指定的方式
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "off").lower()
+
+STRUCTURED_MODES = ("response_format", "guided_json")
+
+# chat / translator / recommender 共用的回覆格式
+REPLY_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "thinking": {"type": "string"},
+    },
+    "required": ["reply", "thinking"],
+    "additionalProperties": False,
+}
+
+# 標記在 completion 物件上的屬性名稱，值為實際使用的模式
+RESPONSE_MARKER = "paiwan_structured"
+
+# backend 名稱 → 已確認不支援的模式
+_unsupported: Dict[str, set] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def enabled() -> bool:
+    return STRUCTURED_OUTPUT in ("auto",) + STRUCTURED_MODES
+
+
+def request_kwargs(client: Any, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """給 chat.completions.create 的額外參數；只有 DualClient 認得 structured_schema。"""
+    if enabled() and getattr(client, "supports_structured", False):
+        return {"structured_schema": schema}
+    return {}
+
+
+def candidate_modes(backend: str, is_openai: bool = False) -> List[str]:
+    """這個 backend 接下來可以嘗試的模式（依偏好順序）。"""
+    if STRUCTURED_OUTPUT == "auto":
+        # guided_json 是 vLLM 專用參數，OpenAI 官方 API 不支援
+        modes = ["response_format"] if is_openai else list(STRUCTURED_MODES)
+    elif STRUCTURED_OUTPUT in STRUCTURED_MODES:
+        modes = [STRUCTURED_OUTPUT]
+    else:
+        return []
+    skip = _unsupported.get(backend, set())
+    return [m for m in modes if m not in skip]
+
+
+def apply(kwargs: Dict[str, Any], mode: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """回傳加上結構化輸出參數的 kwargs（不修改原本的 dict）。"""
+    out = dict(kwargs)
+    if mode == "response_format":
+        out["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "reply", "schema": schema, "strict": True},
+        }
+    elif mode == "guided_json":
+        extra_body = dict(out.get("extra_body") or {})
+        extra_body["guided_json"] = schema
+        out["extra_body"] = extra_body
+    return out
+
+
+# 錯誤訊息中出現這些字才視為「backend 不支援這個參數」
+_PARAM_HINTS = {
+    "response_format": ("response_format", "json_schema"),
+    "guided_json": ("guided_json", "guided_decoding"),
+}
+
+
+def is_unsupported_error(e: Exception) -> bool:
+    """backend 拒絕參數時會回 400 / 422；逾時、連線錯誤不算。"""
+    return getattr(e, "status_code", None) in (400, 422)
+
+
+def mark_unsupported(backend: str, mode: str, e: Exception):
+    """本次請求改用下一個模式；只有錯誤訊息明確指出該參數時才永久記住不支援，
+    其他 400 / 422（例如 prompt 過長）只影響這一次。"""
+    message = str(e).lower()
+    if not any(hint in message for hint in _PARAM_HINTS.get(mode, (mode,))):
+        _count(backend, "rejected")
+        print(f"WARNING: {backend} rejected structured output mode '{mode}' for this request: {e}")
+        return
+    _unsupported.setdefault(backend, set()).add(mode)
+    _count(backend, "unsupported")
+    print(f"WARNING: {backend} does not support structured output mode '{mode}': {e}")
+
+
+def mark_structured(response: Any, backend: str, mode: Optional[str]):
+    _count(backend, mode or "plain")
+    if mode:
+        try:
+            setattr(response, RESPONSE_MARKER, mode)
+        except Exception:
+            pass
+
+
+def is_structured(response: Any) -> bool:
+    return bool(getattr(response, RESPONSE_MARKER, None))
+
+
+def _count(backend: str, key: str):
+    bucket = _stats.setdefault(backend, {})
+    bucket[key] = bucket.get(key, 0) + 1
+
+
+def structured_stats() -> Dict[str, Any]:
+    return {
+        "mode": STRUCTURED_OUTPUT,
+        "backends": {
+            name: {**counts, "unsupported_modes": sorted(_unsupported.get(name, set()))}
+            for name, counts in _stats.items()
+        },
+    }
@@ -1,20 +1,30 @@
 import json
 import re
 import os
-from typing import List, Dict, Any, Optional
-
-import pandas as pd
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 
 from .utils import extract_structured
-from paiwan_translation_api_multi import MultiSourceTranslator, SOURCE_FILES, SourceEnum
+from . import structured
+from .scheduler import AdmissionRejected
+from . import lexicon
+from . import deadline
+from . import metrics
+from paiwan_lexicon import MultiSourceTranslator, SOURCE_FILES, SourceEnum, REVERSE_MAX_RESULTS, normalize_gloss
 
 # Initialize translator globally for this module
 # Assuming data directory is in the parent directory relative to this module or current working dir
 # We need to be careful about paths. Since we run from backend/, data/ should be accessible.
 translator_instance = None
 
+# 本地擷取排灣語片段的信心門檻，低於此值才呼叫 LLM 擷取
+EXTRACTION_CONFIDENCE_THRESHOLD = float(os.getenv("EXTRACTION_CONFIDENCE_THRESHOLD", "0.6"))
+# 請求剩餘時間少於此秒數時，略過 LLM 擷取（翻譯本身還需要一次 LLM 呼叫）
+EXTRACTION_MIN_BUDGET = 8.0
+
 # ====== Excel 精確對照表：formosan_pairs_paiwan.xlsx ======
 _excel_pairs_cache: Optional[Dict[str, str]] = None
+_load_lock = threading.RLock()
 
 def _normalize_paiwan_phrase(text: str) -> str:
     """將排灣語片段標準化，用來做精確比對。
@@ -41,14 +51,23 @@ def _load_excel_pairs() -> Dict[str, str]:
     if _excel_pairs_cache is not None:
         return _excel_pairs_cache
 
+    with _load_lock:
+        if _excel_pairs_cache is None:
+            _excel_pairs_cache = _read_excel_pairs()
+    return _excel_pairs_cache
+
+
+def _read_excel_pairs() -> Dict[str, str]:
     try:
         base_dir = os.path.dirname(os.path.dirname(__file__))  # backend/
         excel_path = os.path.join(base_dir, "data", "formosan_pairs_paiwan.xlsx")
 
         if not os.path.exists(excel_path):
             print(f"[TranslatorModule] Excel file not found: {excel_path}")
-            _excel_pairs_cache = {}
-            return _excel_pairs_cache
+            return {}
+
+        # pandas 很重（匯入約 0.4 秒），只在第一次查 Excel 時才載入
+        import pandas as pd
 
         df = pd.read_excel(excel_path)
 
@@ -68,14 +87,12 @@ def _load_excel_pairs() -> Dict[str, str]:
             # 若有重複 key，保留第一筆即可
             mapping.setdefault(key, ch)
 
-        _excel_pairs_cache = mapping
         print(f"[TranslatorModule] Loaded {len(mapping)} exact Paiwan pairs from Excel.")
-        return _excel_pairs_cache
+        return mapping
 
     except Exception as e:
         print(f"[TranslatorModule] Failed to load Excel pairs: {e}")
-        _excel_pairs_cache = {}
-        return _excel_pairs_cache
+        return {}
 
 
 def lookup_exact_from_excel(paiwan_text: str) -> Optional[str]:
@@ -92,10 +109,13 @@ def lookup_exact_from_excel(paiwan_text: str) -> Optional[str]:
 def get_translator():
     global translator_instance
     if translator_instance is None:
-        if not os.path.exists("data"):
-             print("Warning: 'data' directory not found. Dictionary loading might fail.")
-        translator_instance = MultiSourceTranslator(SOURCE_FILES)
-        print("[TranslatorModule] Dictionary initialized.")
+        # prepare() 可能在背景執行緒中第一次呼叫，避免重複載入字典
+        with _load_lock:
+            if translator_instance is None:
+                if not os.path.exists("data"):
+                     print("Warning: 'data' directory not found. Dictionary loading might fail.")
+                translator_instance = MultiSourceTranslator(SOURCE_FILES)
+                print("[TranslatorModule] Dictionary initialized.")
     return translator_instance
 
 def split_tokens(paiwan: str) -> List[str]:
@@ -143,9 +163,86 @@ def format_mapping_text(mapping_list: list[dict]) -> str:
         lines.append(f"- 排灣語：{e['token']} → 中文：{e['translation']}")
     return "\n".join(lines)
 
-async def process(client: Any, model_name: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
-    """
-    Handle translation from Paiwan language to Traditional Chinese using RAG (Dictionary Lookup).
+# ====== 翻譯 prompt ======
+# 修改 TRANSLATOR_SYSTEM_PROMPT 時請一併更新版本號，方便比對 prefix cache 命中率與輸出品質
+TRANSLATOR_PROMPT_VERSION = "v2"
+
+# "prefix"：靜態 system prompt + 動態 user 訊息（預設）
+# "legacy"：舊版，把詞彙對照插在 system prompt 中間（僅供 bench/prompt_layout.py 比較）
+TRANSLATOR_PROMPT_LAYOUT = os.getenv("TRANSLATOR_PROMPT_LAYOUT", "prefix").lower()
+
+TRANSLATOR_SYSTEM_PROMPT = (
+    "你是一個排灣語的翻譯專家，而排灣語屬於VSO（動詞–主語–受語）語序。\n"
+    "使用者會提供一個排灣語片段的「詞彙對照」列表與原文，請你根據每個「排灣語詞 → 對應中文」的 mapping，組成一個完整且最通順的中文句子。\n"
+    "如果你覺得改變詞語順序、又或是刪除排列能更通暢，那你可以改變，目標就是將他組成正常對話的句子。\n\n"
+    "排灣族的文法補充:\n"
+    "排灣族存在複合詞 複合詞為具有意義的兩個詞素緊密結合成一個新詞。兩個詞組合成為新詞,中間會有一個標記,可能是a或是na,標記上我們會叫他[虛]。\n\n"
+    "請總是回傳嚴格的 JSON 格式，包含 `reply` (最終完整譯文) 和 `thinking` (翻譯過程與文法分析)。"
+)
+
+
+def build_translation_messages(paiwan_text: str, formatted_text: str, layout: Optional[str] = None) -> List[Dict[str, str]]:
+    """組出翻譯用的 LLM 訊息。"""
+    layout = (layout or TRANSLATOR_PROMPT_LAYOUT).lower()
+    if layout == "legacy":
+        system_prompt = (
+            "你是一個排灣語的翻譯專家，而排灣語屬於VSO（動詞–主語–受語）語序。\n"
+            "以下有一個排灣語片段的「詞彙對照」列表，請你根據每個「排灣語詞 → 對應中文」的 mapping，組成一個完整且最通順的中文句子。\n"
+            "如果你覺得改變詞語順序、又或是刪除排列能更通暢，那你可以改變，目標就是將他組成正常對話的句子。\n\n"
+            "詞彙對照：\n"
+            f"{formatted_text}\n\n"
+            "排灣族的文法補充:\n"
+            "排灣族存在複合詞 複合詞為具有意義的兩個詞素緊密結合成一個新詞。兩個詞組合成為新詞,中間會有一個標記,可能是a或是na,標記上我們會叫他[虛]。\n\n"
+            "請總是回傳嚴格的 JSON 格式，包含 `reply` (最終完整譯文) 和 `thinking` (翻譯過程與文法分析)。"
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"原文: {paiwan_text}"},
+        ]
+
+    # We construct a new message list for the LLM, focusing on this specific translation task
+    # We don't necessarily need the full chat history here, as we are doing a specific RAG task
+    return [
+        {"role": "system", "content": TRANSLATOR_SYSTEM_PROMPT},
+        {"role": "user", "content": f"詞彙對照：\n{formatted_text}\n\n原文: {paiwan_text}"},
+    ]
+
+
+def _local_extract(user_input: str) -> Tuple[str, bool]:
+    """回傳 (排灣語片段, 是否需要改用 LLM 擷取)。"""
+    # Simple heuristic: if input contains Chinese, extract the Paiwan span.
+    # 先用本地字典 / 拼寫特徵擷取，只有信心不足時才呼叫 LLM。
+    if re.search(r'[\u4e00-\u9fff]', user_input):
+        with metrics.span("extraction_local"):
+            span, confidence = lexicon.extract_paiwan_span(user_input)
+        if span and confidence >= EXTRACTION_CONFIDENCE_THRESHOLD:
+            print(f"[Translator] Local extraction: {span} (confidence={confidence})")
+            return span, False
+        return user_input, True
+    return user_input, False
+
+
+def _lookup(paiwan_text: str) -> Dict[str, Any]:
+    """Excel 精確對照 + 切詞查字典（純本地、無副作用）。"""
+    with metrics.span("excel_lookup"):
+        exact_ch = lookup_exact_from_excel(paiwan_text)
+    if exact_ch:
+        return {"exact_ch": exact_ch}
+
+    with metrics.span("dictionary_lookup"):
+        tokens = split_tokens(paiwan_text)
+        mapping_list = build_mapping_list(tokens)
+        formatted_text = format_mapping_text(mapping_list)
+    return {"exact_ch": None, "formatted_text": formatted_text}
+
+
+def prepare(messages: List[Dict[str, str]], detect_direction: bool = False) -> Dict[str, Any]:
+    """翻譯流程中不需要 LLM 的前置工作：取出使用者輸入、本地擷取、查 Excel 與字典。
+
+    沒有副作用，可以在意圖分類還沒完成前先在背景執行（見 main.py 的 speculative 模式），
+    結果再透過 process(..., prework=...) 傳回來。
+    detect_direction=True（/chat 使用）時，從文字判斷是否為中文 -> 排灣語的請求；
+    API 已明確指定方向時不做這個判斷。
     """
     # 1. Extract the latest user message (the text to translate)
     user_input = ""
@@ -153,14 +250,63 @@ async def process(client: Any, model_name: str, messages: List[Dict[str, str]])
         if msg["role"] == "user":
             user_input = msg["content"]
             break
+
+    work: Dict[str, Any] = {"user_input": user_input}
+    if not user_input:
+        return work
+
+    # 中文 -> 排灣語的請求（例如「謝謝用排灣語怎麼說」）改查反向索引
+    if detect_direction and lexicon.is_zh2paiwan_request(user_input):
+        return prepare_reverse(lexicon.zh2paiwan_source(user_input))
+
+    # 1.5 Extract Paiwan text from user input
+    paiwan_text, needs_llm_extraction = _local_extract(user_input)
+    work["paiwan_text"] = paiwan_text
+    work["needs_llm_extraction"] = needs_llm_extraction
+
+    # 需要 LLM 擷取時，查詞要等擷取結果出來才做
+    if not needs_llm_extraction:
+        work.update(_lookup(paiwan_text))
+    return work
+
+
+def exact_reply(work: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """prepare() 的結果若命中 Excel 精確對照，回傳最終答案；否則回傳 None。"""
+    exact_ch = work.get("exact_ch")
+    if not exact_ch:
+        return None
+    thinking = (
+        "已從 formosan_pairs_paiwan.xlsx 命中精確對照，"
+        f"排灣語：{work.get('paiwan_text', '')} → 中文：{exact_ch}"
+    )
+    return {
+        "reply": exact_ch,
+        "thinking": thinking,
+    }
+
+
+async def process(
+    client: Any,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    prework: Optional[Dict[str, Any]] = None,
+    detect_direction: bool = False,
+) -> Dict[str, Any]:
+    """
+    Handle translation from Paiwan language to Traditional Chinese using RAG (Dictionary Lookup).
+
+    prework：prepare() 預先算好的結果；沒有提供時在這裡同步計算（detect_direction 同 prepare()）。
+    """
+    work = dict(prework) if prework is not None else prepare(messages, detect_direction)
+    if work.get("direction") == "zh2paiwan":
+        return await process_reverse(client, model_name, work["zh_text"], prework=work)
+    user_input = work.get("user_input", "")
     
     if not user_input:
         return {"reply": "沒有收到需要翻譯的文字。", "thinking": "No user input found."}
 
-    # 1.5 Extract Paiwan text from user input
-    paiwan_text = user_input
-    # Simple heuristic: if input contains Chinese, ask LLM to extract Paiwan.
-    if re.search(r'[\u4e00-\u9fff]', user_input):
+    paiwan_text = work["paiwan_text"]
+    if work.get("needs_llm_extraction"):
         extraction_sys_prompt = (
             "你是一個語言辨識專家。使用者的輸入可能包含中文指令和排灣語句子。\n"
             "請擷取輸入中的「排灣語」部分。\n"
@@ -171,73 +317,73 @@ async def process(client: Any, model_name: str, messages: List[Dict[str, str]])
             "輸出：kikai\n\n"
             "請只輸出排灣語的部分，不要包含其他文字。"
         )
-        try:
-            ext_resp = await client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": extraction_sys_prompt},
-                    {"role": "user", "content": user_input}
-                ],
-                temperature=0.1,
-                max_tokens=256
-            )
-            extracted = ext_resp.choices[0].message.content.strip()
-            extracted = extracted.strip('"').strip("'")
-            if extracted:
-                paiwan_text = extracted
-        except Exception as e:
-            print(f"[Translator] Extraction failed: {e}")
-            paiwan_text = user_input
+        if deadline.expired(EXTRACTION_MIN_BUDGET):
+            # 剩餘時間不夠再多一次 LLM 呼叫：改用本地擷取結果（即使信心較低）
+            span, _confidence = lexicon.extract_paiwan_span(user_input)
+            paiwan_text = span or user_input
+            print(f"[Translator] Low time budget, skipping LLM extraction: {paiwan_text}")
+        else:
+            try:
+                with metrics.span("extraction_llm"):
+                    ext_resp = await client.chat.completions.create(
+                        model=model_name,
+                        messages=[
+                            {"role": "system", "content": extraction_sys_prompt},
+                            {"role": "user", "content": user_input}
+                        ],
+                        temperature=0.1,
+                        max_tokens=256
+                    )
+                extracted = ext_resp.choices[0].message.content.strip()
+                extracted = extracted.strip('"').strip("'")
+                if extracted:
+                    paiwan_text = extracted
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                print(f"[Translator] Extraction failed: {e}")
+                paiwan_text = user_input
+        work.update(_lookup(paiwan_text))
+
+    work["paiwan_text"] = paiwan_text
 
     # 1.6 先查 Excel 精確對照表，若有命中就直接回傳
-    exact_ch = lookup_exact_from_excel(paiwan_text)
-    if exact_ch:
-        thinking = (
-            "已從 formosan_pairs_paiwan.xlsx 命中精確對照，"
-            f"排灣語：{paiwan_text} → 中文：{exact_ch}"
-        )
-        return {
-            "reply": exact_ch,
-            "thinking": thinking,
-        }
+    exact = exact_reply(work)
+    if exact:
+        return exact
 
-    # 2. Tokenize and Lookup Dictionary
-    tokens = split_tokens(paiwan_text)
-    mapping_list = build_mapping_list(tokens)
-    formatted_text = format_mapping_text(mapping_list)
+    # 2. Tokenize and Lookup Dictionary（已在 _lookup 完成）
+    formatted_text = work["formatted_text"]
 
     # 3. Build Prompt with Dictionary Context
-    system_prompt = (
-        "你是一個排灣語的翻譯專家，而排灣語屬於VSO（動詞–主語–受語）語序。\n"
-        "以下有一個排灣語片段的「詞彙對照」列表，請你根據每個「排灣語詞 → 對應中文」的 mapping，組成一個完整且最通順的中文句子。\n"
-        "如果你覺得改變詞語順序、又或是刪除排列能更通暢，那你可以改變，目標就是將他組成正常對話的句子。\n\n"
-        "詞彙對照：\n"
-        f"{formatted_text}\n\n"
-        "排灣族的文法補充:\n"
-        "排灣族存在複合詞 複合詞為具有意義的兩個詞素緊密結合成一個新詞。兩個詞組合成為新詞,中間會有一個標記,可能是a或是na,標記上我們會叫他[虛]。\n\n"
-        "請總是回傳嚴格的 JSON 格式，包含 `reply` (最終完整譯文) 和 `thinking` (翻譯過程與文法分析)。"
-    )
-    
-    # We construct a new message list for the LLM, focusing on this specific translation task
-    # We don't necessarily need the full chat history here, as we are doing a specific RAG task
-    llm_messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"原文: {paiwan_text}"}
-    ]
+    # 靜態指令放在最前面、每次請求不同的詞彙對照放在 user 訊息，讓 vLLM prefix caching 可以重用
+    llm_messages = build_translation_messages(paiwan_text, formatted_text)
 
+    return await _compose_with_llm(client, model_name, llm_messages, formatted_text)
+
+
+async def _compose_with_llm(
+    client: Any,
+    model_name: str,
+    llm_messages: List[Dict[str, str]],
+    formatted_text: str,
+) -> Dict[str, Any]:
+    """依詞彙對照請 LLM 組成完整譯文；時間預算用完時退回逐詞查詢結果。"""
     try:
         # Use the dual client passed in
-        completion = await client.chat.completions.create(
-            model=model_name,
-            messages=llm_messages,
-            temperature=0.7, # Slightly higher temp for fluent sentence construction
-            timeout=30.0,
-            max_tokens=1024,
-        )
+        with metrics.span("translation_llm"):
+            completion = await client.chat.completions.create(
+                model=model_name,
+                messages=llm_messages,
+                temperature=0.7, # Slightly higher temp for fluent sentence construction
+                timeout=30.0,
+                max_tokens=1024,
+                **structured.request_kwargs(client, structured.REPLY_SCHEMA),
+            )
         
         raw_content = completion.choices[0].message.content
         
-        reply, thinking = extract_structured(raw_content)
+        reply, thinking = extract_structured(raw_content, structured.is_structured(completion))
         
         # If thinking is empty, we can fill it with the dictionary mapping for transparency
         if not thinking:
@@ -248,8 +394,97 @@ async def process(client: Any, model_name: str, messages: List[Dict[str, str]])
             "thinking": thinking
         }
             
+    except AdmissionRejected:
+        raise
     except Exception as e:
+        if isinstance(e, deadline.DeadlineExceeded) or deadline.expired(deadline.MIN_STAGE_SECONDS):
+            # 時間預算用完：至少回傳逐詞查字典的結果
+            return {
+                "reply": f"（時間不足，僅提供逐詞查詢結果）\n{formatted_text}",
+                "thinking": f"Deadline exceeded: {e}",
+            }
         return {
             "reply": "抱歉，翻譯系統暫時無法回應。",
             "thinking": str(e)
         }
+
+
+# ====== 中文 -> 排灣語（反向翻譯） ======
+# 以字典反向索引逐詞查出排灣語詞條，再請 LLM 只用這些詞條依排灣語語序組句
+REVERSE_SYSTEM_PROMPT = (
+    "你是一個排灣語的翻譯專家，而排灣語屬於VSO（動詞–主語–受語）語序。\n"
+    "使用者會提供一段中文與「詞彙對照」列表（每個中文詞 → 字典中的排灣語詞條，可信度高的在前），"
+    "請只使用列表中的排灣語詞條，依排灣語語序組成一個排灣語句子。\n"
+    "字典中沒有的詞請保留中文並在 thinking 中說明，不要自行創造排灣語單字。\n\n"
+    "請總是回傳嚴格的 JSON 格式，包含 `reply` (排灣語譯文) 和 `thinking` (選詞與語序說明)。"
+)
+
+
+def build_reverse_mapping(zh_text: str) -> List[dict]:
+    """中文切詞後逐詞查反向索引：[{"token": 中文詞, "candidates": [排灣語, ...]}, ...]。"""
+    translator = get_translator()
+    mapping_list = []
+    for tok in translator.segment_chinese(zh_text):
+        hits = translator.reverse_lookup(tok)
+        mapping_list.append({"token": tok, "candidates": [pw for pw, _score, _src in hits]})
+    return mapping_list
+
+
+def format_reverse_mapping(mapping_list: List[dict]) -> str:
+    lines = []
+    for e in mapping_list:
+        candidates = " / ".join(e["candidates"]) if e["candidates"] else "（字典中沒有）"
+        lines.append(f"- 中文：{e['token']} → 排灣語：{candidates}")
+    return "\n".join(lines)
+
+
+def prepare_reverse(zh_text: str) -> Dict[str, Any]:
+    """中文 -> 排灣語的本地前置工作：整段就是字典釋義時直接取得詞條，否則切詞查反向索引。"""
+    zh_text = (zh_text or "").strip()
+    work: Dict[str, Any] = {"direction": "zh2paiwan", "user_input": zh_text, "zh_text": zh_text}
+    if not zh_text:
+        return work
+    with metrics.span("dictionary_lookup"):
+        translator = get_translator()
+        hits = translator.reverse_exact.get(normalize_gloss(zh_text))
+        if hits:
+            work["exact_hits"] = hits[:REVERSE_MAX_RESULTS]
+        else:
+            work["formatted_text"] = format_reverse_mapping(build_reverse_mapping(zh_text))
+    return work
+
+
+def reverse_reply(work: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """prepare_reverse() 的結果若整段就是字典釋義，回傳排灣語詞條作為答案；否則回傳 None。"""
+    hits = work.get("exact_hits")
+    if not hits:
+        return None
+    lines = [f"- {pw}（{src}，{score:.2f}）" for pw, score, src in hits]
+    return {
+        "reply": hits[0][0],
+        "thinking": f"字典中「{work['zh_text']}」對應的排灣語詞條（依來源權重排序）：\n" + "\n".join(lines),
+    }
+
+
+async def process_reverse(
+    client: Any,
+    model_name: str,
+    zh_text: str,
+    prework: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """中文翻成排灣語：單詞直接回傳字典詞條，句子則以逐詞查詢結果請 LLM 組句。"""
+    work = dict(prework) if prework is not None else prepare_reverse(zh_text)
+    zh_text = work.get("zh_text", "")
+    if not zh_text:
+        return {"reply": "沒有收到需要翻譯的文字。", "thinking": "No user input found."}
+
+    local = reverse_reply(work)
+    if local:
+        return local
+
+    formatted_text = work["formatted_text"]
+    llm_messages = [
+        {"role": "system", "content": REVERSE_SYSTEM_PROMPT},
+        {"role": "user", "content": f"詞彙對照：\n{formatted_text}\n\n中文原文: {zh_text}"},
+    ]
+    return await _compose_with_llm(client, model_name, llm_messages, formatted_text)
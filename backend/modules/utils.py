@@ -1,55 +1,71 @@
 import json
 import re
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
-def extract_structured(text: str) -> Tuple[str, Optional[str]]:
-    """
-    Best-effort extraction of reply/thinking fields from LLM output.
-    Handles Markdown code blocks, partial JSON, and regex fallback.
-    """
-    clean_content = text.strip()
-
-    # Remove ```json ... ``` or ``` ... ``` wrappers
+def strip_code_fence(text: str) -> str:
+    """去掉 ```json ... ``` 或 ``` ... ``` 外框（沒有正確結尾時取第一行之後的內容）。"""
+    clean_content = (text or "").strip()
     if clean_content.startswith("```"):
         # Find the first newline to skip the language identifier (e.g., ```json)
         first_newline = clean_content.find("\n")
         if first_newline != -1:
-            # Check if it ends with ```
             if clean_content.endswith("```"):
-                clean_content = clean_content[first_newline+1:-3].strip()
+                clean_content = clean_content[first_newline + 1:-3].strip()
             else:
                 # Maybe it didn't close properly, just take from newline
-                clean_content = clean_content[first_newline+1:].strip()
+                clean_content = clean_content[first_newline + 1:].strip()
+    return clean_content
 
-    # Helper to try parsing JSON
-    def try_parse_json(candidate: str):
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """從 LLM 輸出中找出 JSON 物件：先整段解析，再試第一個 { 到最後一個 }，最後試最後一個 {...}。"""
+    candidates = [text]
+    if "{" in text and "}" in text:
+        candidates.append(text[text.find("{"): text.rfind("}") + 1])
+        candidates.append(text[text.rfind("{"): text.rfind("}") + 1])
+    for candidate in candidates:
+        if not candidate:
+            continue
         try:
             parsed = json.loads(candidate)
-            if isinstance(parsed, dict):
-                return (
-                    str(parsed.get("reply") or "").strip(),
-                    str(parsed.get("thinking") or "").strip(),
-                )
         except json.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+def extract_structured(text: str, structured: bool = False) -> Tuple[str, Optional[str]]:
+    """
+    Best-effort extraction of reply/thinking fields from LLM output.
+    Handles Markdown code blocks, partial JSON, and regex fallback.
+
+    structured=True 表示輸出經過 guided decoding（保證符合 schema），只解析一次；
+    萬一失敗（例如被 max_tokens 截斷）才走下面的容錯流程。
+    """
+    if structured:
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, dict) and "reply" in parsed:
+                reply = str(parsed.get("reply") or "").strip()
+                thinking = str(parsed.get("thinking") or "").strip()
+                return reply, thinking or None
+        except (json.JSONDecodeError, TypeError):
             pass
-        return None
-
-    # 1) Try parsing the cleaned content directly
-    result = try_parse_json(clean_content)
-    if result:
-        return result[0] or text, result[1] or None
-
-    # 2) Try to find the last JSON object {...}
-    if "{" in clean_content and "}" in clean_content:
-        last_open = clean_content.rfind("{")
-        last_close = clean_content.rfind("}")
-        if last_close > last_open:
-            maybe_json = clean_content[last_open : last_close + 1]
-            result = try_parse_json(maybe_json)
-            if result:
-                return result[0] or text, result[1] or None
-
-    # 3) Regex fallback
+
+    clean_content = strip_code_fence(text)
+
+    parsed = parse_json_object(clean_content)
+    if parsed is not None:
+        reply = str(parsed.get("reply") or "").strip()
+        thinking = str(parsed.get("thinking") or "").strip()
+        if "reply" in parsed:
+            # 模型明確回了空的 reply：照實回傳，不把整段 JSON 當成回覆
+            return reply, thinking or None
+        # 沒有 reply 欄位（例如只有 intent / thinking）：退回清理過的原文，避免空白回覆
+        return clean_content, thinking or None
+
+    # Regex fallback
     # This is a bit fragile for nested quotes but works for simple cases
     reply_match = re.search(r'"reply"\s*:\s*"([^"]+)"', clean_content)
     thinking_match = re.search(r'"thinking"\s*:\s*"([^"]+)"', clean_content)
@@ -0,0 +1,354 @@
+"""排灣語多來源字典（MultiSourceTranslator）。
+
+不依賴 FastAPI，可以單獨匯入；paiwan_translation_api_multi.py 是包在外面的 web API，
+並從這裡重新匯出這些名稱。fuzzywuzzy 在第一次模糊比對時才載入。
+載入時同時建立中文 → 排灣語的反向索引（reverse_lookup / segment_chinese）。
+"""
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List, Set, Tuple, Optional
+from enum import Enum
+from collections import Counter, defaultdict
+
+
+# ========= 基本設定 =========
+# 你可以改這裡來指定實體檔案位置
+DATA_DIR = os.environ.get("PAIWAN_DATA_DIR", "data")
+
+SOURCE_FILES = {
+    "qianzi": os.path.join(DATA_DIR, "千字表(東排灣語).json"),
+    "jiaocai": os.path.join(DATA_DIR, "教材_paiwan_words.json"),
+    "bihua":  os.path.join(DATA_DIR, "華語筆畫字典.json"),
+}
+
+# 合併時的優先級（數字愈大優先）
+SOURCE_WEIGHTS = {
+    "jiaocai": 1.0,
+    "qianzi": 0.9,
+    "bihua":  0.7,
+}
+
+# 模糊匹配門檻與保護條件
+FUZZ_THRESHOLD = 85
+MAX_LEN_GAP = 3           # 與查詢詞的長度差距限制（防暴衝誤配）
+MAX_CANDIDATES_PER_SRC = 8  # 每個來源最多保留的模糊候選
+
+# 反向（中文 → 排灣語）查詢
+REVERSE_MAX_RESULTS = 5         # 每個中文詞最多回傳的排灣語詞條
+REVERSE_SEGMENT_PENALTY = 0.8   # 多義釋義（例如「一；一粒；一個」）中的單一片段，可信度打折
+REVERSE_MIN_SIMILARITY = 0.5    # 片段查不到時，字元 bigram 的 Jaccard 相似度門檻
+REVERSE_MAX_SEGMENT_LEN = 8     # 中文切詞時最長嘗試比對的字數
+# 單獨出現時不查字典的虛詞（仍可作為較長詞的一部分被比對到）
+ZH_PARTICLES = set("的了嗎呢吧啊呀喔哦嘛")
+
+# ========= 資料來源 =========
+class SourceEnum(str, Enum):
+    qianzi = "qianzi"
+    jiaocai = "jiaocai"
+    bihua = "bihua"
+    all = "all"
+
+# ========= 工具 =========
+def normalize_token(s: str) -> str:
+    # 基本歸一化（小寫、去除空白/常見分隔）
+    s = s.strip().lower()
+    s = re.sub(r"[ \t\r\n·、，,；;．.]", "", s)
+    return s
+
+_GLOSS_MARKER_RE = re.compile(r"\[[^\]]*\]")   # [主]、[虛] 等語法標記
+_GLOSS_SPLIT_RE = re.compile(r"[;；、,，/／:：()（）｢｣「」『』“”\"'!！?？。.…\s]+")
+_CJK_RUN_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def normalize_gloss(s: str) -> str:
+    # 教材資料中有些字是康熙部首字元（例如「⼦」），以 NFKC 轉成一般漢字才查得到
+    return unicodedata.normalize("NFKC", s).strip()
+
+
+def split_gloss(gloss: str) -> List[str]:
+    """把一筆中文釋義切成可查詢的片段，例如「一；一粒；一個」→ ["一", "一粒", "一個"]。"""
+    gloss = _GLOSS_MARKER_RE.sub(" ", normalize_gloss(gloss))
+    return [seg for seg in _GLOSS_SPLIT_RE.split(gloss) if _CJK_RUN_RE.search(seg)]
+
+
+def char_ngrams(s: str) -> Set[str]:
+    """字元 bigram；單一字就用字本身。"""
+    if len(s) <= 1:
+        return {s} if s else set()
+    return {s[i:i + 2] for i in range(len(s) - 1)}
+
+
+# ========= 多來源翻譯器 =========
+class MultiSourceTranslator:
+    def __init__(self, sources: Dict[str, str]):
+        """
+        sources: {source_name: file_path}
+        """
+        self.sources = sources
+        self.dicts: Dict[str, Dict[str, List[str]]] = {}          # 每個來源的 {paiwan: [chinese,...]}
+        self.norm_keys: Dict[str, Dict[str, str]] = {}            # 每個來源的 {normalized_paiwan: original_paiwan}
+        # 反向索引：{中文釋義片段: [(paiwan, score, source), ...]}（高分在前）
+        self.reverse_exact: Dict[str, List[Tuple[str, float, str]]] = {}
+        # 片段的字元 bigram → 片段編號（對應 reverse_keys），給查不到片段時的相似度比對
+        self.reverse_keys: List[str] = []
+        self.reverse_grams: List[Set[str]] = []
+        self.reverse_postings: Dict[str, List[int]] = {}
+        self.reverse_max_len = 1
+        self.load_all()
+
+    def load_one(self, src_name: str, file_path: str) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+        mapping: Dict[str, List[str]] = defaultdict(list)
+        norm_map: Dict[str, str] = {}
+
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            raise RuntimeError(f"載入來源 {src_name} 失敗：{file_path} ({e})")
+
+        # 支援兩種形態：[{paiwan, chinese}, ...] 或 [{paiwan, chinese:[...]}, ...]
+        for row in data:
+            pw = (row.get("paiwan") or "").strip()
+            zh = row.get("chinese")
+            if not pw or zh is None:
+                continue
+
+            # 統一成 list
+            zh_list = zh if isinstance(zh, list) else [zh]
+
+            # 過濾無效項
+            cleaned = [z.strip() for z in zh_list
+                       if isinstance(z, str) and z.strip() and z.strip() not in ("[虛]", "[虛")]
+            if not cleaned:
+                continue
+
+            if pw not in mapping:
+                mapping[pw] = []
+
+            # 去重、保持插入順序
+            seen = set(mapping[pw])
+            for z in cleaned:
+                if z not in seen:
+                    mapping[pw].append(z)
+                    seen.add(z)
+
+        # 準備 normalized 鍵
+        for k in mapping.keys():
+            nk = normalize_token(k)
+            # 若不同原字詞歸一化後碰撞，只保留第一個
+            norm_map.setdefault(nk, k)
+
+        return mapping, norm_map
+
+    def load_all(self):
+        for name, path in self.sources.items():
+            m, norm = self.load_one(name, path)
+            self.dicts[name] = m
+            self.norm_keys[name] = norm
+        self.build_reverse_index()
+
+    def build_reverse_index(self):
+        """由各來源的中文釋義建立中文 → 排灣語索引，分數 = 來源權重（多義釋義的片段再打折）。"""
+        best: Dict[str, Dict[str, Tuple[float, str]]] = defaultdict(dict)
+        for src, mapping in self.dicts.items():
+            weight = SOURCE_WEIGHTS.get(src, 0.5)
+            for pw, zh_list in mapping.items():
+                for zh in zh_list:
+                    segments = split_gloss(zh)
+                    score = weight * (1.0 if len(segments) == 1 else REVERSE_SEGMENT_PENALTY)
+                    for seg in segments:
+                        prev = best[seg].get(pw)
+                        if prev is None or score > prev[0]:
+                            best[seg][pw] = (score, src)
+
+        # 同分時短的詞條在前（單詞優先於片語）
+        self.reverse_exact = {
+            seg: sorted(((pw, sc, src) for pw, (sc, src) in cands.items()), key=lambda x: (-x[1], len(x[0])))
+            for seg, cands in best.items()
+        }
+        self.reverse_keys = list(self.reverse_exact.keys())
+        self.reverse_grams = [char_ngrams(k) for k in self.reverse_keys]
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for i, grams in enumerate(self.reverse_grams):
+            for g in grams:
+                postings[g].append(i)
+        self.reverse_postings = dict(postings)
+        self.reverse_max_len = min(max((len(k) for k in self.reverse_keys), default=1), REVERSE_MAX_SEGMENT_LEN)
+        print(f"[Lexicon] Reverse index: {len(self.reverse_keys)} Chinese segments.")
+
+    def reverse_lookup(self, text: str, limit: int = REVERSE_MAX_RESULTS) -> List[Tuple[str, float, str]]:
+        """
+        中文詞 → [(排灣語詞條, 分數, 來源), ...]，高分在前。
+        先查釋義片段；查不到時以字元 bigram 的 Jaccard 相似度找相近的片段（分數再乘上相似度）。
+        """
+        key = normalize_gloss(text)
+        hits = self.reverse_exact.get(key)
+        if hits:
+            return hits[:limit]
+
+        grams = char_ngrams(key)
+        overlaps: Counter = Counter()
+        for g in grams:
+            for i in self.reverse_postings.get(g, ()):
+                overlaps[i] += 1
+
+        scored: Dict[str, Tuple[float, str]] = {}
+        for i, overlap in overlaps.items():
+            similarity = overlap / (len(grams) + len(self.reverse_grams[i]) - overlap)
+            if similarity < REVERSE_MIN_SIMILARITY:
+                continue
+            for pw, score, src in self.reverse_exact[self.reverse_keys[i]]:
+                score *= similarity
+                if pw not in scored or score > scored[pw][0]:
+                    scored[pw] = (score, src)
+        ranked = sorted(((pw, sc, src) for pw, (sc, src) in scored.items()), key=lambda x: (-x[1], len(x[0])))
+        return ranked[:limit]
+
+    def segment_chinese(self, text: str) -> List[str]:
+        """
+        以反向索引做正向最長比對切詞，例如「我愛你」→ ["我", "愛", "你"]。
+        字典沒有的連續漢字合成一段；標點、空白與拉丁字母當作分隔；單獨出現的虛詞略過。
+        """
+        out: List[str] = []
+        for run in _CJK_RUN_RE.findall(normalize_gloss(text)):
+            i = 0
+            pending = ""
+            while i < len(run):
+                n = next(
+                    (n for n in range(min(self.reverse_max_len, len(run) - i), 0, -1)
+                     if run[i:i + n] in self.reverse_exact),
+                    0,
+                )
+                if n == 0 or (n == 1 and run[i] in ZH_PARTICLES):
+                    if run[i] not in ZH_PARTICLES:
+                        pending += run[i]
+                    elif pending:
+                        out.append(pending)
+                        pending = ""
+                    i += 1
+                    continue
+                if pending:
+                    out.append(pending)
+                    pending = ""
+                out.append(run[i:i + n])
+                i += n
+            if pending:
+                out.append(pending)
+        return out
+
+    def _exact_lookup(self, src: str, text: str) -> Optional[List[str]]:
+        """
+        先精確（含 normalized 精確）
+        """
+        d = self.dicts[src]
+        if text in d:
+            return d[text]
+
+        # normalized 精確
+        nk = normalize_token(text)
+        orig = self.norm_keys[src].get(nk)
+        if orig and orig in d:
+            return d[orig]
+        return None
+
+    def _fuzzy_candidates(self, src: str, text: str) -> List[Tuple[int, str, List[str]]]:
+        """
+        回傳 [(score, word, translations), ...]，已過濾/排序/截斷
+        """
+        from fuzzywuzzy import fuzz
+
+        d = self.dicts[src]
+        text_norm = normalize_token(text)
+        out = []
+
+        for word, translations in d.items():
+            word_norm = normalize_token(word)
+
+            # 先做長度保護，避免長/短詞誤配
+            if abs(len(text_norm) - len(word_norm)) > MAX_LEN_GAP:
+                continue
+
+            # partial_ratio 對黏連、分詞差異較穩定
+            score = fuzz.partial_ratio(text_norm, word_norm)
+            if score >= FUZZ_THRESHOLD:
+                out.append((score, word, translations))
+
+        # 高分在前，取前若干個
+        out.sort(key=lambda x: x[0], reverse=True)
+        return out[:MAX_CANDIDATES_PER_SRC]
+
+    def translate_from_source(self, src: str, text: str) -> List[str]:
+        # 精確命中直接回傳
+        exact = self._exact_lookup(src, text)
+        if exact:
+            return exact
+
+        # 模糊命中（合併同分候選的翻譯，並去重）
+        cands = self._fuzzy_candidates(src, text)
+        if not cands:
+            return []
+
+        best = cands[0][0]
+        merged: List[str] = []
+        seen = set()
+        for score, _w, zs in cands:
+            if score < best:  # 只合併同最高分群
+                break
+            for z in zs:
+                if z not in seen:
+                    merged.append(z)
+                    seen.add(z)
+        return merged
+
+    def translate(self, text: str, source: SourceEnum) -> Tuple[str, List[str]]:
+        """
+        回傳 (used_source, translations)
+        """
+        if source != SourceEnum.all:
+            translations = self.translate_from_source(source.value, text)
+            print( f"Translate from {source.value}: {text} -> {translations}" )
+            return (source.value, translations)
+
+        # all：依權重逐一嘗試，先看是否「任一來源精確命中」
+        # 再做加權合併（避免低品質來源蓋過高品質）
+        exact_pool: Dict[str, List[str]] = {}
+        for src in SOURCE_WEIGHTS:
+            exact = self._exact_lookup(src, text)
+            if exact:
+                exact_pool[src] = exact
+
+        if exact_pool:
+            # 有精確命中的話，依權重排序後合併（高權重在前）
+            merged: List[str] = []
+            seen = set()
+            for src in sorted(exact_pool.keys(), key=lambda s: SOURCE_WEIGHTS[s], reverse=True):
+                for z in exact_pool[src]:
+                    if z not in seen:
+                        merged.append(z)
+                        seen.add(z)
+            print( f"Translate from all(精確): {text} -> {merged}" )
+            return ("all(exact)", merged)
+
+        # 沒有精確命中 → 模糊命中加權合併（只合併各來源最高分群）
+        bucket = []
+        for src in SOURCE_WEIGHTS:
+            zs = self.translate_from_source(src, text)
+            if zs:
+                bucket.append((src, zs))
+
+        if not bucket:
+            print( f"Translate from all(none): {text} -> []" )
+            return ("all", [])
+
+        # 依權重把結果拼起來，避免低權重來源蓋掉高權重
+        merged: List[str] = []
+        seen = set()
+        for src, zs in sorted(bucket, key=lambda x: SOURCE_WEIGHTS[x[0]], reverse=True):
+            for z in zs:
+                if z not in seen:
+                    merged.append(z)
+                    seen.add(z)
+        print( f"Translate from all(fuzzy): {text} -> {merged}" )
+        return ("all(fuzzy)", merged)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 讓測試可以直接 import backend/ 底下的 modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
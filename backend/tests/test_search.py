@@ -0,0 +1,180 @@
+import asyncio
+
+import httpx
+import pytest
+
+from modules import html_extract
+from modules import passages
+from modules import search_backends
+from modules import search_cache
+from modules import search_test
+
+KB_DOCS = [
+    {"title": "五年祭", "text": "五年祭（Maljeveq）是排灣族最重要的祭典，每五年舉行一次，以刺球迎接祖靈。", "url": "kb:maljeveq"},
+    {"title": "小米收穫祭", "text": "收穫祭在小米收成後舉行，感謝祖靈與神靈的庇佑。", "url": "kb:harvest"},
+    {"title": "琉璃珠", "text": "琉璃珠是排灣族的傳家寶，每一種花紋都有各自的名稱與故事。", "url": "kb:beads"},
+]
+
+PAGE_HTML = (
+    "<html><head><title>排灣族</title><style>.x{}</style></head><body>"
+    "<nav>首頁 | 關於我們</nav>"
+    "<p>排灣族的五年祭以刺球儀式聞名。</p>"
+    "<script>var tracking = 1;</script>"
+    "<p>祭典期間族人迎接祖靈回到部落。</p>"
+    "</body></html>"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_search_cache(monkeypatch):
+    # 測試不讀寫 data/ 底下的 SQLite 快取
+    monkeypatch.setattr(search_cache, "SEARCH_CACHE_ENABLED", False)
+    monkeypatch.setattr(search_cache, "_conn", None)
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+# ========= LocalKBBackend =========
+
+def test_local_kb_ranks_matching_document_first():
+    kb = search_backends.LocalKBBackend(documents=KB_DOCS)
+    results = kb.query("五年祭 刺球", max_results=2)
+    assert results[0]["href"] == "kb:maljeveq"
+    assert results[0]["source"] == "local"
+    assert results[0]["content"] == KB_DOCS[0]["text"]
+    assert 0 < results[0]["coverage"] <= 1
+
+
+def test_local_kb_no_match_returns_empty():
+    kb = search_backends.LocalKBBackend(documents=KB_DOCS)
+    assert kb.query("basketball", max_results=3) == []
+
+
+def test_local_kb_loads_directory(tmp_path):
+    (tmp_path / "beads.md").write_text("# 琉璃珠\n琉璃珠是排灣族的傳家寶。", encoding="utf-8")
+    kb = search_backends.LocalKBBackend(str(tmp_path))
+    results = asyncio.run(kb.search("琉璃珠", max_results=1))
+    assert results[0]["title"] == "琉璃珠"
+    assert results[0]["href"] == "kb:beads.md"
+
+
+def test_hybrid_skips_web_when_local_hits():
+    class FailingWeb(search_backends.SearchBackend):
+        name = "web"
+
+        async def search(self, query, max_results):
+            raise AssertionError("web search should not be called")
+
+    hybrid = search_backends.HybridBackend(search_backends.LocalKBBackend(documents=KB_DOCS), FailingWeb())
+    results = asyncio.run(hybrid.search("琉璃珠 花紋", max_results=3))
+    assert results and all(r["source"] == "local" for r in results)
+
+
+def test_search_backend_is_abstract():
+    with pytest.raises(TypeError):
+        search_backends.SearchBackend()
+
+
+# ========= passages.select_passages =========
+
+def test_select_passages_prefers_relevant_text():
+    pages = [
+        "版權所有 請勿轉載。\n\n五年祭是排灣族每五年舉行一次的祭典，族人以刺球迎接祖靈。",
+        "今天天氣晴朗，適合出門散步。",
+    ]
+    chosen = passages.select_passages(pages, "五年祭 祖靈", token_budget=200)
+    assert list(chosen) == [0]
+    assert any("五年祭" in p for p in chosen[0])
+
+
+def test_select_passages_empty_pages():
+    assert passages.select_passages(["", "   "], "五年祭") == {}
+
+
+# ========= html_extract =========
+
+def test_stream_text_skips_script_and_nav():
+    async def run():
+        async with _mock_client(lambda request: httpx.Response(200, html=PAGE_HTML)) as client:
+            async with client.stream("GET", "https://example.com/") as resp:
+                assert html_extract.is_text_response(resp)
+                return await html_extract.stream_text(resp, max_bytes=1_000_000, max_chars=1000)
+
+    text = asyncio.run(run())
+    assert "刺球儀式" in text and "迎接祖靈" in text
+    assert "tracking" not in text
+    assert "關於我們" not in text
+
+
+def test_stream_text_respects_max_chars():
+    async def run():
+        async with _mock_client(lambda request: httpx.Response(200, html=PAGE_HTML)) as client:
+            async with client.stream("GET", "https://example.com/") as resp:
+                return await html_extract.stream_text(resp, max_bytes=1_000_000, max_chars=10)
+
+    assert len(asyncio.run(run())) <= 10
+
+
+def _stream_bytes(body: bytes, content_type: str) -> str:
+    async def run():
+        handler = lambda request: httpx.Response(200, content=body, headers={"Content-Type": content_type})
+        async with _mock_client(handler) as client:
+            async with client.stream("GET", "https://example.com/") as resp:
+                return await html_extract.stream_text(resp, max_bytes=1_000_000, max_chars=1000)
+
+    return asyncio.run(run())
+
+
+def test_stream_text_uses_meta_charset_big5():
+    page = '<html><head><meta charset="big5"><title>部落</title></head><body><p>排灣族的五年祭</p></body></html>'
+    # 超過 sniff 長度，確認分段解碼也正確
+    page = page.replace("</body>", "<p>" + "祖靈" * 2000 + "</p></body>")
+    text = _stream_bytes(page.encode("big5"), "text/html")
+    assert "排灣族的五年祭" in text
+    assert "部落" in text
+
+
+def test_stream_text_uses_http_equiv_gbk():
+    page = '<meta http-equiv="Content-Type" content="text/html; charset=gb2312"><p>排湾族的五年祭</p>'
+    assert _stream_bytes(page.encode("gbk"), "text/html") == "排湾族的五年祭"
+
+
+def test_stream_text_header_charset_wins():
+    page = '<meta charset="utf-8"><p>琉璃珠</p>'
+    assert _stream_bytes(page.encode("big5"), "text/html; charset=big5") == "琉璃珠"
+
+
+# ========= search_test.fetch_pages =========
+
+def test_fetch_pages_keeps_order_and_handles_failures():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if request.url.path == "/image":
+            return httpx.Response(200, content=b"\x89PNG", headers={"Content-Type": "image/png"})
+        return httpx.Response(200, html=f"<p>page {request.url.path}</p>")
+
+    urls = ["https://a.example/one", "https://b.example/missing", "https://a.example/image", "https://c.example/two"]
+
+    async def run():
+        async with _mock_client(handler) as client:
+            return await search_test.fetch_pages(urls, time_limit=5.0, http_client=client)
+
+    assert asyncio.run(run()) == ["page /one", "", "", "page /two"]
+
+
+def test_fetch_pages_drops_pages_past_time_limit():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/slow":
+            await asyncio.sleep(5)
+        return httpx.Response(200, html="<p>fast</p>")
+
+    async def run():
+        async with _mock_client(handler) as client:
+            return await search_test.fetch_pages(
+                ["https://a.example/fast", "https://a.example/slow"], time_limit=0.3, http_client=client
+            )
+
+    assert asyncio.run(run()) == ["fast", ""]
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules import chat
+from modules import history
+from modules import sessions
+
+
+class FakeSummarizer:
+    """只回應摘要請求的假 client，記錄每次被要求摘要的內容。"""
+
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs["messages"][-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"摘要{len(self.requests)}"))])
+
+
+@pytest.fixture
+def small_session(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX_MESSAGES", 8)
+    monkeypatch.setattr(history, "CHAT_HISTORY_TOKEN_BUDGET", 40)
+    monkeypatch.setattr(history, "_summary_cache", history.OrderedDict())
+    return sessions.Session()
+
+
+def _turn(session: sessions.Session, client: FakeSummarizer, i: int):
+    session.append("user", f"第 {i} 個問題，關於排灣語的 kakan 怎麼用")
+    with sessions.use(session):
+        asyncio.run(chat.build_messages(client, "mock", chat.SYSTEM_PROMPT, session.messages[:]))
+    session.append("assistant", f"第 {i} 個回答，kakan 是吃的意思")
+
+
+def test_trimming_keeps_derived_history_aligned(small_session):
+    client = FakeSummarizer()
+    for i in range(10):
+        _turn(small_session, client, i)
+    assert len(small_session.messages) == sessions.SESSION_MAX_MESSAGES
+    # 新的 user 訊息還沒處理，衍生快取比 messages 少一則
+    small_session.append("user", "最後一題")
+    wrapped = small_session.derived["chat_wrapped"]
+    assert wrapped == chat.wrap_history(small_session.messages[:len(wrapped)])
+    assert len(small_session.derived["chat_prefix_hashes"]) == len(wrapped)
+
+
+def test_full_session_reuses_summary_cache(small_session):
+    client = FakeSummarizer()
+    for i in range(10):
+        _turn(small_session, client, i)
+    assert len(small_session.messages) == sessions.SESSION_MAX_MESSAGES
+
+    before = len(client.requests)
+    _turn(small_session, client, 10)
+    new_requests = client.requests[before:]
+    # 已滿的 session 再多一輪：只摘要新擠出的訊息，並沿用上一版摘要
+    assert len(new_requests) <= 1
+    for request in new_requests:
+        assert request.startswith("先前摘要：")
+        assert request.count("使用者：") + request.count("助理：") <= 2
+
+    # 同一份歷史再組一次 messages（例如分類與回答各組一次）完全不呼叫 LLM
+    small_session.append("user", "再問一次")
+    with sessions.use(small_session):
+        asyncio.run(chat.build_messages(client, "mock", chat.SYSTEM_PROMPT, small_session.messages[:]))
+        count = len(client.requests)
+        asyncio.run(chat.build_messages(client, "mock", chat.SYSTEM_PROMPT, small_session.messages[:]))
+    assert len(client.requests) == count
+
+
+def test_pop_drops_derived_tail(small_session):
+    client = FakeSummarizer()
+    _turn(small_session, client, 0)
+    small_session.append("user", "失敗的一輪")
+    with sessions.use(small_session):
+        asyncio.run(chat.build_messages(client, "mock", chat.SYSTEM_PROMPT, small_session.messages[:]))
+    small_session.pop()
+    assert len(small_session.derived["chat_wrapped"]) == len(small_session.messages)
+    assert len(small_session.derived["chat_prefix_hashes"]) == len(small_session.messages)
@@ -1,18 +1,31 @@
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import re
 import json
 import os
-from typing import List, Dict
+import time
+from typing import AsyncGenerator, List
 
 # 引入同目錄下的字典工具
-from paiwan_translation_api_multi import MultiSourceTranslator, SOURCE_FILES, SourceEnum
+from paiwan_lexicon import MultiSourceTranslator, SOURCE_FILES, SourceEnum
+from modules.dual_client import DualClient
 
 app = FastAPI()
 
 # 全域變數：翻譯器實例
 translator = None
 
+# 與 main.py 相同的 backend 設定；DualClient 底下共用 http_pool 的連線池
+VLLM_BASE_URL = os.getenv("VLLM_BASE_URL", "http://210.61.209.139:45014/v1/")
+VLLM_BASE_URL_2 = os.getenv("VLLM_BASE_URL_2", "http://210.61.209.139:45005/v1/")
+VLLM_API_KEY = os.getenv("VLLM_API_KEY", "dummy-key")
+
+llm_client = DualClient(
+    vllm_base_urls=[VLLM_BASE_URL, VLLM_BASE_URL_2],
+    vllm_api_key=VLLM_API_KEY,
+)
+
 @app.on_event("startup")
 async def startup_event():
     global translator
@@ -110,72 +123,89 @@ def build_llm_prompt(paiwan_text: str, formatted_text: str) -> str:
 """.strip()
 
 
-async def call_llm(prompt: str) -> str:
+async def stream_llm(prompt: str) -> AsyncGenerator[str, None]:
     """
-    呼叫 LLM 進行句子重組
-    改用 AsyncOpenAI + Stream 模式，提高穩定性。
+    呼叫 LLM 進行句子重組，逐段產生輸出。
+    與 main.py 相同走 DualClient 的 failover（vLLM 依序嘗試，最後 OpenAI），模型名稱使用快取。
     """
-    import os
-    import time
-    from openai import AsyncOpenAI
+    model_name = await llm_client.models.default_id()
+    print(f"[LLM] Using model: {model_name} (Stream mode)")
+    pieces = llm_client.chat.completions.stream(
+        model=model_name,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.7,
+        max_tokens=1024,
+    )
+    try:
+        async for piece in pieces:
+            yield piece
+    finally:
+        await pieces.aclose()
 
-    # 檢查 VLLM (Hackathon 環境)
-    vllm_base_url = os.getenv("VLLM_BASE_URL", "http://210.61.209.139:45014/v1/")
-    vllm_api_key = os.getenv("VLLM_API_KEY", "dummy-key")
-    
-    print(f"[LLM] Connecting to {vllm_base_url} (Async)...")
 
+async def call_llm(prompt: str) -> str:
+    """
+    呼叫 LLM 進行句子重組，回傳完整輸出（給不需要串流的 /chat 使用）。
+    """
+    start_time = time.time()
     try:
-        client = AsyncOpenAI(base_url=vllm_base_url, api_key=vllm_api_key)
-        
-        # 動態取得模型名稱
-        print("[LLM] Fetching model list...")
-        start_time = time.time()
-        models = await client.models.list()
-        if not models.data:
-            print("[LLM] Error: No models found.")
-            return "<ans>VLLM 錯誤: 無可用模型</ans>"
-        model_name = models.data[0].id
-        print(f"[LLM] Using model: {model_name} (took {time.time() - start_time:.2f}s)")
-        
-        print("[LLM] Sending completion request (Stream mode)...")
-        start_time = time.time()
-        
-        response = await client.chat.completions.create(
-            model=model_name,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024,
-            stream=True  # 開啟串流模式
-        )
-        
-        collected_content = []
-        async for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                collected_content.append(content)
-                # 簡單的防呆：如果發現連續驚嘆號，可以提早斷開 (選擇性實作，這裡先不加)
-        
-        full_content = "".join(collected_content)
+        full_content = "".join([piece async for piece in stream_llm(prompt)])
         print(f"[LLM] Response received (took {time.time() - start_time:.2f}s)")
         print(f"[LLM] Raw output length: {len(full_content)}")
         print(f"[LLM] Raw output preview: {full_content[:200]}...")
-        
         return full_content
-
     except Exception as e:
         print(f"[LLM] Call Error: {e}")
-
-    # 如果失敗，回傳一個模擬結果
-    print("Warning: No working LLM found. Using mock response.")
-    return f"""
+        # 如果失敗，回傳一個模擬結果
+        print("Warning: No working LLM found. Using mock response.")
+        return f"""
 <ans>
 (LLM 連線失敗或發生錯誤)
-錯誤訊息: {e if 'e' in locals() else 'Unknown'}
+錯誤訊息: {e}
 </ans>
 """
 
 
+async def stream_final_answer(pieces: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    從 LLM 的串流輸出中，<ans> 一出現就開始逐段送出其中的內容，讀到 </ans> 就停止生成。
+    整段輸出都沒有 <ans> 時，結束後改用 extract_final_answer 的規則一次送出。
+    """
+    open_tag, close_tag = "<ans>", "</ans>"
+    buffer = ""
+    inside = False
+    emitted = False
+    try:
+        async for piece in pieces:
+            buffer += piece
+            if not inside:
+                idx = buffer.find(open_tag)
+                if idx < 0:
+                    continue
+                inside = True
+                buffer = buffer[idx + len(open_tag):]
+            if not emitted:
+                buffer = buffer.lstrip()
+            idx = buffer.find(close_tag)
+            if idx >= 0:
+                buffer = buffer[:idx]
+                break
+            # 結尾可能是被切開的 </ans>，先留著等下一段
+            keep = len(close_tag) - 1
+            out, buffer = buffer[:-keep], buffer[-keep:]
+            if out:
+                emitted = True
+                yield out
+    finally:
+        await pieces.aclose()
+
+    if not inside:
+        if buffer:
+            yield extract_final_answer(buffer)
+    elif buffer.rstrip():
+        yield buffer.rstrip()
+
+
 def extract_final_answer(raw: str) -> str:
     """
     從 LLM 的輸出裡抓 <ans>...</ans> 內容
@@ -227,3 +257,37 @@ async def chat(req: ChatRequest):
         formattedText=formatted_text,
         finalAnswer=final_answer,
     )
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    與 /chat 相同的流程，但以 SSE 回傳：
+    event: mapping（詞彙對照，LLM 開始前就送出）→ 多個 event: delta（<ans> 內的譯文片段）→ event: done（完整譯文）；
+    LLM 全部失敗時送出 event: error。
+    """
+    paiwan_text = req.chatInput
+    formatted_text = format_mapping_text(build_mapping_list(split_tokens(paiwan_text)))
+    prompt = build_llm_prompt(paiwan_text, formatted_text)
+
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        yield sse("mapping", {"paiwanText": paiwan_text, "formattedText": formatted_text})
+        parts = []
+        try:
+            async for text in stream_final_answer(stream_llm(prompt)):
+                parts.append(text)
+                yield sse("delta", {"text": text})
+        except Exception as e:
+            print(f"[LLM] Stream Error: {e}")
+            yield sse("error", {"detail": str(e) or type(e).__name__})
+            return
+        yield sse("done", {"finalAnswer": "".join(parts)})
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
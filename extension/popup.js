@@ -53,6 +53,27 @@ async function doTranslate(text) {
 
   try {
     const modelMode = (modelModeEl && modelModeEl.value) || "default";
+
+    // 多行輸入：一次送到批次 API，逐行對照顯示
+    const lines = t.split(/\n+/).map((line) => line.trim()).filter(Boolean);
+    if (lines.length > 1) {
+      const res = await fetch(`${API_BASE}/api/translate_batch`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ texts: lines, direction: "paiwan2zh", model_mode: modelMode }),
+      });
+      const data = await res.json();
+      const results = (data && data.results) || [];
+      resultEl.textContent = results
+        .map((r) => `${r.text}\n→ ${r.translation || "(沒有取得翻譯結果)"}`)
+        .join("\n\n");
+      thinkingEl.textContent = results
+        .map((r) => r.thinking || "")
+        .filter(Boolean)
+        .join("\n---\n");
+      return;
+    }
+
     const res = await fetch(`${API_BASE}/api/translate_simple`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
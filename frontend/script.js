@@ -1,6 +1,9 @@
 // 指向 n8n「Production URL」，不用按 listen 就能收；若要改回本機可設為 http://localhost:8000/chat
 //const backendUrl = "https://a38ea8040ab2.ngrok-free.app/webhook/paiwan-chat";
 const backendUrl = "http://localhost:8000/chat";
+// 非同步工作模式：送出後立刻拿到 job id，再以 SSE 訂閱進度（搜尋類的請求常超過 10 秒）
+const jobsUrl = `${backendUrl}/jobs`;
+const useJobs = true;
 
 const messagesEl = document.getElementById("messages");
 const inputEl = document.getElementById("user-input");
@@ -11,6 +14,10 @@ const modelLabelEl = modelSelectorEl?.querySelector(".model-label");
 const modelOptionEls = document.querySelectorAll(".model-option");
 
 let conversationHistory = [];
+// session 模式：歷史留在伺服器，每輪只送 session_id + 新訊息；
+// conversationHistory 仍保留在本地，session 過期（410）時用來重建
+const useSessions = true;
+let sessionId = null;
 let modelMode = "default"; // "default" | "vllm_only" | "openai_only"
 
 function closeThinkingModal() {
@@ -87,6 +94,104 @@ function appendMessage({ text, type, thinking }) {
   return div;
 }
 
+const stageLabels = {
+  started: "處理中",
+  classified: "已判斷意圖",
+  searched: "已搜尋",
+  fetched: "已讀取網頁",
+  page_summarized: "已摘要網頁",
+  summarizing: "整理重點中",
+};
+
+function describeProgress(entry) {
+  const label = stageLabels[entry.stage] || entry.stage;
+  return entry.detail ? `${label}：${entry.detail}` : label;
+}
+
+// 以 SSE 等待工作完成，每個進度都更新到 onProgress；瀏覽器不支援 EventSource 時改為輪詢
+function waitForJob(job, onProgress) {
+  const statusUrl = new URL(job.status_url, jobsUrl).toString();
+  const eventsUrl = new URL(job.events_url, jobsUrl).toString();
+
+  if (!window.EventSource) {
+    return pollJob(statusUrl, onProgress);
+  }
+
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(eventsUrl);
+    source.addEventListener("progress", (e) => onProgress(JSON.parse(e.data)));
+    source.addEventListener("result", (e) => {
+      source.close();
+      resolve(JSON.parse(e.data));
+    });
+    source.addEventListener("error", (e) => {
+      source.close();
+      if (e.data) {
+        reject(new Error(JSON.parse(e.data).detail));
+      } else {
+        // 連線中斷：改用輪詢取回結果
+        pollJob(statusUrl, onProgress).then(resolve, reject);
+      }
+    });
+  });
+}
+
+async function pollJob(statusUrl, onProgress) {
+  let seen = 0;
+  for (;;) {
+    const resp = await fetch(statusUrl);
+    if (!resp.ok) throw new Error(`錯誤：${resp.status}`);
+    const job = await resp.json();
+    job.progress.slice(seen).forEach(onProgress);
+    seen = job.progress.length;
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "工作失敗");
+    await new Promise((r) => setTimeout(r, 1000));
+  }
+}
+
+function buildPayload(text) {
+  if (!useSessions) {
+    return { messages: conversationHistory, model_mode: modelMode };
+  }
+  if (sessionId) {
+    return { session_id: sessionId, message: text, model_mode: modelMode };
+  }
+  // 第一輪或 session 過期：以本地歷史（不含這一則）建立新的 session
+  return { messages: conversationHistory.slice(0, -1), message: text, model_mode: modelMode };
+}
+
+async function requestReply(text, thinkingBubble) {
+  const post = () =>
+    fetch(useJobs ? jobsUrl : backendUrl, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(buildPayload(text)),
+    });
+
+  let resp = await post();
+  if (resp.status === 410 && sessionId) {
+    sessionId = null;
+    resp = await post();
+  }
+
+  if (!resp.ok) {
+    const errorText = await resp.text();
+    console.error("Server error:", errorText);
+    throw new Error(`錯誤：${resp.status}`);
+  }
+
+  const data = await resp.json();
+  if (!useJobs) return data;
+
+  const textBlock = thinkingBubble.querySelector(".message-text");
+  return waitForJob(data, (entry) => {
+    textBlock.textContent = `思考中...（${describeProgress(entry)}）`;
+  });
+}
+
 async function sendMessage() {
   const text = inputEl.value.trim();
   if (!text) return;
@@ -104,26 +209,17 @@ async function sendMessage() {
   const thinkingBubble = appendMessage({ text: "思考中...", type: "bot" });
 
   try {
-    const resp = await fetch(backendUrl, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        messages: conversationHistory,
-        model_mode: modelMode,
-      }),
-    });
-
-    if (!resp.ok) {
-      const errorText = await resp.text();
-      console.error("Server error:", errorText);
-      thinkingBubble.textContent = `錯誤：${resp.status}`;
+    let data;
+    try {
+      data = await requestReply(text, thinkingBubble);
+    } catch (err) {
+      console.error(err);
+      thinkingBubble.textContent = err.message.startsWith("錯誤") ? err.message : "呼叫後端失敗，請稍後再試。";
       return;
     }
 
-    const data = await resp.json();
     const finalText = data.reply || "(空回覆)";
+    if (data.session_id) sessionId = data.session_id;
 
     // Add assistant response to history
     conversationHistory.push({ role: "assistant", content: finalText });